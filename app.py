@@ -1,12 +1,36 @@
 """
 MBTA Finder - Flask Web Application
 """
+import hashlib
+import json
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from datetime import datetime
-import requests
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import flask
+from flask import Flask, request, redirect, url_for, session, jsonify, stream_with_context
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+import http_client
+import metrics
+from arrival_stream import ArrivalBroadcaster
+from autocomplete import DEFAULT_LIMIT as AUTOCOMPLETE_LIMIT, get_autocomplete_index
+from batch_search import BatchSearcher, iter_ndjson_queries, query_text
+from cache import TTLCache, get_geocode_cache, get_upstream_cache, make_cache, normalize_query
+import jsonapi
+from distance import distances_from, haversine_miles
+from gazetteer import get_gazetteer
+from gtfs_store import AGENCY_TZ, get_gtfs_store
+from journey_planner import MAX_ACCESS_MILES, get_journey_planner
+from mbta_helper import get_station_arrivals
+from prediction_stream import get_prediction_store, start_prediction_stream
+from prefetch import FAVORITE_WEIGHT, SEARCH_WEIGHT, VIEW_WEIGHT, get_arrival_prefetcher
+from session_store import get_session_store
+from station_catalog import get_station_catalog
+from station_index import get_station_index
+from station_raster import get_station_raster
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -19,7 +43,26 @@ MAPBOX_ACCESS_TOKEN = os.getenv("MAPBOX_ACCESS_TOKEN")
 MBTA_API_KEY = os.getenv("MBTA_API_KEY")
 
 # Constants
-MAX_RECENT_SEARCHES = 5
+MAX_RECENT_SEARCHES = int(os.getenv("MAX_RECENT_SEARCHES", "5"))
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "8"))  # seconds per /find_station request
+ARRIVALS_CACHE_TTL = float(os.getenv("ARRIVALS_CACHE_TTL", "15"))  # seconds
+MAX_STREAM_SUBSCRIBERS = int(os.getenv("MAX_STREAM_SUBSCRIBERS", "1000"))
+STREAM_HEARTBEAT = 15  # seconds between keep-alive comments on idle streams
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # geocoding requests in flight per batch
+PREDICTIONS_FRESH_TTL = 10  # seconds before cached predictions are refreshed
+PREDICTIONS_MAX_STALE = float(os.getenv("PREDICTIONS_MAX_STALE", "300"))  # seconds stale predictions may be shown
+ROUTES_FRESH_TTL = 24 * 3600
+ROUTES_MAX_STALE = 7 * 24 * 3600
+BOARD_STOPS_PER_REQUEST = 40  # stop IDs per bulk predictions request, keeps URLs well under 2 KB
+BOARD_ARRIVALS_PER_STATION = 3
+
+def _remaining(deadline: float) -> float:
+    """Seconds left until a time.monotonic() deadline, for http_client calls (None without one)."""
+    if deadline is None:
+        return None
+    # http_client treats a falsy deadline as "use the default", so never pass 0
+    return max(0.001, deadline - time.monotonic())
+
 
 # --- MBTA Station Finder Class ---
 class MBTAStationFinder:
@@ -30,60 +73,128 @@ class MBTAStationFinder:
     stations, calculating distances, and retrieving route information.
     """
     
-    def __init__(self, mapbox_token: str, mbta_key: str = None):
+    def __init__(self, mapbox_token: str, mbta_key: str = None, station_index=None,
+                 geocode_cache=None, prediction_store=None, gtfs_store=None,
+                 upstream_cache=None, gazetteer=None, journey_planner=None, max_workers: int = 16):
         """
         Initialize an MBTAStationFinder instance with API credentials.
         
         Args:
             mapbox_token: Authentication token for Mapbox API
             mbta_key: Optional authentication key for MBTA API
+            station_index: Optional StationIndex used to rank stops locally
+            geocode_cache: Optional TTLCache of previous geocoding results
+            prediction_store: Optional PredictionStore fed by the MBTA event stream
+            gtfs_store: Optional GTFSStore answering route and schedule lookups locally
+            upstream_cache: Optional TTLCache of last good MBTA responses, served
+                            stale while MBTA is slow or failing
+            gazetteer: Optional Gazetteer resolving well-known places before Mapbox is asked
+            journey_planner: Optional JourneyPlanner for trips between two places
+            max_workers: Size of the thread pool used to run independent MBTA calls concurrently
         """
         self.mapbox_token = mapbox_token
         self.mbta_key = mbta_key
+        self.station_index = station_index
+        self.geocode_cache = geocode_cache
+        self.prediction_store = prediction_store
+        self.gtfs_store = gtfs_store
+        self.gazetteer = gazetteer
+        self.journey_planner = journey_planner
+        self.upstream_cache = upstream_cache if upstream_cache is not None else TTLCache(
+            maxsize=1024, ttl=60, name="upstream")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mbta")
 
-    def geocode_location(self, location_query: str) -> dict:
+    @metrics.timed("geocode_location")
+    def geocode_location(self, location_query: str, deadline: float = None) -> dict:
         """
-        Convert a location string to geographic coordinates using Mapbox.
+        Convert a location string to geographic coordinates, using the local
+        gazetteer when it knows the place and Mapbox otherwise.
         
         Args:
             location_query: A string containing an address, landmark, or place name
+            deadline: Optional time.monotonic() value by which Mapbox must have answered
             
         Returns:
             dict: A dictionary containing longitude, latitude, and formatted address
                  or None if the location could not be geocoded
         """
-        url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{location_query}.json"
-        params = {"access_token": self.mapbox_token, "limit": 1, "country": "US"}
+        if self.gazetteer is not None:
+            local = self.gazetteer.lookup(location_query)
+            if local is not None:
+                return local
+
+        cache_key = normalize_query(location_query)
+        if self.geocode_cache is not None:
+            cached = self.geocode_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached)
+
+        url, params = self._geocode_request(location_query)
         try:
-            response = requests.get(url, params=params)
+            response = http_client.get(url, params=params, deadline=_remaining(deadline))
             response.raise_for_status()
-            data = response.json()
-            if data["features"]:
-                feature = data["features"][0]
-                coords = feature["geometry"]["coordinates"]
-                return {
-                    "longitude": coords[0],
-                    "latitude": coords[1],
-                    "address": feature["place_name"]
-                }
-            return None
+            location = self._parse_geocode(response.json())
+            if location is not None and self.geocode_cache is not None:
+                self.geocode_cache.set(cache_key, location)
+            return location
         except Exception as e:
             print(f"Geocoding error: {e}")
             return None
 
-    def find_nearest_station(self, latitude: float, longitude: float) -> dict:
+    def _geocode_request(self, location_query: str) -> tuple:
+        """Mapbox forward geocoding (url, params) for a query."""
+        url = f"{http_client.MAPBOX_API_URL}/geocoding/v5/mapbox.places/{location_query}.json"
+        return url, {"access_token": self.mapbox_token, "limit": 1, "country": "US"}
+
+    def _parse_geocode(self, data: dict) -> dict:
+        """Location dictionary from a Mapbox geocoding response, or None if nothing matched."""
+        if not data["features"]:
+            return None
+        feature = data["features"][0]
+        coords = feature["geometry"]["coordinates"]
+        return {
+            "longitude": coords[0],
+            "latitude": coords[1],
+            "address": feature["place_name"]
+        }
+
+    @metrics.timed("find_nearest_station")
+    def find_nearest_station(self, latitude: float, longitude: float,
+                             include_routes: bool = True, deadline: float = None) -> dict:
         """
         Find the nearest MBTA station to the given coordinates.
         
         Args:
             latitude: The latitude coordinate
             longitude: The longitude coordinate
+            include_routes: Whether to look up the station's routes when they are
+                            not already known locally (one extra MBTA call)
+            deadline: Optional time.monotonic() value by which MBTA must have answered
+                      (only used while the station index is not loaded)
             
         Returns:
             dict: Information about the nearest station including name, coordinates, and routes
                  None if no station could be found
         """
-        url = "https://api-v3.mbta.com/stops"
+        if self.station_index is not None and self.station_index.covers((0, 1)):
+            nearest = self.station_index.nearest(latitude, longitude, k=1, route_types=(0, 1))
+            if nearest:
+                station = nearest[0]
+                return {
+                    "name": station["name"],
+                    "latitude": station["latitude"],
+                    "longitude": station["longitude"],
+                    "description": station["description"],
+                    "routes": [{
+                        "id": r["id"],
+                        "name": r["long_name"],
+                        "color": r["color"]
+                    } for r in station["routes"]],
+                    "id": station["id"]
+                }
+
+        # Index not loaded yet - fall back to ranking on the MBTA side
+        url = f"{http_client.MBTA_API_URL}/stops"
         params = {
             "filter[route_type]": "0,1",
             "sort": "distance",
@@ -93,7 +204,7 @@ class MBTAStationFinder:
         if self.mbta_key:
             params["api_key"] = self.mbta_key
         try:
-            response = requests.get(url, params=params)
+            response = http_client.get(url, params=params, deadline=_remaining(deadline))
             response.raise_for_status()
             data = response.json()
             if data["data"]:
@@ -103,7 +214,7 @@ class MBTAStationFinder:
                     "latitude": station["attributes"]["latitude"],
                     "longitude": station["attributes"]["longitude"],
                     "description": station["attributes"].get("description", ""),
-                    "routes": self._get_station_routes(station["id"]),
+                    "routes": self._get_station_routes(station["id"]) if include_routes else [],
                     "id": station["id"]
                 }
             return None
@@ -111,6 +222,7 @@ class MBTAStationFinder:
             print(f"MBTA API error: {e}")
             return None
 
+    @metrics.timed("station_routes")
     def _get_station_routes(self, station_id: str) -> list:
         """
         Get routes that serve a particular station.
@@ -121,23 +233,48 @@ class MBTAStationFinder:
         Returns:
             list: Routes serving this station, with ID, name, and color
         """
-        url = "https://api-v3.mbta.com/routes"
-        params = {"filter[stop]": station_id}
-        if self.mbta_key:
-            params["api_key"] = self.mbta_key
-        try:
-            response = requests.get(url, params=params)
+        # Route membership is static, so prefer the local GTFS store
+        if self.gtfs_store is not None:
+            routes = self.gtfs_store.routes_at_stop(station_id)
+            if routes:
+                return [{
+                    "id": r["id"],
+                    "name": r["long_name"],
+                    "color": r["color"]
+                } for r in routes]
+
+        url, params = self._routes_request(station_id)
+
+        def fetch():
+            response = http_client.get(url, params=params)
             response.raise_for_status()
-            data = response.json()
-            return [{
-                "id": r["id"],
-                "name": r["attributes"]["long_name"],
-                "color": r["attributes"]["color"]
-            } for r in data["data"]]
+            return self._parse_routes(response.json())
+
+        try:
+            # Routes rarely change, so a day-old answer is fine while MBTA is unavailable
+            routes, _ = self.upstream_cache.get_or_revalidate(
+                f"routes:{station_id}", fetch, ttl=ROUTES_FRESH_TTL, max_stale=ROUTES_MAX_STALE)
+            return routes
         except Exception as e:
             print(f"Error getting routes: {e}")
             return []
+
+    def _routes_request(self, station_id: str) -> tuple:
+        """MBTA /routes (url, params) for the routes serving a station."""
+        params = {"filter[stop]": station_id}
+        if self.mbta_key:
+            params["api_key"] = self.mbta_key
+        return f"{http_client.MBTA_API_URL}/routes", params
+
+    def _parse_routes(self, payload: dict) -> list:
+        """Route dictionaries (id, name, color) from an MBTA /routes response."""
+        return [{
+            "id": r["id"],
+            "name": r["attributes"]["long_name"],
+            "color": r["attributes"]["color"]
+        } for r in payload["data"]]
     
+    @metrics.timed("get_arrival_predictions")
     def get_arrival_predictions(self, station_id: str, limit: int = 5) -> list:
         """
         Get real-time arrival predictions for a specific station.
@@ -149,59 +286,290 @@ class MBTAStationFinder:
         Returns:
             list: Upcoming arrivals with time, destination, and status
         """
-        url = "https://api-v3.mbta.com/predictions"
+        # Served from memory when the streaming ingester is running
+        if self.prediction_store is not None and self.prediction_store.ready:
+            # The stream may not have reported this station yet - show the timetable meanwhile
+            return (self._stored_predictions(station_id, limit)
+                    or self.get_scheduled_departures(station_id, limit))
+
+        url, params = self._predictions_request(station_id, limit)
+
+        def fetch():
+            response = http_client.get(url, params=params)
+            response.raise_for_status()
+            return self._parse_predictions(response.json())
+            
+        try:
+            # Last good predictions are served (flagged stale) while a refresh runs
+            predictions, stale = self.upstream_cache.get_or_revalidate(
+                self._predictions_key(station_id, limit), fetch,
+                ttl=PREDICTIONS_FRESH_TTL, max_stale=PREDICTIONS_MAX_STALE)
+        except Exception as e:
+            print(f"Error getting predictions: {e}")
+            return []
+        if stale:
+            predictions = [dict(p, stale=True) for p in predictions]
+        
+        # No real-time data (e.g. late at night) - show the timetable instead
+        if not predictions:
+            predictions = self.get_scheduled_departures(station_id, limit)
+        
+        return predictions
+    
+    def _stored_predictions(self, station_id: str, limit: int) -> list:
+        """Arrivals for a station from the streaming prediction store, shaped like _parse_predictions."""
+        return [{
+            "route_name": p["route"].get("long_name", "Unknown"),
+            "route_color": p["route"].get("color", "gray"),
+            "arrival_time": self._format_arrival_time(p["arrival_time"])
+        } for p in self.prediction_store.arrivals(station_id)[:limit]]
+
+    def _predictions_request(self, station_id: str, limit: int) -> tuple:
+        """MBTA /predictions (url, params) for a station's next arrivals."""
         params = {
             "filter[stop]": station_id,
             "sort": "arrival_time",
             "include": "route",
             "page[limit]": limit
         }
-        
         if self.mbta_key:
             params["api_key"] = self.mbta_key
+        return f"{http_client.MBTA_API_URL}/predictions", params
+
+    def _parse_predictions(self, payload: dict) -> list:
+        """Arrival dictionaries (route_name, route_color, arrival_time) from an MBTA /predictions response."""
+        document = jsonapi.Document(payload)
+        predictions = []
+        for prediction in document.data:
+            # Find route info in included data
+            route_name = "Unknown"
+            route_color = "gray"
+            route = document.related(prediction, "route")
+            if route is not None:
+                route_name = route.attributes.get("long_name", "Unknown")
+                route_color = route.attributes.get("color", "gray")
             
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+            predictions.append({
+                "route_name": route_name,
+                "route_color": route_color,
+                "arrival_time": self._format_arrival_time(prediction.attributes.get("arrival_time"))
+            })
+        return predictions
+
+    def _predictions_key(self, station_id: str, limit: int) -> str:
+        """Upstream cache key of get_arrival_predictions results."""
+        return f"predictions:{station_id}:{limit}"
+
+    def cached_arrival_predictions(self, station_id: str, limit: int = 5) -> list:
+        """
+        Get a station's arrival predictions only if they are already in memory.
+        
+        Never calls MBTA, so pages can show arrivals for stations kept warm by
+        the prefetcher without waiting on anything.
+        
+        Args:
+            station_id: The MBTA station ID
+            limit: Maximum number of predictions to return
             
-            predictions = []
-            for prediction in data.get("data", []):
-                # Extract prediction details
-                arrival_time = prediction.get("attributes", {}).get("arrival_time")
-                route_id = prediction.get("relationships", {}).get("route", {}).get("data", {}).get("id")
-                
-                # Find route info in included data
-                route_name = "Unknown"
-                route_color = "gray"
-                for included in data.get("included", []):
-                    if included.get("type") == "route" and included.get("id") == route_id:
-                        route_name = included.get("attributes", {}).get("long_name", "Unknown")
-                        route_color = included.get("attributes", {}).get("color", "gray")
-                        break
-                
-                # Format arrival time
-                arrival_display = "Scheduled"
-                if arrival_time:
-                    try:
-                        arrival_dt = datetime.fromisoformat(arrival_time.replace("Z", "+00:00"))
-                        # Convert to local timezone and format
-                        arrival_local = arrival_dt.astimezone()
-                        arrival_display = arrival_local.strftime("%I:%M %p")
-                    except Exception as e:
-                        print(f"Error parsing time: {e}")
-                
-                predictions.append({
-                    "route_name": route_name,
-                    "route_color": route_color,
-                    "arrival_time": arrival_display
-                })
+        Returns:
+            list: Arrivals as returned by get_arrival_predictions, or None if not cached
+        """
+        if self.prediction_store is not None and self.prediction_store.ready:
+            return self.get_arrival_predictions(station_id, limit)
+        cached = self.upstream_cache.get_revalidated(self._predictions_key(station_id, 5))
+        if cached is None:
+            return None
+        predictions, stale = cached
+        return [dict(p, stale=True) for p in predictions[:limit]] if stale else predictions[:limit]
+
+    def prefetch_arrival_predictions(self, station_ids: list, limit: int = 5) -> int:
+        """
+        Refresh the cached arrival predictions of several stations in bulk.
+        
+        Results are stored where get_arrival_predictions looks for them, so
+        the next result page for these stations is rendered from memory.
+        
+        Args:
+            station_ids: MBTA station IDs
+            limit: Predictions kept per station (matching get_arrival_predictions)
             
-            return predictions
+        Returns:
+            int: Number of stations whose predictions were refreshed
+        """
+        if self.prediction_store is not None and self.prediction_store.ready:
+            return 0  # Already live in memory
+        fetched = self._fetch_predictions_bulk(station_ids, limit, BOARD_STOPS_PER_REQUEST)
+        for station_id, predictions in fetched.items():
+            self.upstream_cache.set_revalidated(self._predictions_key(station_id, limit), predictions,
+                                                ttl=PREDICTIONS_FRESH_TTL, max_stale=PREDICTIONS_MAX_STALE)
+        return len(fetched)
+
+    @metrics.timed("get_arrival_predictions_bulk")
+    def get_arrival_predictions_bulk(self, station_ids: list, limit: int = BOARD_ARRIVALS_PER_STATION,
+                                     chunk_size: int = BOARD_STOPS_PER_REQUEST) -> dict:
+        """
+        Get real-time arrival predictions for several stations at once.
         
-        except Exception as e:
-            print(f"Error getting predictions: {e}")
+        Stations are requested together through a comma-separated filter[stop],
+        one request per chunk_size stations, and the combined response is split
+        back out by station in a single pass. Predictions for platforms are
+        attributed to their parent station via the included stop resources.
+        
+        Args:
+            station_ids: MBTA station IDs
+            limit: Maximum number of predictions per station
+            chunk_size: Maximum number of stations per upstream request
+            
+        Returns:
+            dict: Station ID -> upcoming arrivals in the same shape as
+                  get_arrival_predictions
+        """
+        station_ids = list(dict.fromkeys(station_ids))
+        results = {station_id: [] for station_id in station_ids}
+        
+        # Served from memory when the streaming ingester is running
+        if self.prediction_store is not None and self.prediction_store.ready:
+            for station_id in station_ids:
+                results[station_id] = self._stored_predictions(station_id, limit)
+        else:
+            results.update(self._fetch_predictions_bulk(station_ids, limit, chunk_size))
+        
+        # No real-time data for a station - show its timetable instead
+        for station_id, arrivals in results.items():
+            if not arrivals:
+                results[station_id] = self.get_scheduled_departures(station_id, limit)
+        return results
+    
+    def _fetch_predictions_bulk(self, station_ids: list, limit: int, chunk_size: int) -> dict:
+        """
+        Request predictions for stations in chunks and split them out by station.
+        
+        Args:
+            station_ids: Distinct MBTA station IDs
+            limit: Maximum number of predictions per station
+            chunk_size: Maximum number of stations per upstream request
+            
+        Returns:
+            dict: Station ID -> arrivals, for the stations whose chunk was fetched
+                  (stations in a failed chunk are left out)
+        """
+        results = {}
+        url = f"{http_client.MBTA_API_URL}/predictions"
+        for start in range(0, len(station_ids), chunk_size):
+            params = {
+                "filter[stop]": ",".join(station_ids[start:start + chunk_size]),
+                "sort": "arrival_time",
+                "include": "route,stop"
+            }
+            if self.mbta_key:
+                params["api_key"] = self.mbta_key
+            
+            try:
+                response = http_client.get(url, params=params)
+                response.raise_for_status()
+                document = jsonapi.Document(response.json())
+            except Exception as e:
+                print(f"Error getting bulk predictions: {e}")
+                continue
+            for station_id in station_ids[start:start + chunk_size]:
+                results[station_id] = []
+            
+            # Platform stop ID -> requested station ID
+            owners = {}
+            for stop in document.included:
+                if stop.type != "stop":
+                    continue
+                if stop.id in results:
+                    owners[stop.id] = stop.id
+                elif stop.related_id("parent_station") in results:
+                    owners[stop.id] = stop.related_id("parent_station")
+            
+            # Already sorted by arrival time, so the first `limit` per station are the soonest
+            for prediction in document.data:
+                stop_id = prediction.related_id("stop")
+                station_id = owners.get(stop_id, stop_id if stop_id in results else None)
+                if station_id is None or len(results[station_id]) >= limit:
+                    continue
+                route = document.related(prediction, "route")
+                results[station_id].append({
+                    "route_name": route.attributes.get("long_name", "Unknown") if route else "Unknown",
+                    "route_color": route.attributes.get("color", "gray") if route else "gray",
+                    "arrival_time": self._format_arrival_time(prediction.attributes.get("arrival_time"))
+                })
+        return results
+    
+    @metrics.timed("get_scheduled_departures")
+    def get_scheduled_departures(self, station_id: str, limit: int = 5) -> list:
+        """
+        Get the next scheduled departures for a station from the GTFS store.
+        
+        Args:
+            station_id: The MBTA station ID
+            limit: Maximum number of departures to return
+            
+        Returns:
+            list: Departures in the same shape as get_arrival_predictions,
+                  empty if no GTFS store is configured
+        """
+        if self.gtfs_store is None:
             return []
+        return [{
+            "route_name": d["route"]["long_name"] or d["route"]["id"],
+            "route_color": d["route"]["color"] or "gray",
+            "arrival_time": d["departure_time"].astimezone().strftime("%I:%M %p") + " (scheduled)"
+        } for d in self.gtfs_store.scheduled_departures(station_id, limit=limit)]
+    
+    def _format_arrival_time(self, arrival_time: str) -> str:
+        """
+        Format an ISO 8601 arrival time for display in local time.
+        
+        Args:
+            arrival_time: Arrival time from the MBTA API, or None
+            
+        Returns:
+            str: Time such as "04:05 PM", or "Scheduled" if there is no time
+        """
+        arrival_display = "Scheduled"
+        if arrival_time:
+            try:
+                arrival_dt = datetime.fromisoformat(arrival_time.replace("Z", "+00:00"))
+                # Convert to local timezone and format
+                arrival_local = arrival_dt.astimezone()
+                arrival_display = arrival_local.strftime("%I:%M %p")
+            except Exception as e:
+                print(f"Error parsing time: {e}")
+        return arrival_display
+    
+    def get_station_details(self, station: dict, deadline: float) -> tuple:
+        """
+        Fetch a station's routes (if missing) and arrivals concurrently.
+        
+        Both calls depend only on the station ID, so they are issued together
+        on the finder's thread pool. Whatever has not finished by the deadline
+        is dropped so the station can still be rendered.
+        
+        Args:
+            station: Station dictionary returned by find_nearest_station
+            deadline: time.monotonic() value by which results are needed
+            
+        Returns:
+            tuple: (routes, arrivals, arrivals_complete) where arrivals_complete
+                   is False if predictions did not arrive in time
+        """
+        futures = {"arrivals": self.executor.submit(self.get_arrival_predictions, station["id"])}
+        if not station["routes"]:
+            futures["routes"] = self.executor.submit(self._get_station_routes, station["id"])
+        
+        wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+        
+        routes = station["routes"]
+        if "routes" in futures:
+            routes = futures["routes"].result() if futures["routes"].done() else []
+        arrivals_complete = futures["arrivals"].done()
+        arrivals = futures["arrivals"].result() if arrivals_complete else []
+        if not arrivals_complete:
+            print(f"Predictions for {station['id']} missed the request deadline")
+        return routes, arrivals, arrivals_complete
     
     def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """
@@ -216,40 +584,117 @@ class MBTAStationFinder:
         Returns:
             float: Distance in miles, rounded to 2 decimal places
         """
-        from math import radians, sin, cos, sqrt, atan2
-        R = 3958.8  # miles
-        lat1, lon1 = radians(lat1), radians(lon1)
-        lat2, lon2 = radians(lat2), radians(lon2)
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        return round(R * c, 2)
+        return round(haversine_miles(lat1, lon1, lat2, lon2), 2)
+
+    def distances_to_station(self, station: dict, places: list) -> list:
+        """
+        Calculate the distance from each of several places to one station in a single pass.
+        
+        Args:
+            station: Station dictionary with latitude and longitude
+            places: Dictionaries with latitude and longitude (e.g. favorites)
+            
+        Returns:
+            list: Distances in miles, rounded to 2 decimal places, in the order of places
+        """
+        if not places:
+            return []
+        distances = distances_from(station["latitude"], station["longitude"],
+                                   [float(p["latitude"]) for p in places],
+                                   [float(p["longitude"]) for p in places])
+        return [round(float(d), 2) for d in distances]
+
+    @metrics.timed("plan_journey")
+    def plan_journey(self, origin_query: str, destination_query: str, depart: datetime = None) -> dict:
+        """
+        Plan transit journeys between two searched places.
+        
+        Both places are geocoded like a normal search; stations near each end
+        come from the station index, and the journey planner adds any other
+        stops within walking distance.
+        
+        Args:
+            origin_query: Where the journey starts (address, landmark, or place name)
+            destination_query: Where the journey ends
+            depart: Earliest departure (defaults to now)
+            
+        Returns:
+            dict: The geocoded origin and destination and a "journeys" list,
+                 or None if either place could not be geocoded
+        """
+        futures = [self.executor.submit(self.geocode_location, q) for q in (origin_query, destination_query)]
+        origin, destination = (f.result() for f in futures)
+        if origin is None or destination is None:
+            return None
+        nearby = []
+        for location in (origin, destination):
+            stations = []
+            if self.station_index is not None and self.station_index.loaded:
+                stations = self.station_index.within(location["latitude"], location["longitude"],
+                                                     MAX_ACCESS_MILES)
+            nearby.append(stations)
+        journeys = self.journey_planner.plan((origin["latitude"], origin["longitude"]),
+                                             (destination["latitude"], destination["longitude"]),
+                                             depart, nearby[0], nearby[1])
+        return {"origin": origin, "destination": destination, "journeys": journeys}
 
 # --- Search History Manager Class ---
 class SearchHistoryManager:
     """
-    Manages user search history and favorites using Flask session storage.
+    Manages user search history and favorites in a server-side session store.
     
-    This class provides methods for adding, retrieving, and removing
-    user data without requiring a database.
+    The Flask session cookie only carries a short session ID, so its size
+    does not grow with the number of searches or favorites a user keeps.
     """
     
-    @staticmethod
-    def add_to_recent_searches(session: dict, search_data: dict) -> None:
+    def __init__(self, store, max_recent: int = MAX_RECENT_SEARCHES, prefetcher=None):
         """
-        Add a search to recent searches in the session.
+        Initialize a SearchHistoryManager.
+        
+        Args:
+            store: MemorySessionStore or SQLiteSessionStore holding the lists
+            max_recent: Number of recent searches kept per user
+            prefetcher: Optional ArrivalPrefetcher told about searched and favorited stations
+        """
+        self.store = store
+        self.max_recent = max_recent
+        self.prefetcher = prefetcher
+    
+    def _session_id(self, session: dict, create: bool = True) -> str:
+        """
+        Get the store key for a Flask session, assigning one on its first write.
+        
+        Reads pass create=False and get None for sessions that never saved
+        anything, so anonymous page views and crawlers neither receive a
+        session cookie nor take up a session in the store. Lists left in the
+        cookie by older versions are moved into the store.
+        """
+        legacy = 'recent_searches' in session or 'favorites' in session
+        session_id = session.get('sid')
+        if session_id is None:
+            if not (create or legacy):
+                return None
+            session_id = session['sid'] = secrets.token_urlsafe(12)
+        if legacy:
+            for entry in reversed(session.pop('recent_searches', [])):
+                self.store.add_recent_search(session_id, entry, self.max_recent)
+            for favorite in session.pop('favorites', []):
+                self.store.add_favorite(session_id, favorite)
+        return session_id
+    
+    def add_to_recent_searches(self, session: dict, search_data: dict) -> None:
+        """
+        Add a search to recent searches, replacing an earlier search for the same address.
         
         Args:
             session: The Flask session object
             search_data: Data about the search to save
         """
-        if 'recent_searches' not in session:
-            session['recent_searches'] = []
         search_entry = {
             "query": search_data["query"],
             "address": search_data["address"],
             "station": search_data["station"]["name"],
+            "station_id": search_data["station"].get("id"),
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "user_lat": search_data["latitude"],
             "user_lng": search_data["longitude"],
@@ -257,29 +702,35 @@ class SearchHistoryManager:
             "station_lng": search_data["station"]["longitude"],
             "distance": search_data["distance"]
         }
-        existing = [s for s in session['recent_searches'] if s["address"] == search_entry["address"]]
-        if existing:
-            session['recent_searches'].remove(existing[0])
-        session['recent_searches'].insert(0, search_entry)
-        if len(session['recent_searches']) > MAX_RECENT_SEARCHES:
-            session['recent_searches'] = session['recent_searches'][:MAX_RECENT_SEARCHES]
-        session.modified = True
+        self.store.add_recent_search(self._session_id(session), search_entry, self.max_recent)
+        if self.prefetcher is not None:
+            self.prefetcher.track(search_entry["station_id"], SEARCH_WEIGHT)
 
-    @staticmethod
-    def get_recent_searches(session: dict) -> list:
+    def get_recent_searches(self, session: dict) -> list:
         """
-        Get recent searches from the session.
+        Get recent searches for the session.
         
         Args:
             session: The Flask session object
             
         Returns:
-            list: Recent searches stored in the session
+            list: Recent searches, newest first
         """
-        return session.get('recent_searches', [])
+        session_id = self._session_id(session, create=False)
+        return self.store.recent_searches(session_id) if session_id else []
 
-    @staticmethod
-    def add_to_favorites(session: dict, search_data: dict) -> bool:
+    def clear_recent_searches(self, session: dict) -> None:
+        """
+        Clear the session's recent searches.
+        
+        Args:
+            session: The Flask session object
+        """
+        session_id = self._session_id(session, create=False)
+        if session_id:
+            self.store.clear_recent_searches(session_id)
+
+    def add_to_favorites(self, session: dict, search_data: dict) -> bool:
         """
         Add a location to favorites.
         
@@ -290,23 +741,21 @@ class SearchHistoryManager:
         Returns:
             bool: True if added successfully, False if already exists
         """
-        if 'favorites' not in session:
-            session['favorites'] = []
         favorite = {
             "address": search_data["address"],
-            "latitude": search_data["latitude"],
-            "longitude": search_data["longitude"],
+            # The result page posts coordinates as strings
+            "latitude": float(search_data["latitude"]),
+            "longitude": float(search_data["longitude"]),
             "station_name": search_data["station"]["name"],
+            "station_id": search_data["station"].get("id"),
             "added_on": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
-        if not any(f["address"] == favorite["address"] for f in session['favorites']):
-            session['favorites'].append(favorite)
-            session.modified = True
-            return True
-        return False
+        added = self.store.add_favorite(self._session_id(session), favorite)
+        if added and self.prefetcher is not None:
+            self.prefetcher.track(favorite["station_id"], FAVORITE_WEIGHT)
+        return added
 
-    @staticmethod
-    def remove_from_favorites(session: dict, address: str) -> bool:
+    def remove_from_favorites(self, session: dict, address: str) -> bool:
         """
         Remove a location from favorites.
         
@@ -317,53 +766,244 @@ class SearchHistoryManager:
         Returns:
             bool: True if removed successfully, False otherwise
         """
-        if 'favorites' in session:
-            session['favorites'] = [f for f in session['favorites'] if f["address"] != address]
-            session.modified = True
-            return True
-        return False
+        session_id = self._session_id(session, create=False)
+        return bool(session_id) and self.store.remove_favorite(session_id, address)
+
+    def get_favorites(self, session: dict) -> list:
+        """
+        Get favorites for the session.
+        
+        Args:
+            session: The Flask session object
+            
+        Returns:
+            list: Favorite locations in the order they were added
+        """
+        session_id = self._session_id(session, create=False)
+        return self.store.favorites(session_id) if session_id else []
 
-    @staticmethod
-    def get_favorites(session: dict) -> list:
+    def get_saved_stations(self, session: dict, station_index=None) -> list:
         """
-        Get favorites from the session.
+        Get the distinct stations behind a user's favorites and recent searches.
+        
+        Entries saved before station IDs were recorded are matched to their
+        nearest station through the station index, when it is loaded.
         
         Args:
             session: The Flask session object
+            station_index: Optional StationIndex for entries without a station ID
             
         Returns:
-            list: Favorite locations stored in the session
+            list: Dictionaries with id, name and the saved addresses near it,
+                  favorites first
         """
-        return session.get('favorites', [])
+        entries = [(f.get("station_id"), f["station_name"], f["address"], f["latitude"], f["longitude"])
+                   for f in self.get_favorites(session)]
+        entries += [(s.get("station_id"), s["station"], s["address"], s["station_lat"], s["station_lng"])
+                    for s in self.get_recent_searches(session)]
+        
+        missing = [i for i, entry in enumerate(entries) if not entry[0]]
+        if missing and station_index is not None and station_index.loaded:
+            found = station_index.nearest_many(
+                [(float(entries[i][3]), float(entries[i][4])) for i in missing], route_types=(0, 1))
+            for i, station in zip(missing, found):
+                if station is not None:
+                    entries[i] = (station["id"], station["name"]) + entries[i][2:]
+        
+        stations = {}
+        for station_id, name, address, _, _ in entries:
+            if not station_id:
+                continue
+            station = stations.setdefault(station_id, {"id": station_id, "name": name, "addresses": []})
+            if address not in station["addresses"]:
+                station["addresses"].append(address)
+        return list(stations.values())
 
 # --- Route Definitions ---
-station_finder = MBTAStationFinder(MAPBOX_ACCESS_TOKEN, MBTA_API_KEY)
-history_manager = SearchHistoryManager()
+station_index = get_station_index(MBTA_API_KEY)
+station_index.attach_raster(get_station_raster())
+gazetteer = get_gazetteer()
+station_index.add_listener(gazetteer.on_station_index_load)
+autocomplete_index = get_autocomplete_index()
+station_index.add_listener(autocomplete_index.on_station_index_load)
+station_catalog = get_station_catalog(MBTA_API_KEY)
+station_index.add_listener(station_catalog.on_station_index_load)
+journey_planner = get_journey_planner()
+station_finder = MBTAStationFinder(MAPBOX_ACCESS_TOKEN, MBTA_API_KEY, station_index,
+                                   get_geocode_cache(), get_prediction_store(), get_gtfs_store(),
+                                   get_upstream_cache(), gazetteer, journey_planner)
+arrival_prefetcher = get_arrival_prefetcher(station_finder.prefetch_arrival_predictions)
+history_manager = SearchHistoryManager(get_session_store(), prefetcher=arrival_prefetcher)
+
+# Shared by every viewer of a station: one upstream call per station per TTL window
+# (and, with SHARED_CACHE_PATH set, by every worker process)
+arrivals_cache = make_cache(maxsize=512, ttl=ARRIVALS_CACHE_TTL, name="arrivals")
+# Remembers when each station's arrivals last changed, for Last-Modified
+arrivals_versions = make_cache(maxsize=512, ttl=3600, name="arrivals_versions")
+
+
+def load_station_arrivals(station_id: str) -> dict:
+    """
+    Fetch arrivals for a station and fingerprint them for conditional requests.
+    
+    Args:
+        station_id: The MBTA station ID
+        
+    Returns:
+        dict: Serialized JSON body, its ETag, and the time the content last changed
+    """
+    body = json.dumps(get_station_arrivals(station_id), sort_keys=True)
+    etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+    previous = arrivals_versions.get(station_id)
+    last_modified = previous[1] if previous and previous[0] == etag else time.time()
+    arrivals_versions.set(station_id, [etag, last_modified])
+    return {"body": body, "etag": etag, "last_modified": last_modified}
+
+
+# One poller per watched station feeds every open /stream for that station
+arrival_broadcaster = ArrivalBroadcaster(
+    lambda station_id: json.loads(
+        arrivals_cache.get_or_load(station_id, lambda: load_station_arrivals(station_id))["body"]
+    )["arrivals"],
+    interval=ARRIVALS_CACHE_TTL,
+    max_subscribers=MAX_STREAM_SUBSCRIBERS,
+)
+
+
+def render_template(template_name: str, **context) -> str:
+    """
+    Render a template, recording how long rendering took.
+    
+    Args:
+        template_name: Template file name
+        **context: Template variables
+        
+    Returns:
+        str: The rendered page
+    """
+    with metrics.timer("render_duration", template=template_name):
+        return flask.render_template(template_name, **context)
+
+
+@app.before_request
+def start_request_timer():
+    """Note when request handling started, for the request duration histogram."""
+    flask.g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    """Record how long the request took, labelled by Flask endpoint."""
+    started = flask.g.pop("request_started", None)
+    if started is not None:
+        metrics.observe("http_request_duration", time.perf_counter() - started,
+                        endpoint=request.endpoint or "unmatched")
+    return response
+
+
+def collect_gauges() -> list:
+    """
+    Report cache, circuit breaker, rate limit and stream state for /metrics.
+    
+    Returns:
+        list: (name, help, labels, value) gauge samples
+    """
+    samples = []
+    for cache in (get_geocode_cache(), get_upstream_cache(), arrivals_cache, arrivals_versions):
+        stats = cache.stats()
+        labels = {"cache": stats["name"]}
+        samples += [
+            ("cache_hits", "Cache lookups answered from the cache", labels, stats["hits"]),
+            ("cache_misses", "Cache lookups that missed", labels, stats["misses"]),
+            ("cache_hit_ratio", "Share of cache lookups that hit", labels, round(stats["hit_ratio"], 4)),
+            ("cache_entries", "Entries currently held", labels, stats["size"]),
+        ]
+        if "shared_hits" in stats:
+            samples += [
+                ("cache_shared_hits", "L1 misses answered by the cross-worker cache", labels,
+                 stats["shared_hits"]),
+                ("cache_shared_entries", "Entries in the cross-worker cache", labels, stats["shared_size"]),
+            ]
+    for host, breaker in list(http_client.get_client().breakers.items()):
+        stats = breaker.stats()
+        samples += [
+            ("circuit_open", "1 while the host's circuit breaker is not closed", {"host": host},
+             int(stats["state"] != "closed")),
+            ("circuit_rejected", "Calls rejected by the host's open circuit", {"host": host}, stats["rejected"]),
+        ]
+    for host, bucket in list(http_client.get_client().rate_limits.items()):
+        stats = bucket.stats()
+        samples.append(("rate_limit_tokens", "Requests left in the host's budget", {"host": host}, stats["tokens"]))
+        samples.append(("rate_limit_throttled", "429 responses from the host", {"host": host}, stats["throttled"]))
+        for name, deferred in stats["deferred"].items():
+            samples.append(("rate_limit_deferred", "Calls deferred for lack of budget",
+                            {"host": host, "priority": name}, deferred))
+    local = gazetteer.stats()
+    samples += [
+        ("gazetteer_hits", "Searches geocoded from the local gazetteer", {}, local["hits"]),
+        ("gazetteer_misses", "Searches the local gazetteer could not resolve", {}, local["misses"]),
+    ]
+    stream = arrival_broadcaster.stats()
+    samples += [
+        ("stream_subscribers", "Open arrival event streams", {}, stream["subscribers"]),
+        ("station_index_loaded", "1 once the station index has loaded", {}, int(station_index.loaded)),
+        ("station_catalog_stations", "Stations in the metadata catalog", {}, len(station_catalog)),
+    ]
+    prefetch = arrival_prefetcher.stats()
+    samples += [
+        ("prefetch_tracked_stations", "Stations in the arrival prefetch working set", {}, prefetch["tracked"]),
+        ("prefetch_refreshed", "Station arrivals refreshed by the prefetcher", {}, prefetch["refreshed"]),
+    ]
+    if station_index.raster is not None:
+        raster = station_index.raster.stats()
+        samples += [
+            ("station_raster_hits", "Nearest-stop queries answered from the raster", {}, raster["hits"]),
+            ("station_raster_fallbacks", "Nearest-stop queries passed to the station index", {},
+             raster["fallbacks"]),
+        ]
+    return samples
+
+
+metrics.register_collector(collect_gauges)
+
 
 @app.route('/')
 def index():
     """
     Render the home page with the search form.
+    
+    Favorites show their station's next arrivals when the prefetcher has
+    them in memory; the page never waits on MBTA for them.
     """
+    favorites = history_manager.get_favorites(session)
+    favorite_arrivals = {}
+    for favorite in favorites:
+        station_id = favorite.get("station_id")
+        if station_id and station_id not in favorite_arrivals:
+            arrival_prefetcher.track(station_id, VIEW_WEIGHT)
+            favorite_arrivals[station_id] = station_finder.cached_arrival_predictions(station_id, limit=2)
     return render_template('index.html',
                            mapbox_token=MAPBOX_ACCESS_TOKEN,
                            recent_searches=history_manager.get_recent_searches(session),
-                           favorites=history_manager.get_favorites(session))
+                           favorites=favorites,
+                           favorite_arrivals=favorite_arrivals)
 
 @app.route('/find_station', methods=['POST'])
 def find_station():
     """
     Handle the form submission to find the nearest station.
     """
+    deadline = time.monotonic() + SEARCH_DEADLINE
     location_query = request.form.get('location', '')
     if not location_query:
         return render_template('index.html', error="Please enter a location")
 
-    location_data = station_finder.geocode_location(location_query)
+    location_data = station_finder.geocode_location(location_query, deadline)
     if not location_data:
         return render_template('index.html', error="Could not find that location")
 
-    nearest_station = station_finder.find_nearest_station(location_data["latitude"], location_data["longitude"])
+    nearest_station = station_finder.find_nearest_station(location_data["latitude"], location_data["longitude"],
+                                                          include_routes=False, deadline=deadline)
     if not nearest_station:
         return render_template('index.html', error="No MBTA stations found near that location")
 
@@ -372,8 +1012,9 @@ def find_station():
         nearest_station["latitude"], nearest_station["longitude"]
     )
     
-    # Get upcoming arrivals for this station
-    upcoming_arrivals = station_finder.get_arrival_predictions(nearest_station["id"])
+    # Routes and upcoming arrivals only depend on the station, so fetch them together
+    routes, upcoming_arrivals, arrivals_complete = station_finder.get_station_details(nearest_station, deadline)
+    nearest_station["routes"] = routes
             
     search_data = {
         "query": location_query,
@@ -386,12 +1027,36 @@ def find_station():
 
     history_manager.add_to_recent_searches(session, search_data)
 
+    # How far each saved favorite is from this station
+    favorites = history_manager.get_favorites(session)
+    favorite_distances = [
+        {"address": f["address"], "distance": d}
+        for f, d in zip(favorites, station_finder.distances_to_station(nearest_station, favorites))
+    ]
+
     return render_template('result.html',
                            search_data=search_data,
                            mapbox_token=MAPBOX_ACCESS_TOKEN,
                            recent_searches=history_manager.get_recent_searches(session),
-                           favorites=history_manager.get_favorites(session),
-                           arrivals=upcoming_arrivals)  # Pass arrivals to template
+                           favorites=favorites,
+                           favorite_distances=favorite_distances,
+                           arrivals=upcoming_arrivals,  # Pass arrivals to template
+                           arrivals_unavailable=not arrivals_complete,
+                           journeys_available=journey_planner is not None)
+
+@app.route('/departures')
+def departures():
+    """
+    Render a departure board for every station in the user's favorites and recent searches.
+    
+    Arrivals for all of the stations come from one bulk predictions request
+    (or a few, for very long lists) rather than one request per station.
+    """
+    stations = history_manager.get_saved_stations(session, station_index)
+    arrivals_by_station = station_finder.get_arrival_predictions_bulk([s["id"] for s in stations])
+    for station in stations:
+        station["arrivals"] = arrivals_by_station.get(station["id"], [])
+    return render_template('departure_board.html', stations=stations)
 
 @app.route('/add_favorite', methods=['POST'])
 def add_favorite():
@@ -418,58 +1083,229 @@ def clear_history():
     """
     Clear search history.
     """
-    session.pop('recent_searches', None)
-    session.modified = True
+    history_manager.clear_recent_searches(session)
     return redirect(url_for('index'))
 
 
-@app.route('/api/station_info/<station_name>')
-def station_info(station_name):
+@app.route('/api/arrivals/<station_id>')
+def arrivals(station_id):
     """
-    API endpoint to get information about a specific station.
+    API endpoint returning upcoming arrivals for a station.
+    
+    Concurrent pollers of the same station share one cached upstream fetch,
+    and unchanged data is answered with 304 Not Modified.
     
     Args:
-        station_name: Name of the station to look up
+        station_id: The MBTA station ID
         
     Returns:
-        JSON response with station information
-    """
-    # For demo purposes, return hardcoded data for some common stations
-    stations = {
-        "Symphony": {
-            "name": "Symphony",
-            "lines": ["Green Line - E Branch"],
-            "accessible": True,
-            "address": "Massachusetts Ave at Huntington Ave, Boston, MA"
-        },
-        "Fenway": {
-            "name": "Fenway",
-            "lines": ["Green Line - D Branch"],
-            "accessible": True,
-            "address": "Park Drive near Fenway Park, Boston, MA"
-        },
-        "Harvard": {
-            "name": "Harvard",
-            "lines": ["Red Line"],
-            "accessible": True,
-            "address": "Harvard Square, Cambridge, MA"
-        }
-    }
+        JSON response with an "arrivals" list, or an empty 304 response
+    """
+    entry = arrivals_cache.get_or_load(station_id, lambda: load_station_arrivals(station_id))
+    response = app.response_class(entry["body"], mimetype="application/json")
+    response.set_etag(entry["etag"])
+    response.last_modified = datetime.fromtimestamp(entry["last_modified"], timezone.utc)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/api/arrivals/<station_id>/stream')
+def arrivals_stream(station_id):
+    """
+    Server-Sent Events stream of arrival changes for a station.
+    
+    Sends a "snapshot" event with the full arrival list, then "delta" events
+    with upserted arrivals and removed prediction IDs whenever they change.
+    
+    Args:
+        station_id: The MBTA station ID
+        
+    Returns:
+        A text/event-stream response, or 503 if too many streams are open
+    """
+    subscription = arrival_broadcaster.subscribe(station_id)
+    if subscription is None:
+        return jsonify({"error": "Too many open streams, poll /api/arrivals instead"}), 503
+
+    def generate():
+        try:
+            yield f"retry: {int(ARRIVALS_CACHE_TTL * 1000)}\n\n"
+            while True:
+                message = subscription.get(timeout=STREAM_HEARTBEAT)
+                yield message if message is not None else ": keep-alive\n\n"
+        finally:
+            arrival_broadcaster.unsubscribe(subscription)
+
+    response = app.response_class(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route('/api/autocomplete')
+def autocomplete():
+    """
+    API endpoint suggesting stations and places as the user types.
+    
+    Answered entirely from the in-memory prefix index; Mapbox is never
+    called per keystroke.
+    
+    Query parameters:
+        q: The partially typed search text
+        limit: Maximum number of suggestions (default 8, at most 20)
+        
+    Returns:
+        JSON response with a "suggestions" list
+    """
+    query = request.args.get('q', '')[:100]
+    limit = max(0, min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), 20))
+    response = jsonify({"query": query, "suggestions": autocomplete_index.suggest(query, limit)})
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response
+
+
+@app.route('/api/journey')
+def journey():
+    """
+    API endpoint planning transit journeys between two places.
     
-    # Case-insensitive lookup with fallback
-    for key, data in stations.items():
-        if key.lower() == station_name.lower():
-            return jsonify(data)
+    Journeys are computed in-process from the GTFS timetable, so this only
+    works when a GTFS store is configured (GTFS_STORE_PATH).
     
-    # Station not in our hardcoded list - fallback to a dummy response
-    return jsonify({
-        "name": station_name.title(),
-        "lines": ["Unknown"],
-        "accessible": False,
-        "address": "Boston, MA"
-    })
+    Query parameters:
+        from: Where the journey starts (address, landmark, or place name)
+        to: Where the journey ends
+        depart: Optional departure time today as HH:MM (defaults to now)
+        
+    Returns:
+        JSON response with the geocoded ends and a "journeys" list, fastest first
+    """
+    origin_query = request.args.get('from', '').strip()
+    destination_query = request.args.get('to', '').strip()
+    if not origin_query or not destination_query:
+        return jsonify({"error": "Both from and to are required"}), 400
+    if journey_planner is None:
+        return jsonify({"error": "Journey planning needs a GTFS store (GTFS_STORE_PATH)"}), 503
+    if not journey_planner.ready:
+        return jsonify({"error": "Journey planner is still loading the timetable"}), 503
+
+    depart = None
+    if request.args.get('depart'):
+        try:
+            hour, minute = (int(part) for part in request.args['depart'].split(":"))
+            depart = datetime.now(AGENCY_TZ).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        except ValueError:
+            return jsonify({"error": "depart must be HH:MM"}), 400
+
+    result = station_finder.plan_journey(origin_query, destination_query, depart)
+    if result is None:
+        return jsonify({"error": "Could not find one of those locations"}), 404
+    return jsonify(result)
+
+
+@app.route('/api/batch_search', methods=['POST'])
+def batch_search():
+    """
+    API endpoint resolving many locations to their nearest stations in one call.
+    
+    Accepts either a JSON body {"queries": ["...", ...]} or NDJSON
+    (application/x-ndjson) with one query string or {"query": "..."} per line.
+    NDJSON input is read incrementally, so memory use does not grow with the
+    number of queries. Items without a string or numeric query get an
+    {"index": i, "status": "invalid"} result.
+    
+    Returns:
+        An application/x-ndjson stream with one result per query, in completion order
+    """
+    if request.mimetype == "application/x-ndjson":
+        queries = iter_ndjson_queries(request.stream)
+    else:
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data.get("queries"), list):
+            return jsonify({"error": "Expected {\"queries\": [...]} or NDJSON input"}), 400
+        queries = enumerate(query_text(q) for q in data["queries"])
+
+    searcher = BatchSearcher(station_finder, station_index, max_workers=BATCH_CONCURRENCY)
+
+    def generate():
+        for result in searcher.run(queries):
+            yield json.dumps(result) + "\n"
+
+    return app.response_class(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint.
+    
+    Latency histograms (with recent p50/p95/p99) for finder and helper
+    operations, upstream calls by endpoint, incoming requests and template
+    rendering, plus cache hit ratios and circuit breaker state.
+    
+    Returns:
+        Text exposition format response
+    """
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/station_info/<path:station_name>')
+def station_info(station_name):
+    """
+    API endpoint to get information about a specific station.
+    
+    Looks the station up in the station catalog by MBTA ID, name, or a
+    close spelling of the name. Responses carry an ETag, so clients and
+    proxies can revalidate without transferring the body again.
+    
+    Args:
+        station_name: Station ID or name to look up
+        
+    Returns:
+        JSON response with the station's lines, accessibility, address and
+        platforms; 404 for unknown stations, 503 while the catalog is loading
+    """
+    if not station_catalog.loaded:
+        return jsonify({"error": "Station catalog is still loading"}), 503
+    record = station_catalog.lookup(station_name)
+    if record is None:
+        return jsonify({"error": f"Unknown station: {station_name}"}), 404
+    response = jsonify(record.to_dict())
+    response.set_etag(record.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 3600
+    return response.make_conditional(request)
+
+
+def start_background_tasks() -> None:
+    """
+    Start the threads that load and refresh shared data.
+
+    Loads the station index (and keeps it fresh), connects the MBTA
+    prediction stream when enabled, builds the journey planner's timetable
+    and starts arrival prefetching. Importing this module does none of
+    this, so it can be imported by tools and tests without network calls.
+    Safe to call more than once.
+    """
+    station_index.start_background_refresh()
+    start_prediction_stream(MBTA_API_KEY)
+    if journey_planner is not None:
+        journey_planner.start_background_build()
+    arrival_prefetcher.start()
+
+
+def create_app() -> Flask:
+    """
+    WSGI application factory, e.g. `gunicorn -w 4 'app:create_app()'`.
+
+    Returns:
+        Flask: The app, with its background tasks started in this process
+    """
+    start_background_tasks()
+    return app
 
 
 # --- Run the app ---
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,268 @@
+"""
+Server-Sent Events fan-out of live arrival updates
+"""
+import asyncio
+import json
+import queue
+import threading
+
+import rate_limit
+
+
+class Subscription:
+    """
+    One client's view of a station stream: a small bounded queue of SSE messages.
+    """
+
+    __slots__ = ("station_id", "messages", "needs_snapshot")
+
+    def __init__(self, station_id: str, max_pending: int):
+        self.station_id = station_id
+        self.messages = queue.Queue(maxsize=max_pending)
+        # Set when messages were dropped; the next message must be a full snapshot
+        self.needs_snapshot = False
+
+    def get(self, timeout: float):
+        """
+        Wait for the next SSE message.
+
+        Args:
+            timeout: Seconds to wait before giving up
+
+        Returns:
+            str: A formatted SSE message, or None on timeout
+        """
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def offer(self, message: str) -> bool:
+        """Queue a message without waiting; False if the client is too far behind."""
+        try:
+            self.messages.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+
+class AsyncSubscription(Subscription):
+    """
+    A subscription read from an event loop.
+
+    Pollers hand messages to the loop with call_soon_threadsafe, so a reader
+    awaiting next() is woken as soon as a message is published. The pending
+    count is kept as two counters, each written by one side only.
+    """
+
+    __slots__ = ("loop", "max_pending", "_offered", "_taken")
+
+    def __init__(self, station_id: str, max_pending: int, loop: asyncio.AbstractEventLoop):
+        self.station_id = station_id
+        self.messages = asyncio.Queue()
+        self.needs_snapshot = False
+        self.loop = loop
+        self.max_pending = max_pending
+        self._offered = 0  # Written by publishers, under the broadcaster's lock
+        self._taken = 0    # Written by the event loop
+
+    def offer(self, message: str) -> bool:
+        if self._offered - self._taken >= self.max_pending:
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self.messages.put_nowait, message)
+        except RuntimeError:  # The loop has closed; the stream is going away
+            return False
+        self._offered += 1
+        return True
+
+    async def next(self, timeout: float):
+        """
+        Wait for the next SSE message.
+
+        Args:
+            timeout: Seconds to wait before giving up
+
+        Returns:
+            str: A formatted SSE message, or None on timeout or after close()
+        """
+        try:
+            message = self.messages.get_nowait()
+        except asyncio.QueueEmpty:
+            # Unlike wait_for, asyncio.wait cannot drop a message that arrives as the timeout expires
+            getter = asyncio.ensure_future(self.messages.get())
+            try:
+                done, _ = await asyncio.wait((getter,), timeout=timeout)
+            finally:
+                if not getter.done():
+                    getter.cancel()
+            if not done:
+                return None
+            message = getter.result()
+        if message is not None:
+            self._taken += 1
+        return message
+
+    def close(self) -> None:
+        """Wake a reader waiting in next(); call from the subscription's event loop."""
+        self.messages.put_nowait(None)
+
+
+def format_event(event: str, data: dict) -> str:
+    """
+    Format a named Server-Sent Event.
+
+    Args:
+        event: Event name seen by EventSource listeners
+        data: JSON-serializable payload
+
+    Returns:
+        str: The event in text/event-stream wire format
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def diff_arrivals(previous: dict, current: dict) -> dict:
+    """
+    Compute the change between two arrival sets keyed by prediction ID.
+
+    Args:
+        previous: Prediction ID to arrival dictionary from the last poll
+        current: Prediction ID to arrival dictionary from this poll
+
+    Returns:
+        dict: "upserted" arrivals that are new or changed and "removed" IDs,
+              or None if nothing changed
+    """
+    upserted = [a for key, a in current.items() if previous.get(key) != a]
+    removed = [key for key in previous if key not in current]
+    if not upserted and not removed:
+        return None
+    return {"upserted": upserted, "removed": removed}
+
+
+class ArrivalBroadcaster:
+    """
+    Pushes arrival changes for a station to all of its subscribed clients.
+
+    Each station with at least one subscriber has exactly one poller thread,
+    so upstream traffic grows with the number of watched stations rather than
+    the number of open pages. The poller exits when the last subscriber leaves.
+    """
+
+    def __init__(self, fetch, interval: float = 15, max_subscribers: int = 1000,
+                 max_pending: int = 8):
+        """
+        Initialize an ArrivalBroadcaster.
+
+        Args:
+            fetch: Callable taking a station ID and returning a list of arrival dicts
+            interval: Seconds between polls of a watched station
+            max_subscribers: Upper bound on concurrently open streams
+            max_pending: Messages buffered per subscriber before it is resynced
+        """
+        self.fetch = fetch
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self._subscribers = {}  # station_id -> set of Subscription
+        self._latest = {}       # station_id -> {prediction_id: arrival}
+        self._wakeups = {}      # station_id -> Event that stops the poller early
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, station_id: str, loop: asyncio.AbstractEventLoop = None) -> Subscription:
+        """
+        Register a client for a station, starting its poller if needed.
+
+        Args:
+            station_id: The MBTA station ID
+            loop: Event loop of an async reader, which then gets an AsyncSubscription
+
+        Returns:
+            Subscription: The client's message queue, or None if the server is at capacity
+        """
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            if loop is None:
+                subscription = Subscription(station_id, self.max_pending)
+            else:
+                subscription = AsyncSubscription(station_id, self.max_pending, loop)
+            subscribers = self._subscribers.setdefault(station_id, set())
+            subscribers.add(subscription)
+            self._count += 1
+            if station_id in self._latest:
+                subscription.offer(self._snapshot(station_id))
+            if station_id not in self._wakeups:
+                self._wakeups[station_id] = threading.Event()
+                threading.Thread(target=self._poll, args=(station_id, self._wakeups[station_id]),
+                                 name=f"arrivals-{station_id}", daemon=True).start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Remove a client; the station's poller stops once nobody is watching.
+
+        Args:
+            subscription: The subscription returned by subscribe
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.station_id)
+            if not subscribers or subscription not in subscribers:
+                return
+            subscribers.discard(subscription)
+            self._count -= 1
+            if not subscribers:
+                del self._subscribers[subscription.station_id]
+                self._latest.pop(subscription.station_id, None)
+                wakeup = self._wakeups.pop(subscription.station_id, None)
+                if wakeup is not None:
+                    wakeup.set()
+
+    def _snapshot(self, station_id: str) -> str:
+        return format_event("snapshot", {"arrivals": list(self._latest[station_id].values())})
+
+    def _publish(self, station_id: str, message: str) -> None:
+        with self._lock:
+            for subscription in self._subscribers.get(station_id, ()):
+                if subscription.needs_snapshot:
+                    # The client missed deltas; only a full snapshot brings it back in sync
+                    if subscription.offer(self._snapshot(station_id)):
+                        subscription.needs_snapshot = False
+                    continue
+                if not subscription.offer(message):
+                    subscription.needs_snapshot = True
+
+    def _poll(self, station_id: str, wakeup: threading.Event) -> None:
+        while not wakeup.is_set():
+            try:
+                with rate_limit.priority(rate_limit.BACKGROUND):
+                    current = {a["id"]: a for a in self.fetch(station_id)}
+            except Exception as e:
+                print(f"Error polling arrivals for {station_id}: {e}")
+                current = None
+            if current is not None:
+                with self._lock:
+                    if wakeup.is_set():
+                        break
+                    first = station_id not in self._latest
+                    previous = self._latest.get(station_id, {})
+                    self._latest[station_id] = current
+                if first:
+                    self._publish(station_id, format_event("snapshot", {"arrivals": list(current.values())}))
+                else:
+                    delta = diff_arrivals(previous, current)
+                    if delta:
+                        self._publish(station_id, format_event("delta", delta))
+            wakeup.wait(self.interval)
+
+    def stats(self) -> dict:
+        """
+        Report current stream usage.
+
+        Returns:
+            dict: Number of open subscriptions and of stations being polled
+        """
+        with self._lock:
+            return {"subscribers": self._count, "stations": len(self._subscribers)}
@@ -0,0 +1,206 @@
+"""
+ASGI entry point: the station finder with upstream calls on an event loop
+
+    pip install uvicorn httpx
+    uvicorn asgi:app --workers 4
+
+Serves the same routes and templates as the WSGI app (python app.py /
+gunicorn app:app). The routes that wait on MBTA or Mapbox are handled here:
+their upstream calls are awaited on async_http's non-blocking client, which
+fills the caches the Flask views read, and the view then renders without
+waiting on anything. Arrival streams are served natively, so an idle
+/stream connection holds no thread. Every other route runs the Flask app
+unchanged on a small thread pool (WSGI_THREADS).
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from app import (ARRIVALS_CACHE_TTL, PREDICTIONS_FRESH_TTL, PREDICTIONS_MAX_STALE, ROUTES_FRESH_TTL,
+                 ROUTES_MAX_STALE, SEARCH_DEADLINE, STREAM_HEARTBEAT, app as flask_app,
+                 arrival_broadcaster, arrivals_cache, journey_planner, start_background_tasks,
+                 station_finder)
+from async_finder import AsyncStationFinder, cache_get
+from async_http import get_async_client
+
+ARRIVALS_PATH = re.compile(r"^/api/arrivals/([^/]+)$")
+STREAM_PATH = re.compile(r"^/api/arrivals/([^/]+)/stream$")
+
+async_finder = AsyncStationFinder(station_finder, get_async_client(),
+                                  predictions_ttl=(PREDICTIONS_FRESH_TTL, PREDICTIONS_MAX_STALE),
+                                  routes_ttl=(ROUTES_FRESH_TTL, ROUTES_MAX_STALE))
+wsgi_executor = ThreadPoolExecutor(max_workers=int(os.getenv("WSGI_THREADS", "16")),
+                                   thread_name_prefix="wsgi")
+
+
+# --- WSGI bridge ---
+def _environ(scope: dict, body: bytes) -> dict:
+    """Build a WSGI environ for an ASGI HTTP scope and its complete request body."""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _run_wsgi(scope: dict, body: bytes, send) -> None:
+    """Run the Flask app for one request on the WSGI thread pool, streaming its response."""
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    iterable = await loop.run_in_executor(wsgi_executor, flask_app, _environ(scope, body), start_response)
+    iterator = iter(iterable)
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while True:
+            chunk = await loop.run_in_executor(wsgi_executor, next, iterator, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(iterable, "close"):
+            await loop.run_in_executor(wsgi_executor, iterable.close)
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+# --- Natively async routes ---
+async def _stream_arrivals(station_id: str, receive, send) -> None:
+    """SSE stream of a station's arrivals, as the Flask arrivals_stream view, without holding a thread."""
+    subscription = arrival_broadcaster.subscribe(station_id, loop=asyncio.get_running_loop())
+    if subscription is None:
+        await send({"type": "http.response.start", "status": 503,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body",
+                    "body": b'{"error": "Too many open streams, poll /api/arrivals instead"}'})
+        return
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+        subscription.close()
+
+    watcher = asyncio.get_running_loop().create_task(watch_disconnect())
+    try:
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        message = f"retry: {int(ARRIVALS_CACHE_TTL * 1000)}\n\n"
+        while not disconnected.is_set():
+            await send({"type": "http.response.body", "body": message.encode("utf-8"), "more_body": True})
+            # Woken by the broadcaster as soon as a message is published, or by a disconnect
+            message = await subscription.next(STREAM_HEARTBEAT) or ": keep-alive\n\n"
+    finally:
+        watcher.cancel()
+        arrival_broadcaster.unsubscribe(subscription)
+
+
+async def _warm(scope: dict, body: bytes) -> None:
+    """Await the upstream calls a request will need so its Flask view finds them cached."""
+    method, path = scope["method"], scope["path"]
+    if method == "POST" and path == "/find_station":
+        location = parse_qs(body.decode("utf-8", "replace")).get("location", [""])[0]
+        if location:
+            await async_finder.warm_search(location, time.monotonic() + SEARCH_DEADLINE)
+    elif method == "GET" and path == "/api/journey":
+        args = parse_qs(scope["query_string"].decode("utf-8", "replace"))
+        origin, destination = args.get("from", [""])[0].strip(), args.get("to", [""])[0].strip()
+        if origin and destination and journey_planner is not None and journey_planner.ready:
+            await async_finder.warm_journey(origin, destination)
+    elif method == "GET":
+        match = ARRIVALS_PATH.match(path)
+        if match and await cache_get(arrivals_cache, match.group(1)) is None:
+            await async_finder.get_station_arrivals(match.group(1))
+
+
+async def app(scope, receive, send):
+    """
+    ASGI application.
+
+    Args:
+        scope: Connection scope
+        receive: Awaitable returning the next client event
+        send: Awaitable sending an event to the client
+    """
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                start_background_tasks()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    match = STREAM_PATH.match(scope["path"])
+    if match and scope["method"] == "GET":
+        await _stream_arrivals(match.group(1), receive, send)
+        return
+    body = await _read_body(receive)
+    try:
+        await _warm(scope, body)
+    except Exception as e:
+        # The view makes the calls itself if warming failed
+        print(f"Async prefetch for {scope['path']} failed: {e}")
+    await _run_wsgi(scope, body, send)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("The ASGI mode needs uvicorn: pip install uvicorn httpx")
+    uvicorn.run("asgi:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -0,0 +1,328 @@
+"""
+Async station lookups for the ASGI entry point
+
+AsyncStationFinder awaits the upstream calls a search, an arrivals poll or
+a journey needs, on async_http's non-blocking client, and stores the results
+in the synchronous MBTAStationFinder's caches under the same keys. The
+Flask views then render from those caches, so both serving modes share
+request parsing, templates and cached data; only the waiting on MBTA and
+Mapbox moves onto the event loop. Cache reads and writes that reach a shared
+SQLite tier run on worker threads, so they never stall the loop either.
+"""
+import asyncio
+import time
+
+import mbta_helper
+import rate_limit
+from async_http import AsyncHTTPClient
+from cache import TieredCache, TTLCache, get_upstream_cache, normalize_query
+
+
+async def cache_get(cache: TTLCache, key: str):
+    """
+    Look a key up without blocking the event loop.
+
+    Entries held in this process are returned inline; only a miss that has
+    to read a shared SQLite tier runs on a worker thread.
+
+    Args:
+        cache: TTLCache or TieredCache
+        key: Cache key
+
+    Returns:
+        The cached value, or None on a miss
+    """
+    if not isinstance(cache, TieredCache):
+        return cache.get(key)
+    value = cache.get_local(key)
+    if value is None:
+        value = await asyncio.to_thread(cache.get, key)
+    return value
+
+
+async def cache_write(cache: TTLCache, write, *args) -> None:
+    """
+    Run a write method of a cache, on a worker thread if it also writes a shared SQLite tier.
+
+    Args:
+        cache: TTLCache or TieredCache
+        write: Bound method of cache, e.g. cache.set
+        *args: Arguments for write
+    """
+    if isinstance(cache, TieredCache):
+        await asyncio.to_thread(write, *args)
+    else:
+        write(*args)
+
+
+class AsyncStationFinder:
+    """
+    Awaitable counterparts of the MBTAStationFinder and mbta_helper calls
+    that go upstream.
+
+    Reads and writes the same caches as the synchronous finder: a fresh
+    entry is returned as is, a stale one is returned while one background
+    task refreshes it, and a missing one is loaded once however many
+    coroutines ask for it at the same time.
+    """
+
+    def __init__(self, finder, client: AsyncHTTPClient, predictions_ttl: tuple = (10, 300),
+                 routes_ttl: tuple = (86400, 7 * 86400)):
+        """
+        Initialize an AsyncStationFinder.
+
+        Args:
+            finder: MBTAStationFinder whose caches, station index and response parsers are used
+            client: AsyncHTTPClient for upstream calls
+            predictions_ttl: (fresh, max_stale) seconds for predictions, as used by the finder
+            routes_ttl: (fresh, max_stale) seconds for station routes, as used by the finder
+        """
+        self.finder = finder
+        self.client = client
+        self.predictions_ttl = predictions_ttl
+        self.routes_ttl = routes_ttl
+        self._flights = {}  # (cache name, key) -> Future of an in-progress load
+        self._refreshing = set()
+
+    async def _revalidated(self, cache: TTLCache, key: str, load, ttl: float, max_stale: float,
+                           background_priority: int = rate_limit.BACKGROUND) -> tuple:
+        """
+        Async equivalent of TTLCache.get_or_revalidate.
+
+        Args:
+            cache: Cache holding the entry
+            key: Cache key
+            load: Coroutine function taking a priority class and returning the value
+            ttl: Seconds a loaded value counts as fresh
+            max_stale: Seconds past freshness a value may still be served
+            background_priority: Priority class of refreshes for stale entries
+
+        Returns:
+            tuple: (value, stale)
+        """
+        entry = await cache_get(cache, key)
+        if entry is not None:
+            # As TTLCache.get_revalidated
+            value, stale = entry["value"], entry["fresh_until"] <= time.time()
+            flight_key = (cache.name, key)
+            if stale and flight_key not in self._refreshing:
+                self._refreshing.add(flight_key)
+                asyncio.get_running_loop().create_task(
+                    self._refresh(cache, key, load, ttl, max_stale, background_priority))
+            return value, stale
+
+        flight_key = (cache.name, key)
+        flight = self._flights.get(flight_key)
+        if flight is not None:
+            try:
+                return await asyncio.shield(flight), False
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # The coroutine loading it was cancelled, not this one: load it ourselves
+                return await self._revalidated(cache, key, load, ttl, max_stale, background_priority)
+        flight = self._flights[flight_key] = asyncio.get_running_loop().create_future()
+        try:
+            value = await load(rate_limit.INTERACTIVE)
+            if value is not None:
+                await cache_write(cache, cache.set_revalidated, key, value, ttl, max_stale)
+            flight.set_result(value)
+        except Exception as e:
+            flight.set_exception(e)
+            # Waiters see the error; mark it retrieved so an unwaited flight does not warn
+            flight.exception()
+            raise
+        finally:
+            if not flight.done():
+                # The loading request was cancelled (client went away); let waiters retry
+                flight.cancel()
+            self._flights.pop(flight_key, None)
+        return value, False
+
+    async def _refresh(self, cache: TTLCache, key: str, load, ttl: float, max_stale: float,
+                       level: int) -> None:
+        try:
+            value = await load(level)
+            if value is not None:
+                await cache_write(cache, cache.set_revalidated, key, value, ttl, max_stale)
+        except Exception as e:
+            print(f"Background refresh of {cache.name} entry {key} failed: {e}")
+        finally:
+            self._refreshing.discard((cache.name, key))
+
+    async def geocode_location(self, location_query: str, deadline: float = None) -> dict:
+        """
+        Async MBTAStationFinder.geocode_location.
+
+        Args:
+            location_query: A string containing an address, landmark, or place name
+            deadline: Optional time.monotonic() value by which Mapbox must have answered
+
+        Returns:
+            dict: longitude, latitude and address, or None if the location could not be geocoded
+        """
+        finder = self.finder
+        if finder.gazetteer is not None:
+            local = finder.gazetteer.lookup(location_query)
+            if local is not None:
+                return local
+
+        cache_key = normalize_query(location_query)
+        if finder.geocode_cache is not None:
+            cached = await cache_get(finder.geocode_cache, cache_key)
+            if cached is not None:
+                return dict(cached)
+
+        url, params = finder._geocode_request(location_query)
+        try:
+            remaining = None if deadline is None else max(0.001, deadline - time.monotonic())
+            location = finder._parse_geocode(await self.client.get_json(url, params, deadline=remaining))
+            if location is not None and finder.geocode_cache is not None:
+                await cache_write(finder.geocode_cache, finder.geocode_cache.set, cache_key, location)
+            return location
+        except Exception as e:
+            print(f"Geocoding error: {e}")
+            return None
+
+    async def find_nearest_station(self, latitude: float, longitude: float, deadline: float = None) -> dict:
+        """
+        Async MBTAStationFinder.find_nearest_station (without routes).
+
+        The station index answers in microseconds, so it is queried directly;
+        only the MBTA-side fallback used while it loads runs off the loop.
+
+        Args:
+            latitude: The latitude coordinate
+            longitude: The longitude coordinate
+            deadline: Optional time.monotonic() value by which the MBTA fallback must have answered
+
+        Returns:
+            dict: The nearest station, or None if no station could be found
+        """
+        finder = self.finder
+        index = finder.station_index
+        if index is not None and index.loaded and index.covers((0, 1)):
+            return finder.find_nearest_station(latitude, longitude, include_routes=False)
+        return await asyncio.to_thread(finder.find_nearest_station, latitude, longitude, False, deadline)
+
+    async def get_station_routes(self, station_id: str) -> list:
+        """
+        Load a station's routes into the upstream cache, as MBTAStationFinder._get_station_routes does.
+
+        Args:
+            station_id: The MBTA station ID
+
+        Returns:
+            list: Routes serving this station, with ID, name, and color
+        """
+        finder = self.finder
+        if finder.gtfs_store is not None and finder.gtfs_store.routes_at_stop(station_id):
+            return finder._get_station_routes(station_id)
+        url, params = finder._routes_request(station_id)
+
+        async def load(level):
+            return finder._parse_routes(await self.client.get_json(url, params, priority=level))
+
+        try:
+            fresh, max_stale = self.routes_ttl
+            routes, _ = await self._revalidated(finder.upstream_cache, f"routes:{station_id}", load,
+                                                ttl=fresh, max_stale=max_stale)
+            return routes
+        except Exception as e:
+            print(f"Error getting routes: {e}")
+            return []
+
+    async def get_arrival_predictions(self, station_id: str, limit: int = 5) -> list:
+        """
+        Load a station's predictions into the upstream cache, as
+        MBTAStationFinder.get_arrival_predictions does.
+
+        Args:
+            station_id: The MBTA station ID
+            limit: Maximum number of predictions to return
+
+        Returns:
+            list: Upcoming arrivals, or [] when there are none or MBTA failed
+                  (the synchronous finder then falls back to the timetable)
+        """
+        finder = self.finder
+        if finder.prediction_store is not None and finder.prediction_store.ready:
+            return finder.get_arrival_predictions(station_id, limit)
+        url, params = finder._predictions_request(station_id, limit)
+
+        async def load(level):
+            return finder._parse_predictions(await self.client.get_json(url, params, priority=level))
+
+        try:
+            fresh, max_stale = self.predictions_ttl
+            predictions, _ = await self._revalidated(finder.upstream_cache,
+                                                     finder._predictions_key(station_id, limit), load,
+                                                     ttl=fresh, max_stale=max_stale)
+            return predictions
+        except Exception as e:
+            print(f"Error getting predictions: {e}")
+            return []
+
+    async def get_station_arrivals(self, station_id: str) -> list:
+        """
+        Load a station's next hour of arrivals into the upstream cache, as
+        mbta_helper.get_station_arrivals does.
+
+        Args:
+            station_id: The MBTA station ID
+
+        Returns:
+            list: Arrival dictionaries, or [] when MBTA failed
+        """
+        if mbta_helper.get_prediction_store().ready:
+            return []
+
+        async def load(level):
+            url = mbta_helper._station_arrivals_url(station_id)
+            return mbta_helper._parse_station_arrivals(await self.client.get_json(url, priority=level))
+
+        try:
+            arrivals, _ = await self._revalidated(get_upstream_cache(), f"station_arrivals:{station_id}", load,
+                                                  ttl=mbta_helper.PREDICTIONS_FRESH_TTL,
+                                                  max_stale=mbta_helper.PREDICTIONS_MAX_STALE)
+            return arrivals
+        except Exception as e:
+            print(f"Error fetching arrivals for {station_id}: {e}")
+            return []
+
+    async def warm_search(self, location_query: str, deadline: float) -> None:
+        """
+        Make every upstream answer a /find_station search needs available in the caches.
+
+        Geocoding and the nearest station come first; the station's routes
+        (if not known locally) and predictions are then awaited together.
+        Whatever has not arrived by the deadline is left to the view.
+
+        Args:
+            location_query: The searched address, landmark, or place name
+            deadline: time.monotonic() value by which results are needed
+        """
+        location = await self.geocode_location(location_query, deadline)
+        if location is None:
+            return
+        station = await self.find_nearest_station(location["latitude"], location["longitude"], deadline)
+        if station is None:
+            return
+        calls = [self.get_arrival_predictions(station["id"])]
+        if not station["routes"]:
+            calls.append(self.get_station_routes(station["id"]))
+        try:
+            await asyncio.wait_for(asyncio.gather(*calls), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            print(f"Predictions for {station['id']} missed the request deadline")
+
+    async def warm_journey(self, origin_query: str, destination_query: str) -> None:
+        """
+        Geocode both ends of a journey concurrently so planning it needs no upstream call.
+
+        Args:
+            origin_query: Where the journey starts
+            destination_query: Where the journey ends
+        """
+        await asyncio.gather(self.geocode_location(origin_query), self.geocode_location(destination_query))
+
@@ -0,0 +1,179 @@
+"""
+Non-blocking counterpart of http_client for the ASGI entry point
+
+Uses httpx when it is installed (`pip install httpx`), so an in-flight
+upstream call costs a coroutine rather than a thread. Without httpx, calls
+run on the shared synchronous client in a bounded thread pool: correct, but
+concurrency is again capped by that pool. Either way the circuit breakers
+and rate limit budget are the ones the synchronous client uses, so both
+serving modes see the same upstream state.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit
+
+import requests
+
+import http_client
+import metrics
+import rate_limit
+
+try:
+    import httpx
+except ImportError:  # Optional: fall back to the thread pool
+    httpx = None
+
+
+class AsyncHTTPClient:
+    """
+    Awaitable GETs with the retry, deadline, circuit breaker and rate limit
+    behaviour of http_client.HTTPClient.
+    """
+
+    def __init__(self, client: http_client.HTTPClient, max_connections: int = 200,
+                 fallback_workers: int = 64):
+        """
+        Initialize an AsyncHTTPClient.
+
+        Args:
+            client: Synchronous client whose settings, breakers and budgets are shared
+            max_connections: Connection limit of the httpx pool
+            fallback_workers: Threads used for upstream calls when httpx is not installed
+        """
+        self.client = client
+        self.max_connections = max_connections
+        self.fallback_workers = fallback_workers
+        self._sessions = {}  # event loop -> httpx.AsyncClient
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def non_blocking(self) -> bool:
+        """True when upstream calls run on httpx rather than in threads."""
+        return httpx is not None
+
+    def _session(self):
+        # httpx clients are bound to the event loop that created them
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None:
+            connect_timeout, read_timeout = self.client.timeout
+            session = self._sessions[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                headers={"Accept-Encoding": "gzip, deflate"})
+        return session
+
+    async def get_json(self, url: str, params: dict = None, deadline: float = None,
+                       priority: int = rate_limit.INTERACTIVE) -> dict:
+        """
+        GET a URL and decode its JSON body.
+
+        Args:
+            url: Absolute URL to request
+            params: Optional query string parameters
+            deadline: Optional seconds allowed for the whole call, including retries
+            priority: rate_limit priority class (coroutines share a thread, so it is
+                      passed explicitly rather than read from the thread)
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            requests.RequestException: On connection failure, an error status,
+                an open circuit or an exhausted budget, as with HTTPClient.get_json
+        """
+        if httpx is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.fallback_workers,
+                                                        thread_name_prefix="async-http")
+            call = partial(self.client.get_json, url, params=params, deadline=deadline, priority=priority)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        with metrics.timer("upstream_request_duration", endpoint=http_client._endpoint_label(url)):
+            response = await self._get(url, params, deadline, priority)
+        if response.status_code >= 400:
+            raise requests.HTTPError(f"{response.status_code} Error for url: {url}")
+        return response.json()
+
+    async def _acquire(self, bucket, level: int, timeout: float) -> bool:
+        # Take a token without blocking the loop; only wait in a thread if the bucket is short
+        if bucket.acquire(level, 0.0):
+            return True
+        if timeout <= 0:
+            return False
+        return await asyncio.to_thread(bucket.acquire, level, timeout)
+
+    async def _get(self, url: str, params: dict, deadline: float, level: int):
+        client = self.client
+        host = urlsplit(url).netloc
+        breaker = client.breaker(url)
+        bucket = client.rate_limits.get(host)
+        give_up_at = time.monotonic() + (deadline or client.deadline)
+        for attempt in range(client.retries + 1):
+            remaining = give_up_at - time.monotonic()
+            if bucket is not None and not await self._acquire(bucket, level, max(0.0, remaining)):
+                raise http_client.BudgetExhaustedError(
+                    f"Request budget for {host} spent for {rate_limit.PRIORITY_NAMES[level]} calls")
+            if attempt == 0 and not breaker.allow():
+                if bucket is not None:
+                    bucket.refund()
+                raise http_client.CircuitOpenError(f"Circuit open for {host}")
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                breaker.record_failure()
+                raise requests.Timeout(f"Deadline exceeded for {url}")
+            try:
+                response = await asyncio.wait_for(self._session().get(url, params=params), remaining)
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                if attempt == client.retries:
+                    breaker.record_failure()
+                    if isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError)):
+                        raise requests.Timeout(str(e) or f"Timed out fetching {url}") from e
+                    raise requests.ConnectionError(str(e)) from e
+            else:
+                if bucket is not None:
+                    bucket.update(response.headers, response.status_code)
+                if response.status_code == 429 and bucket is not None and attempt < client.retries:
+                    continue
+                if response.status_code not in http_client.RETRY_STATUSES or attempt == client.retries:
+                    if response.status_code in http_client.FAILURE_STATUSES:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return response
+            remaining = give_up_at - time.monotonic()
+            # "Full jitter", as in HTTPClient, without blocking the loop
+            await asyncio.sleep(max(0.0, min(remaining, random.uniform(0, client.backoff * (2 ** attempt)))))
+
+
+_async_client = None
+_async_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncHTTPClient:
+    """
+    Return the process-wide AsyncHTTPClient, creating it on first use.
+
+    Shares the synchronous client's settings, circuit breakers and rate limit
+    budget. Sized by ASYNC_HTTP_MAX_CONNECTIONS (httpx pool) and
+    ASYNC_HTTP_FALLBACK_THREADS (used when httpx is not installed).
+
+    Returns:
+        AsyncHTTPClient: The shared async client
+    """
+    global _async_client
+    with _async_lock:
+        if _async_client is None:
+            _async_client = AsyncHTTPClient(
+                http_client.get_client(),
+                max_connections=int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "200")),
+                fallback_workers=int(os.getenv("ASYNC_HTTP_FALLBACK_THREADS", "64")),
+            )
+        return _async_client
@@ -0,0 +1,192 @@
+"""
+Type-ahead suggestions for stations and places from a sorted-prefix index
+
+Every name is indexed under each of its word suffixes ("park street" is
+reachable from "park" and from "street"), so one bisect into a sorted list
+finds every candidate for a prefix. Station entries are diffed against the
+previous stop list on each station index reload and only changed stops are
+re-indexed.
+"""
+import threading
+from bisect import bisect_left, insort
+
+from cache import normalize_query
+from gazetteer import ABBREVIATIONS, get_gazetteer
+
+# Suggestions returned when the caller does not ask for a number
+DEFAULT_LIMIT = 8
+
+# Ranking weight of stations relative to gazetteer places (landmarks are 7-10)
+STATION_RANK = 8
+
+
+def _tokens(text: str, complete: bool = True) -> list:
+    """
+    Normalize text into tokens.
+
+    Abbreviations are expanded, except in a last token that is still being typed
+    ("park st" should keep matching "park street" and "park station").
+    """
+    tokens = normalize_query(text.replace("'", "")).split()
+    expand = len(tokens) if complete else len(tokens) - 1
+    return [ABBREVIATIONS.get(t, t) if i < expand else t for i, t in enumerate(tokens)]
+
+
+def _keys(entry_id: str, names: list) -> list:
+    """Index keys (suffix text, word position, entry ID) for an entry's names."""
+    keys = set()
+    for name in names:
+        tokens = _tokens(name)
+        for position in range(len(tokens)):
+            keys.add((" ".join(tokens[position:]), position, entry_id))
+    return sorted(keys)
+
+
+class AutocompleteIndex:
+    """
+    Ranked prefix lookups over MBTA stations and gazetteer places.
+
+    Readers use whichever (keys, entries) pair is current; writers build the
+    next pair from a copy and swap it in, so lookups never take a lock.
+    """
+
+    def __init__(self, places: list = ()):
+        """
+        Initialize an AutocompleteIndex.
+
+        Args:
+            places: Gazetteer place dictionaries (name, aliases, latitude,
+                    longitude, address, kind and rank)
+        """
+        entries, keys = {}, []
+        for i, place in enumerate(places):
+            entry_id = f"place:{i}"
+            entries[entry_id] = {
+                "id": None,
+                "name": place["name"],
+                "kind": place["kind"],
+                "latitude": place["latitude"],
+                "longitude": place["longitude"],
+                "detail": place["address"],
+                "rank": place["rank"],
+            }
+            keys.extend(_keys(entry_id, [place["name"]] + place["aliases"]))
+        keys.sort()
+        self._state = (keys, entries)
+        self._write_lock = threading.Lock()
+        self.lookups = 0
+
+    def __len__(self) -> int:
+        return len(self._state[1])
+
+    def suggest(self, query: str, limit: int = DEFAULT_LIMIT) -> list:
+        """
+        Suggest stations and places whose names contain a word starting with the query.
+
+        Matches at the start of a name rank above matches further in, then
+        higher-ranked and shorter names come first.
+
+        Args:
+            query: Partially typed text
+            limit: Maximum number of suggestions
+
+        Returns:
+            list: Suggestion dictionaries with id (station ID or None), name,
+                  kind, latitude, longitude and detail
+        """
+        keys, entries = self._state
+        prefix = " ".join(_tokens(query, complete=False))
+        if not prefix or limit <= 0:
+            return []
+        self.lookups += 1
+        best = {}   # entry ID -> earliest word position matched
+        for i in range(bisect_left(keys, (prefix,)), len(keys)):
+            text, position, entry_id = keys[i]
+            if not text.startswith(prefix):
+                break
+            if entry_id not in best or position < best[entry_id]:
+                best[entry_id] = position
+        ranked = sorted(best, key=lambda e: (best[e] > 0, -entries[e]["rank"],
+                                             len(entries[e]["name"]), entries[e]["name"]))
+        suggestions = []
+        for entry_id in ranked[:limit]:
+            entry = dict(entries[entry_id])
+            del entry["rank"]
+            suggestions.append(entry)
+        return suggestions
+
+    def update_stations(self, stops: list) -> tuple:
+        """
+        Bring the station entries in line with a freshly loaded stop list.
+
+        Only stops that were added, removed or changed have their keys
+        inserted or deleted; unchanged stops are left in place.
+
+        Args:
+            stops: Stop dictionaries with id, name, latitude, longitude and routes
+
+        Returns:
+            tuple: (stations added or changed, stations removed or changed)
+        """
+        with self._write_lock:
+            keys, entries = self._state
+            keys, entries = list(keys), dict(entries)
+            fresh = {}
+            for stop in stops:
+                fresh[f"station:{stop['id']}"] = {
+                    "id": stop["id"],
+                    "name": stop["name"],
+                    "kind": "station",
+                    "latitude": stop["latitude"],
+                    "longitude": stop["longitude"],
+                    "detail": ", ".join(stop.get("routes", ())),
+                    "rank": STATION_RANK,
+                }
+            stale = [e for e in entries if e.startswith("station:") and entries[e] != fresh.get(e)]
+            added = [e for e, entry in fresh.items() if entries.get(e) != entry]
+            for entry_id in stale:
+                for key in _keys(entry_id, [entries.pop(entry_id)["name"]]):
+                    i = bisect_left(keys, key)
+                    if i < len(keys) and keys[i] == key:
+                        del keys[i]
+            for entry_id in added:
+                entries[entry_id] = fresh[entry_id]
+                for key in _keys(entry_id, [fresh[entry_id]["name"]]):
+                    insort(keys, key)
+            self._state = (keys, entries)
+        return len(added), len(stale)
+
+    def on_station_index_load(self, station_index) -> None:
+        """StationIndex listener re-indexing stations after each reload."""
+        self.update_stations(station_index.stops())
+
+    def stats(self) -> dict:
+        """
+        Report index size and usage.
+
+        Returns:
+            dict: entries, keys and lookups
+        """
+        keys, entries = self._state
+        return {"entries": len(entries), "keys": len(keys), "lookups": self.lookups}
+
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+
+def get_autocomplete_index() -> AutocompleteIndex:
+    """
+    Return the process-wide AutocompleteIndex, creating it on first use.
+
+    Places come from the shared gazetteer; stations are added once the
+    index is registered as a StationIndex listener.
+
+    Returns:
+        AutocompleteIndex: The shared index instance
+    """
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = AutocompleteIndex(get_gazetteer().places)
+        return _shared_index
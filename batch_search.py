@@ -0,0 +1,247 @@
+"""
+Streaming batch resolution of many location queries to their nearest MBTA stations
+"""
+import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import rate_limit
+from cache import TTLCache, normalize_query
+from mbta_helper import find_stop_near
+
+_END = object()  # Marks the end of the input on BatchSearcher's inbox
+
+
+def query_text(item) -> str:
+    """
+    Get the query text of one batch input item.
+
+    Args:
+        item: A query string or number, or an object with a "query" member
+
+    Returns:
+        str: The query text, or None if the item holds no usable query
+    """
+    if isinstance(item, dict):
+        item = item.get("query")
+    if isinstance(item, bool) or not isinstance(item, (str, int, float)):
+        return None
+    return str(item)
+
+
+def iter_ndjson_queries(lines):
+    """
+    Parse NDJSON input lazily into (index, query) pairs.
+
+    Each line is either a JSON string or number or an object with a "query"
+    member; blank lines are skipped and lines that are not JSON are taken as
+    plain query text.
+
+    Args:
+        lines: Iterable of bytes or str lines
+
+    Yields:
+        tuple: Input position and query text (None for an invalid item)
+    """
+    index = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = line
+        yield index, query_text(item)
+        index += 1
+
+
+class BatchSearcher:
+    """
+    Resolves a stream of location queries with bounded memory and concurrency.
+
+    Duplicate queries (after normalization) are geocoded once, geocoding runs
+    on a fixed-size thread pool with a bounded number of requests in flight,
+    and geocoded points are matched to stations in chunks against the local
+    station index. A chunk is resolved once it is full, once its oldest point
+    has waited flush_interval, or as soon as the input stalls, so results are
+    yielded as they become ready and output order follows completion rather
+    than input order.
+    """
+
+    def __init__(self, station_finder, station_index, max_workers: int = 8,
+                 chunk_size: int = 64, dedupe_size: int = 10000, flush_interval: float = 0.1):
+        """
+        Initialize a BatchSearcher.
+
+        Args:
+            station_finder: MBTAStationFinder used for geocoding
+            station_index: StationIndex used for bulk nearest-station lookups
+            max_workers: Concurrent geocoding requests
+            chunk_size: Geocoded points resolved per station lookup
+            dedupe_size: Recently resolved queries remembered for de-duplication
+            flush_interval: Seconds a geocoded point may wait for its chunk to fill
+        """
+        self.station_finder = station_finder
+        self.station_index = station_index
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.dedupe_size = dedupe_size
+        self.flush_interval = flush_interval
+
+    def _resolve_chunk(self, chunk: list) -> list:
+        """Match geocoded (key, query, location) entries to their nearest stations."""
+        if self.station_index is not None and self.station_index.loaded:
+            stations = self.station_index.nearest_many(
+                [(location["latitude"], location["longitude"]) for _, _, location in chunk],
+                route_types=(0, 1))
+        else:
+            stations = [None] * len(chunk)
+
+        results = []
+        for (key, query, location), station in zip(chunk, stations):
+            if station is None:
+                # Index not loaded yet; find_stop_near reuses the cached geocode
+                with rate_limit.priority(rate_limit.BATCH):
+                    found = find_stop_near(query, ["0", "1"])
+                if found:
+                    name, accessible, station_id, lat, lon = found[:5]
+                    station = {"id": station_id, "name": name, "latitude": lat, "longitude": lon,
+                               "wheelchair_boarding": 1 if accessible else 0,
+                               "distance": self.station_finder.calculate_distance(
+                                   location["latitude"], location["longitude"], lat, lon)}
+            if station is None:
+                results.append((key, {"status": "no_station", "address": location["address"]}))
+                continue
+            results.append((key, {
+                "status": "ok",
+                "address": location["address"],
+                "latitude": location["latitude"],
+                "longitude": location["longitude"],
+                "station": {
+                    "id": station["id"],
+                    "name": station["name"],
+                    "latitude": station["latitude"],
+                    "longitude": station["longitude"],
+                    "wheelchair_accessible": station["wheelchair_boarding"] == 1,
+                },
+                "distance": station["distance"],
+            }))
+        return results
+
+    def _read(self, queries, inbox: queue.Queue, closed: threading.Event) -> None:
+        """Move input items onto the bounded inbox until it ends or the run is abandoned."""
+        def put(item):
+            while not closed.is_set():
+                try:
+                    inbox.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for item in queries:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(e)  # Re-raised by run() once the results read so far are out
+        put(_END)
+
+    def run(self, queries):
+        """
+        Resolve queries, yielding one result dictionary per input query.
+
+        Input is read on a separate thread, so results that are ready keep
+        flowing while the caller's input is slow to arrive.
+
+        Args:
+            queries: Iterable of (index, query text) pairs, with None for invalid items
+
+        Yields:
+            dict: Result with the input index and query, a status of "ok",
+                  "not_found", "no_station", "error" or "invalid", and station details
+        """
+        resolved = TTLCache(maxsize=self.dedupe_size, ttl=24 * 3600, name="batch")
+        waiting = {}   # normalized query -> list of (index, query) awaiting its result
+        futures = {}   # geocoding future -> (normalized query, query)
+        geocoded = []  # (normalized query, query, location) awaiting station lookup
+        max_in_flight = self.max_workers * 2
+        first_geocoded = [0.0]  # time.monotonic() when the oldest entry of geocoded arrived
+
+        def finish(key, result):
+            resolved.set(key, result)
+            for index, query in waiting.pop(key, ()):
+                yield dict(result, index=index, query=query)
+
+        def drain(block: bool):
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED) if block else (
+                [f for f in futures if f.done()], None)
+            for future in done:
+                key, query = futures.pop(future)
+                try:
+                    location = future.result()
+                except Exception as e:
+                    yield from finish(key, {"status": "error", "error": str(e)})
+                    continue
+                if location is None:
+                    yield from finish(key, {"status": "not_found"})
+                else:
+                    if not geocoded:
+                        first_geocoded[0] = time.monotonic()
+                    geocoded.append((key, query, location))
+            if len(geocoded) >= self.chunk_size or (
+                    geocoded and time.monotonic() - first_geocoded[0] >= self.flush_interval):
+                yield from flush()
+
+        def flush():
+            chunk = geocoded[:]
+            del geocoded[:]
+            for key, result in self._resolve_chunk(chunk):
+                yield from finish(key, result)
+
+        inbox = queue.Queue(maxsize=max_in_flight)
+        closed = threading.Event()
+        threading.Thread(target=self._read, args=(queries, inbox, closed),
+                         name="batch-input", daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as pool:
+                while True:
+                    try:
+                        item = inbox.get(timeout=self.flush_interval if futures or geocoded else None)
+                    except queue.Empty:
+                        # Input stalled: hand over whatever is ready instead of waiting for more
+                        yield from drain(block=False)
+                        yield from flush()
+                        continue
+                    if item is _END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    index, query = item
+                    if query is None:
+                        yield {"index": index, "status": "invalid"}
+                        continue
+                    key = normalize_query(query)
+                    if not key:
+                        yield {"index": index, "query": query, "status": "not_found"}
+                        continue
+                    cached = resolved.get(key)
+                    if cached is not None:
+                        yield dict(cached, index=index, query=query)
+                        continue
+                    if key in waiting:
+                        waiting[key].append((index, query))
+                        continue
+                    waiting[key] = [(index, query)]
+                    futures[pool.submit(self.station_finder.geocode_location, query)] = (key, query)
+                    yield from drain(block=len(futures) >= max_in_flight)
+                while futures:
+                    yield from drain(block=True)
+                yield from flush()
+        finally:
+            closed.set()
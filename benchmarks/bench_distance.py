@@ -0,0 +1,74 @@
+"""
+Microbenchmark: scalar calculate_distance versus the batch distance engine
+
+Times one origin against N stations and M origins against N stations,
+with NumPy (if installed) and with the pure-Python fallback.
+
+    python benchmarks/bench_distance.py [--stations N] [--origins M] [--repeat R]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import distance  # noqa: E402
+from app import MBTAStationFinder  # noqa: E402
+
+
+def random_points(count: int, seed: int) -> tuple:
+    """Random coordinates over the Greater Boston area."""
+    rng = random.Random(seed)
+    lats = [42.2 + rng.random() * 0.3 for _ in range(count)]
+    lons = [-71.3 + rng.random() * 0.4 for _ in range(count)]
+    return lats, lons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stations", type=int, default=8000)
+    parser.add_argument("--origins", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lats, lons = random_points(args.stations, 1)
+    origin_lats, origin_lons = random_points(args.origins, 2)
+    finder = MBTAStationFinder(None)
+
+    def scalar_one():
+        return [finder.calculate_distance(origin_lats[0], origin_lons[0], lat, lon)
+                for lat, lon in zip(lats, lons)]
+
+    def scalar_matrix():
+        return [[finder.calculate_distance(olat, olon, lat, lon) for lat, lon in zip(lats, lons)]
+                for olat, olon in zip(origin_lats, origin_lons)]
+
+    def batch_one():
+        return distance.distances_from(origin_lats[0], origin_lons[0], lats, lons)
+
+    def batch_matrix():
+        return distance.distance_matrix(origin_lats, origin_lons, lats, lons)
+
+    def best(func):
+        return min(timeit.repeat(func, number=1, repeat=args.repeat)) * 1000
+
+    numpy_module = distance.np
+    results = [("scalar calculate_distance", best(scalar_one), best(scalar_matrix))]
+    if numpy_module is not None:
+        results.append(("batch (NumPy)", best(batch_one), best(batch_matrix)))
+    distance.np = None
+    try:
+        results.append(("batch (pure Python)", best(batch_one), best(batch_matrix)))
+    finally:
+        distance.np = numpy_module
+
+    print(f"{args.stations} stations, {args.origins} origins (best of {args.repeat}, ms)")
+    print(f"{'implementation':<28} {'1 x N':>10} {'M x N':>10}")
+    for name, one, matrix in results:
+        print(f"{name:<28} {one:>10.2f} {matrix:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Journey planner benchmark over typical Boston origin-destination pairs
+
+Builds a GTFS store from the fixture routes (or uses a real one built with
+`python gtfs_store.py build MBTA_GTFS.zip mbta_gtfs.bin`), then times
+JourneyPlanner.plan for each pair at a morning-peak departure.
+
+    python benchmarks/bench_journey.py [--store mbta_gtfs.bin] [--depart 08:30] [--repeat 50]
+                                       [--save out.json] [--baseline out.json --tolerance 0.25]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gtfs_store import AGENCY_TZ, GTFSStore, build_store  # noqa: E402
+from journey_planner import JourneyPlanner  # noqa: E402
+from report import check_baseline, percentile, print_table, write_json  # noqa: E402
+from stub_server import Fixtures  # noqa: E402
+
+# Commutes, errands and cross-town trips riders actually make
+PAIRS = [
+    ("harvard university", "boston common"),
+    ("somerville", "south end"),
+    ("fenway park", "north end"),
+    ("kendall square", "northeastern university"),
+    ("jamaica plain", "mit"),
+    ("coolidge corner", "faneuil hall"),
+    ("revere beach", "boston college"),
+    ("chinatown", "td garden"),
+    ("boston public library", "new england aquarium"),
+    ("museum of fine arts", "harvard university"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--store", help="GTFS store file (default: built from the fixtures)")
+    parser.add_argument("--depart", default="08:30", help="departure time, HH:MM today")
+    parser.add_argument("--repeat", type=int, default=50, help="queries per pair")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="fail if any p95 regressed against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    fixtures = Fixtures()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.store
+        if path is None:
+            path = os.path.join(tmp, "fixtures_gtfs.bin")
+            fixtures.write_gtfs(os.path.join(tmp, "fixtures_gtfs.zip"))
+            build_store(os.path.join(tmp, "fixtures_gtfs.zip"), path)
+        planner = JourneyPlanner(GTFSStore(path))
+        started = time.perf_counter()
+        planner.build()
+        print(f"timetable build: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        hour, minute = (int(part) for part in args.depart.split(":"))
+        depart = datetime.now(AGENCY_TZ).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        rows = []
+        for origin, destination in PAIRS:
+            a, b = fixtures.places[origin], fixtures.places[destination]
+            points = ((a["latitude"], a["longitude"]), (b["latitude"], b["longitude"]))
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                journeys = planner.plan(*points, depart)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            fastest = journeys[0] if journeys else None
+            rows.append({
+                "pair": f"{origin} -> {destination}",
+                "journeys": len(journeys),
+                "minutes": fastest["duration_minutes"] if fastest else 0,
+                "transfers": fastest["transfers"] if fastest else 0,
+                "p50_ms": percentile(timings, 0.50) * 1000,
+                "p95_ms": percentile(timings, 0.95) * 1000,
+            })
+    print_table(rows, [("pair", "pair", ""), ("journeys", "options", "d"), ("minutes", "min", "d"),
+                       ("transfers", "xfers", "d"), ("p50_ms", "p50 ms", ".2f"), ("p95_ms", "p95 ms", ".2f")])
+
+    if args.save:
+        write_json(args.save, rows)
+    if args.baseline:
+        regressions = check_baseline(rows, args.baseline, ("pair",), "p95_ms", args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
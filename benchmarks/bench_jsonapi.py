@@ -0,0 +1,108 @@
+"""
+Benchmark JSON:API "included" resolution on large predictions payloads
+
+Compares the previous linear scan over "included" with jsonapi.Document,
+and times mbta_helper.get_station_arrivals end to end on the same payload.
+
+    python benchmarks/bench_jsonapi.py [--predictions N] [--repeat R]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jsonapi  # noqa: E402
+import mbta_helper  # noqa: E402
+
+
+def make_payload(predictions: int, routes: int = 12) -> dict:
+    """
+    Build a predictions response shaped like include=trip,route,stop at a busy hub.
+
+    Args:
+        predictions: Number of predictions (each with its own trip)
+        routes: Number of distinct routes serving the stop
+
+    Returns:
+        dict: A JSON:API payload
+    """
+    data, included = [], []
+    for r in range(routes):
+        included.append({"type": "route", "id": f"R{r}",
+                         "attributes": {"short_name": f"R{r}", "long_name": f"Route {r}", "type": 3}})
+    for s in range(4):
+        included.append({"type": "stop", "id": f"S{s}", "attributes": {"name": f"Platform {s}"}})
+    for p in range(predictions):
+        included.append({"type": "trip", "id": f"T{p}", "attributes": {"headsign": f"Destination {p % 40}"}})
+        data.append({
+            "type": "prediction",
+            "id": f"P{p}",
+            "attributes": {"arrival_time": "2026-10-17T12:00:00-04:00", "status": None},
+            "relationships": {
+                "route": {"data": {"type": "route", "id": f"R{p % routes}"}},
+                "trip": {"data": {"type": "trip", "id": f"T{p}"}},
+                "stop": {"data": {"type": "stop", "id": f"S{p % 4}"}},
+            },
+        })
+    return {"data": data, "included": included}
+
+
+def resolve_linear(payload: dict) -> list:
+    """The pre-index approach: scan "included" for every relationship."""
+    results = []
+    for prediction in payload["data"]:
+        route_id = prediction["relationships"]["route"]["data"]["id"]
+        trip_id = prediction["relationships"]["trip"]["data"]["id"]
+        route_name = trip_headsign = None
+        for included in payload["included"]:
+            if included["type"] == "route" and included["id"] == route_id:
+                route_name = included["attributes"]["short_name"]
+        for included in payload["included"]:
+            if included["type"] == "trip" and included["id"] == trip_id:
+                trip_headsign = included["attributes"]["headsign"]
+        results.append((route_name, trip_headsign))
+    return results
+
+
+def resolve_indexed(payload: dict) -> list:
+    """Resolve the same relationships through jsonapi.Document."""
+    document = jsonapi.Document(payload)
+    results = []
+    for prediction in document.data:
+        route = document.related(prediction, "route")
+        trip = document.related(prediction, "trip")
+        results.append((route.attributes["short_name"], trip.attributes["headsign"]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--predictions", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'predictions':>12} {'linear ms':>10} {'indexed ms':>11} {'speedup':>8} {'helper ms':>10}")
+    for count in args.predictions:
+        payload = make_payload(count)
+        assert resolve_linear(payload) == resolve_indexed(payload)
+        number = max(1, 2000 // count)
+        linear = min(timeit.repeat(lambda: resolve_linear(payload), number=number, repeat=args.repeat)) / number
+        indexed = min(timeit.repeat(lambda: resolve_indexed(payload), number=number, repeat=args.repeat)) / number
+
+        # End to end through the helper (bypassing its cache), with the network call replaced by the payload
+        original = mbta_helper.http_client.get_json
+        mbta_helper.http_client.get_json = lambda url: payload
+        try:
+            helper = min(timeit.repeat(lambda: mbta_helper._fetch_station_arrivals("S0"),
+                                       number=number, repeat=args.repeat)) / number
+        finally:
+            mbta_helper.http_client.get_json = original
+
+        print(f"{count:>12} {linear * 1000:>10.3f} {indexed * 1000:>11.3f} "
+              f"{linear / indexed:>7.1f}x {helper * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
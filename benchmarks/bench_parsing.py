@@ -0,0 +1,145 @@
+"""
+Microbenchmarks for response parsing and distance functions on fixture payloads
+
+Times the pure-Python work between receiving an upstream response and having
+data ready to render, with the network replaced by stub fixture payloads.
+
+    python benchmarks/bench_parsing.py [--repeat R] [--save out.json] [--baseline out.json --tolerance 0.25]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import autocomplete  # noqa: E402
+import distance  # noqa: E402
+import gazetteer  # noqa: E402
+import http_client  # noqa: E402
+import jsonapi  # noqa: E402
+import mbta_helper  # noqa: E402
+from app import MBTAStationFinder  # noqa: E402
+from report import check_baseline, print_table, write_json  # noqa: E402
+from stub_server import Fixtures  # noqa: E402
+
+
+class NoCache:
+    """Upstream cache stand-in that always calls the loader, so every call parses."""
+
+    def get_or_revalidate(self, key, loader, ttl=None, max_stale=0):
+        return loader(), False
+
+
+class FakeResponse:
+    """Just enough of requests.Response for the finder's parsers."""
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> dict:
+        return self.payload
+
+
+def cases(fixtures: Fixtures) -> list:
+    """
+    Build (name, callable) pairs, each parsing one fixture payload.
+
+    Replaces http_client.get so the finder's parsers receive fixture payloads.
+
+    Returns:
+        tuple: (benchmarks in display order, payloads the helpers should be served)
+    """
+    station_ids = list(fixtures.stations)
+    busy = fixtures.predictions_payload(["place-parkstre", "place-governme"])
+    board = fixtures.predictions_payload(station_ids[:10])
+    stops = fixtures.stops_payload(latitude=42.35, longitude=-71.06, route_types="0,1", include_routes=True)
+    geocode = fixtures.geocode_payload("fenway park")
+    lats = [s["latitude"] for s in fixtures.stations.values()]
+    lons = [s["longitude"] for s in fixtures.stations.values()]
+    many_lats, many_lons = lats * 100, lons * 100
+    local = gazetteer.get_gazetteer()
+    suggester = autocomplete.AutocompleteIndex(local.places)
+    suggester.update_stations([dict(s, routes=fixtures.routes_at.get(s["id"], []))
+                               for s in fixtures.stations.values()])
+
+    finder = MBTAStationFinder("stub", upstream_cache=NoCache())
+    responses = {}
+    http_client.get = lambda url, params=None, **kwargs: FakeResponse(responses["payload"])
+
+    def finder_call(payload, func):
+        def call():
+            responses["payload"] = payload
+            return func()
+        return call
+
+    return [
+        ("jsonapi.Document (busy station)", lambda: jsonapi.Document(busy)),
+        ("jsonapi.Document (10-station board)", lambda: jsonapi.Document(board)),
+        ("helper arrivals parse", lambda: mbta_helper._fetch_station_arrivals("place-parkstre")),
+        ("helper nearest stations parse", lambda: mbta_helper.get_nearest_stations(42.35, -71.06, ["0", "1"])),
+        ("helper geocode parse", lambda: mbta_helper.get_lat_lng("fenway park")),
+        ("finder predictions parse", finder_call(busy, lambda: finder.get_arrival_predictions("place-parkstre"))),
+        ("finder bulk board parse", finder_call(board, lambda: finder.get_arrival_predictions_bulk(station_ids[:10]))),
+        ("finder geocode parse", finder_call(geocode, lambda: finder.geocode_location("fenway park"))),
+        ("gazetteer lookup (hit)", lambda: local.lookup("Boston Common, Boston, MA")),
+        ("gazetteer lookup (miss)", lambda: local.lookup("100 Tremont Street")),
+        ("autocomplete (\"h\")", lambda: suggester.suggest("h")),
+        ("autocomplete (\"park st\")", lambda: suggester.suggest("park st")),
+        ("distance.haversine_miles", lambda: distance.haversine_miles(42.35, -71.06, 42.37, -71.11)),
+        ("distance.distances_from (61)", lambda: distance.distances_from(42.35, -71.06, lats, lons)),
+        ("distance.distances_from (6100)", lambda: distance.distances_from(42.35, -71.06, many_lats, many_lons)),
+        ("distance.nearest_k (6100, k=5)", lambda: distance.nearest_k(42.35, -71.06, many_lats, many_lons, 5)),
+    ], {"busy": busy, "stops": stops, "geocode": geocode}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="fail if any case regressed against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    fixtures = Fixtures()
+    benchmarks, payloads = cases(fixtures)
+
+    # mbta_helper fetches through its own get_json/http_client.get_json; serve fixtures instead
+    def helper_json(url, params=None, **kwargs):
+        if "/predictions" in url:
+            return payloads["busy"]
+        if "/stops" in url:
+            return payloads["stops"]
+        return payloads["geocode"]
+    http_client.get_json = helper_json
+    mbta_helper.get_json = helper_json
+    mbta_helper.get_geocode_cache().clear()
+    mbta_helper.get_geocode_cache().ttl = 0
+    # Time the Mapbox parse, not the gazetteer shortcut
+    mbta_helper.get_gazetteer = gazetteer.Gazetteer
+
+    rows = []
+    # The helpers print diagnostics; keep them out of the table
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, func in benchmarks:
+            timer = timeit.Timer(func)
+            number, _ = timer.autorange()
+            best = min(timer.repeat(repeat=args.repeat, number=number)) / number
+            rows.append({"case": name, "us_per_call": best * 1e6, "calls_per_s": 1 / best})
+    print_table(rows, [("case", "case", ""), ("us_per_call", "us/call", ".2f"), ("calls_per_s", "calls/s", ",.0f")])
+
+    if args.save:
+        write_json(args.save, rows)
+    if args.baseline:
+        regressions = check_baseline(rows, args.baseline, ("case",), "us_per_call", args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
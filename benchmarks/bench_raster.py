@@ -0,0 +1,95 @@
+"""
+Nearest-station raster benchmark: raster lookups against the station index
+
+Loads the station index from the stub (or uses a raster built with
+`python station_raster.py build mbta_raster.bin` against the real stop set),
+then times nearest-stop queries at random points over the service area with
+and without the raster, and checks that both agree.
+
+    python benchmarks/bench_raster.py [--raster mbta_raster.bin] [--points 5000] [--cell-miles 0.1]
+                                      [--save out.json] [--baseline out.json --tolerance 0.25]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import StubServer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--raster", help="raster file (default: built from the fixture stops)")
+    parser.add_argument("--points", type=int, default=5000, help="random query points")
+    parser.add_argument("--cell-miles", type=float, default=0.1)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="fail if any p95 regressed against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    stub = StubServer().start()
+    os.environ["MBTA_API_URL"] = stub.url
+    from report import check_baseline, percentile, print_table, write_json
+    from station_index import StationIndex
+    from station_raster import StationRaster, build_raster
+
+    index = StationIndex()
+    index.load()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.raster
+        if path is None:
+            path = os.path.join(tmp, "fixtures_raster.bin")
+            started = time.perf_counter()
+            build_raster(index, path, args.cell_miles, args.k)
+            print(f"raster build: {(time.perf_counter() - started) * 1000:.0f} ms, "
+                  f"{os.path.getsize(path) / 1024:.0f} KiB")
+        raster = StationRaster(path)
+
+        random.seed(args.seed)
+        lats = [s["latitude"] for s in index.stops()]
+        lons = [s["longitude"] for s in index.stops()]
+        points = [(random.uniform(min(lats), max(lats)), random.uniform(min(lons), max(lons)))
+                  for _ in range(args.points)]
+
+        rows, answers = [], {}
+        for mode in ("index", "raster"):
+            index.attach_raster(raster if mode == "raster" else None)
+            timings, found = [], []
+            for latitude, longitude in points:
+                start = time.perf_counter()
+                nearest = index.nearest(latitude, longitude, k=1)
+                timings.append(time.perf_counter() - start)
+                found.append(nearest[0]["id"] if nearest else None)
+            answers[mode] = found
+            timings.sort()
+            rows.append({
+                "mode": mode,
+                "queries": len(points),
+                "p50_us": percentile(timings, 0.50) * 1e6,
+                "p95_us": percentile(timings, 0.95) * 1e6,
+                "raster_hit_rate": raster.hits / len(points) if mode == "raster" else 0.0,
+            })
+    stub.stop()
+    print_table(rows, [("mode", "mode", ""), ("queries", "queries", "d"), ("p50_us", "p50 us", ".1f"),
+                       ("p95_us", "p95 us", ".1f"), ("raster_hit_rate", "raster hits", ".1%")])
+    disagreements = sum(a != b for a, b in zip(answers["index"], answers["raster"]))
+    print(f"raster and index disagree on {disagreements} of {len(points)} points")
+
+    if args.save:
+        write_json(args.save, rows)
+    if args.baseline:
+        regressions = check_baseline(rows, args.baseline, ("mode",), "p95_us", args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions or disagreements else 0)
+    sys.exit(1 if disagreements else 0)
+
+
+if __name__ == "__main__":
+    main()
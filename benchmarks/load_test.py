@@ -0,0 +1,302 @@
+"""
+Offline load test: drive the Flask app against the local Mapbox/MBTA stub
+
+Starts the stub server and the app (threaded WSGI server, or with --server
+asgi the ASGI entry point under uvicorn) in this process, then issues
+requests to each endpoint at fixed concurrency levels and reports throughput
+and latency percentiles. Nothing leaves the machine.
+
+    python benchmarks/load_test.py [--concurrency 1 4 16] [--requests 200] [--latency-ms 40]
+                                   [--endpoints find_station arrivals ...] [--rate-limit 1000]
+                                   [--server wsgi|asgi|both] [--streams 0] [--save out.json]
+                                   [--baseline out.json --tolerance 0.25]
+
+To compare the serving modes, run both in one process, optionally with idle
+arrival streams held open against each while it is measured:
+
+    python benchmarks/load_test.py --concurrency 16 64 --server both --streams 200
+
+or save a WSGI run and check an ASGI run against it:
+
+    python benchmarks/load_test.py --concurrency 16 64 --save wsgi.json
+    python benchmarks/load_test.py --concurrency 16 64 --server asgi --baseline wsgi.json
+"""
+import argparse
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from report import check_baseline, percentile, print_table, write_json  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def start_app(stub_url: str, servers: tuple = ("wsgi",)):
+    """
+    Import the app wired to the stub and serve it on free local ports.
+
+    Args:
+        stub_url: Base URL of the running stub
+        servers: Any of "wsgi" (werkzeug's threaded server) and "asgi" (asgi.py under uvicorn)
+
+    Returns:
+        tuple: (app module, server name -> base URL of the app)
+    """
+    os.environ.update({
+        "MBTA_API_URL": stub_url,
+        "MAPBOX_API_URL": stub_url,
+        "MAPBOX_ACCESS_TOKEN": "stub",
+        "MAPBOX_TOKEN": "stub",
+        "MBTA_API_KEY": "stub",
+        "MBTA_STREAM_PREDICTIONS": "0",
+    })
+    os.environ.pop("GTFS_STORE_PATH", None)
+    os.environ.pop("GEOCODE_CACHE_PATH", None)
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    app_module.start_background_tasks()
+    deadline = time.monotonic() + 15
+    while not app_module.station_index.loaded and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if not app_module.station_index.loaded:
+        print("warning: station index did not load; searches will fall back to the stub API")
+
+    urls = {}
+    if "wsgi" in servers:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="app-server", daemon=True).start()
+        urls["wsgi"] = f"http://127.0.0.1:{server.server_port}"
+    if "asgi" in servers:
+        urls["asgi"] = _start_asgi()
+    return app_module, urls
+
+
+def _start_asgi() -> str:
+    import uvicorn
+    import asgi
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi.app, host="127.0.0.1", port=port, log_level="warning",
+                                           access_log=False))
+    # Signals can only be handled on the main thread
+    server.install_signal_handlers = lambda: None
+    threading.Thread(target=server.run, name="asgi-server", daemon=True).start()
+    deadline = time.monotonic() + 15
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def scenarios(stub: StubServer, unique_rate: float) -> dict:
+    """
+    Build one request factory per endpoint.
+
+    Each factory takes a random.Random and returns (method, path, kwargs)
+    for requests.Session.request.
+
+    Args:
+        stub: The running stub, whose fixtures supply queries and station IDs
+        unique_rate: Share of searches for never-seen addresses (geocode cache misses)
+    """
+    places = list(stub.fixtures.places)
+    station_ids = list(stub.fixtures.stations)
+    counter = iter(range(10 ** 9))
+
+    def query(rng):
+        if rng.random() < unique_rate:
+            return f"{next(counter)} Tremont Street"
+        return rng.choice(places)
+
+    return {
+        "index": lambda rng: ("GET", "/", {}),
+        "find_station": lambda rng: ("POST", "/find_station", {"data": {"location": query(rng)}}),
+        "arrivals": lambda rng: ("GET", f"/api/arrivals/{rng.choice(station_ids)}", {}),
+        "departures": lambda rng: ("GET", "/departures", {}),
+        "batch_search": lambda rng: ("POST", "/api/batch_search",
+                                     {"json": {"queries": [query(rng) for _ in range(20)]}}),
+    }
+
+
+def open_streams(base_url: str, station_ids: list, count: int) -> threading.Event:
+    """
+    Hold arrival streams open against the app, reading whatever they send.
+
+    Args:
+        base_url: Base URL of the app
+        station_ids: Stations to watch, spread round-robin over the streams
+        count: Number of streams
+
+    Returns:
+        threading.Event: Set it to close the streams
+    """
+    closed = threading.Event()
+    opened = threading.Semaphore(0)
+
+    def watch(station_id):
+        try:
+            with requests.get(f"{base_url}/api/arrivals/{station_id}/stream", stream=True, timeout=60) as response:
+                opened.release()
+                for _ in response.iter_lines():
+                    if closed.is_set():
+                        return
+        except requests.RequestException:
+            opened.release()
+
+    for i in range(count):
+        threading.Thread(target=watch, args=(station_ids[i % len(station_ids)],),
+                         name=f"stream-client-{i}", daemon=True).start()
+    for _ in range(count):
+        opened.acquire(timeout=30)
+    return closed
+
+
+def run(base_url: str, name: str, factory, concurrency: int, total: int, server: str = "wsgi") -> dict:
+    """
+    Issue `total` requests from `concurrency` workers and summarize them.
+
+    Every worker keeps its own cookie session seeded with a few searches,
+    so history-dependent pages (the departure board) have data to show.
+    """
+    latencies, errors = [], [0]
+    remaining = [total]
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        for place in ("fenway park", "harvard university", "td garden"):
+            session.post(f"{base_url}/find_station", data={"location": place})
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            method, path, kwargs = factory(rng)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=30, **kwargs)
+                response.content
+                failed = response.status_code >= 500
+            except requests.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "server": server,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def print_comparison(rows: list) -> None:
+    """Print ASGI results next to WSGI ones for every endpoint and concurrency level."""
+    results = {(row["server"], row["endpoint"], row["concurrency"]): row for row in rows}
+    pairs = []
+    for (server, endpoint, concurrency), wsgi in results.items():
+        asgi = results.get(("asgi", endpoint, concurrency))
+        if server != "wsgi" or asgi is None:
+            continue
+        pairs.append({"endpoint": endpoint, "concurrency": concurrency,
+                      "wsgi_rps": wsgi["rps"], "asgi_rps": asgi["rps"],
+                      "wsgi_p95_ms": wsgi["p95_ms"], "asgi_p95_ms": asgi["p95_ms"],
+                      "speedup": asgi["rps"] / wsgi["rps"] if wsgi["rps"] else 0.0})
+    print()
+    print_table(pairs, [("endpoint", "endpoint", ""), ("concurrency", "conc", "d"),
+                        ("wsgi_rps", "wsgi req/s", ".1f"), ("asgi_rps", "asgi req/s", ".1f"),
+                        ("wsgi_p95_ms", "wsgi p95 ms", ".1f"), ("asgi_p95_ms", "asgi p95 ms", ".1f"),
+                        ("speedup", "asgi/wsgi", ".2f")])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--endpoints", nargs="+", default=None)
+    parser.add_argument("--latency-ms", type=float, default=40, help="stub response latency")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="stub MBTA quota in requests per minute (0 for unlimited)")
+    parser.add_argument("--unique-rate", type=float, default=0.2, help="share of never-seen search queries")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server", choices=["wsgi", "asgi", "both"], default="wsgi",
+                        help="serve the app with werkzeug (WSGI), uvicorn (asgi.py) or each in turn")
+    parser.add_argument("--streams", type=int, default=0,
+                        help="idle arrival streams held open against the server being measured")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="fail if p95 regressed against this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    servers = ["wsgi", "asgi"] if args.server == "both" else [args.server]
+    if "asgi" in servers:
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            sys.exit("--server asgi needs uvicorn (and httpx for non-blocking upstream calls): "
+                     "pip install uvicorn httpx")
+
+    random.seed(args.seed)
+    stub = StubServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                      rate_limit=args.rate_limit).start()
+    _, urls = start_app(stub.url, servers)
+    factories = scenarios(stub, args.unique_rate)
+    names = args.endpoints or list(factories)
+
+    print(f"stub latency {args.latency_ms:.0f}+{args.jitter_ms:.0f} ms, "
+          f"{args.requests} requests per endpoint and concurrency level, {args.streams} open streams")
+    rows = []
+    for server in servers:
+        streams = open_streams(urls[server], list(stub.fixtures.stations), args.streams) if args.streams else None
+        for name in names:
+            for concurrency in args.concurrency:
+                rows.append(run(urls[server], name, factories[name], concurrency, args.requests, server))
+        if streams is not None:
+            streams.set()
+    print_table(rows, [("endpoint", "endpoint", ""), ("server", "server", ""), ("concurrency", "conc", "d"), ("requests", "reqs", "d"),
+                       ("errors", "errors", "d"), ("rps", "req/s", ".1f"), ("p50_ms", "p50 ms", ".1f"),
+                       ("p95_ms", "p95 ms", ".1f"), ("p99_ms", "p99 ms", ".1f")])
+    print(f"stub served {stub.requests} upstream requests ({stub.throttled} answered 429)")
+    if len(servers) > 1:
+        print_comparison(rows)
+
+    if args.save:
+        write_json(args.save, rows)
+    if args.baseline:
+        # A single-mode run is compared whichever mode the baseline was saved from
+        key_fields = ("server", "endpoint", "concurrency") if len(servers) > 1 else ("endpoint", "concurrency")
+        regressions = check_baseline(rows, args.baseline, key_fields, "p95_ms", args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
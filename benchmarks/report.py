@@ -0,0 +1,70 @@
+"""
+Shared result formatting and baseline comparison for the benchmark scripts
+"""
+import json
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+
+    Args:
+        sorted_values: Values in ascending order
+        q: Percentile between 0 and 1
+
+    Returns:
+        float: The percentile, or 0.0 for no values
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+def print_table(rows: list, columns: list) -> None:
+    """
+    Print dictionaries as an aligned text table.
+
+    Args:
+        rows: Result dictionaries
+        columns: (key, heading, format spec) triples
+    """
+    widths = [max(len(heading), *(len(format(row[key], spec)) for row in rows)) if rows else len(heading)
+              for key, heading, spec in columns]
+    print("  ".join(heading.rjust(width) for (_, heading, _), width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(format(row[key], spec).rjust(width)
+                        for (key, _, spec), width in zip(columns, widths)))
+
+
+def write_json(path: str, rows: list) -> None:
+    """Save results so a later run can be compared against them."""
+    with open(path, "w") as f:
+        json.dump(rows, f, indent=1)
+
+
+def check_baseline(rows: list, path: str, key_fields: tuple, metric: str, tolerance: float) -> list:
+    """
+    Compare results with a saved baseline run.
+
+    Args:
+        rows: Current results
+        path: JSON file written by an earlier run with --save
+        key_fields: Fields identifying the same measurement in both runs
+        metric: Field compared (lower is better)
+        tolerance: Allowed relative slowdown, e.g. 0.25 for 25%
+
+    Returns:
+        list: Human-readable descriptions of every regression beyond tolerance
+    """
+    with open(path) as f:
+        baseline = {tuple(row[k] for k in key_fields): row for row in json.load(f)}
+    regressions = []
+    for row in rows:
+        before = baseline.get(tuple(row[k] for k in key_fields))
+        if before is None or not before[metric]:
+            continue
+        change = row[metric] / before[metric] - 1
+        if change > tolerance:
+            label = " ".join(str(row[k]) for k in key_fields)
+            regressions.append(f"{label}: {metric} {before[metric]:.3f} -> {row[metric]:.3f} (+{change:.0%})")
+    return regressions
@@ -0,0 +1,438 @@
+"""
+Local stand-in for the Mapbox geocoding and MBTA V3 APIs
+
+Serves responses shaped like the real APIs from the fixtures in
+benchmarks/fixtures, with configurable latency and error injection, so the
+app can be exercised and benchmarked with no network access. Point the app at
+it with MBTA_API_URL and MAPBOX_API_URL. GET /predictions with
+Accept: text/event-stream replays fixtures/prediction_stream.txt (set
+MBTA_STREAM_URL to the stub as well to run the stream ingester against it).
+
+    python benchmarks/stub_server.py [--port 8765] [--latency-ms 40] [--jitter-ms 20] [--error-rate 0]
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import asin, cos, radians, sin, sqrt
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixtures() -> tuple:
+    """
+    Load the stop/route and gazetteer fixtures.
+
+    Returns:
+        tuple: (MBTA fixture dict, places dict keyed by lowercase name)
+    """
+    with open(os.path.join(FIXTURES, "mbta.json")) as f:
+        mbta = json.load(f)
+    with open(os.path.join(FIXTURES, "places.json")) as f:
+        places = json.load(f)
+    return mbta, places
+
+
+class Fixtures:
+    """
+    Builds API payloads from the fixture data.
+
+    Also used directly by the microbenchmarks, so parsing can be timed on
+    realistic payloads without any HTTP.
+    """
+
+    def __init__(self):
+        mbta, self.places = load_fixtures()
+        self.routes = {r["id"]: r for r in mbta["routes"]}
+        self.stations = {s["id"]: s for s in mbta["stations"]}
+        self.routes_at = {}
+        for route in mbta["routes"]:
+            for stop_id in route["stops"]:
+                self.routes_at.setdefault(stop_id, []).append(route["id"])
+
+    def _route_resource(self, route: dict) -> dict:
+        return {"type": "route", "id": route["id"], "attributes": {
+            "long_name": route["long_name"], "short_name": route["short_name"],
+            "type": route["type"], "color": route["color"],
+            "direction_destinations": [self.stations[route["stops"][-1]]["name"],
+                                       self.stations[route["stops"][0]]["name"]]}}
+
+    def _stop_resource(self, station: dict, distance: float = None) -> dict:
+        attributes = {"name": station["name"], "latitude": station["latitude"],
+                      "longitude": station["longitude"], "description": None,
+                      "wheelchair_boarding": station["wheelchair_boarding"], "location_type": 1}
+        if distance is not None:
+            attributes["distance"] = distance
+        return {"type": "stop", "id": station["id"], "attributes": attributes,
+                "relationships": {"route": {"data": [
+                    {"type": "route", "id": r} for r in self.routes_at.get(station["id"], [])]}}}
+
+    def routes_payload(self, route_types: str = None, stop_id: str = None) -> dict:
+        """Payload for GET /routes with filter[type] or filter[stop]."""
+        routes = list(self.routes.values())
+        if route_types:
+            wanted = {int(t) for t in route_types.split(",")}
+            routes = [r for r in routes if r["type"] in wanted]
+        if stop_id:
+            routes = [self.routes[r] for r in self.routes_at.get(stop_id, [])]
+        return {"data": [self._route_resource(r) for r in routes]}
+
+    def _platform_resource(self, station: dict, route_id: str) -> dict:
+        return {"type": "stop", "id": f"{station['id']}-{route_id}",
+                "attributes": {"name": station["name"], "platform_name": self.routes[route_id]["long_name"],
+                               "location_type": 0, "wheelchair_boarding": station["wheelchair_boarding"]},
+                "relationships": {"parent_station": {"data": {"type": "stop", "id": station["id"]}}}}
+
+    def stops_payload(self, route_id: str = None, latitude: float = None, longitude: float = None,
+                      route_types: str = None, include_routes: bool = False, stop_ids: list = None,
+                      include_children: bool = False) -> dict:
+        """Payload for GET /stops by route or ID, or sorted by distance from a point."""
+        if stop_ids:
+            stations = [self.stations[s] for s in stop_ids if s in self.stations]
+        elif route_id:
+            stations = [self.stations[s] for s in self.routes.get(route_id, {"stops": []})["stops"]]
+        else:
+            stations = list(self.stations.values())
+        if route_types:
+            wanted = {int(t) for t in route_types.split(",")}
+            stations = [s for s in stations
+                        if any(self.routes[r]["type"] in wanted for r in self.routes_at.get(s["id"], []))]
+        if latitude is not None and longitude is not None:
+            # Planar approximation is plenty for ordering stops within a city
+            miles = {s["id"]: ((s["latitude"] - latitude) ** 2 + (s["longitude"] - longitude) ** 2) ** 0.5 * 69
+                     for s in stations}
+            stations.sort(key=lambda s: miles[s["id"]])
+            data = [self._stop_resource(s, round(miles[s["id"]], 4)) for s in stations]
+        else:
+            data = [self._stop_resource(s) for s in stations]
+        payload = {"data": data}
+        if include_routes:
+            payload["included"] = [self._route_resource(r) for r in self.routes.values()]
+        if include_children:
+            # The platforms predictions are reported at, one per route
+            for stop, station in zip(data, stations):
+                children = [self._platform_resource(station, r) for r in self.routes_at.get(station["id"], [])]
+                stop["relationships"]["child_stops"] = {"data": [{"type": "stop", "id": c["id"]} for c in children]}
+                payload.setdefault("included", []).extend(children)
+        return payload
+
+    def predictions_payload(self, stop_ids: list, per_route: int = 4, now: datetime = None) -> dict:
+        """
+        Payload for GET /predictions with include=route,trip,stop.
+
+        Every route at each requested station gets per_route upcoming arrivals
+        at a child platform whose parent_station is the station.
+        """
+        now = now or datetime.now().astimezone()
+        data, included, seen = [], [], set()
+
+        def include(resource):
+            key = (resource["type"], resource["id"])
+            if key not in seen:
+                seen.add(key)
+                included.append(resource)
+
+        for stop_id in stop_ids:
+            station = self.stations.get(stop_id)
+            if station is None:
+                continue
+            seed = int(hashlib.md5(f"{stop_id}{now:%Y%m%d%H%M}".encode()).hexdigest()[:8], 16)
+            rng = random.Random(seed)
+            for route_id in self.routes_at.get(stop_id, []):
+                route = self.routes[route_id]
+                platform_id = f"{stop_id}-{route_id}"
+                include(self._route_resource(route))
+                include(self._platform_resource(station, route_id))
+                minutes = 0
+                for n in range(per_route):
+                    minutes += rng.randint(2, 9)
+                    trip_id = f"{route_id}-{stop_id}-{now:%H%M}-{n}"
+                    include({"type": "trip", "id": trip_id, "attributes": {
+                        "headsign": self.stations[route["stops"][0 if n % 2 else -1]]["name"],
+                        "direction_id": n % 2}})
+                    arrival = (now + timedelta(minutes=minutes)).isoformat(timespec="seconds")
+                    data.append({"type": "prediction", "id": f"prediction-{trip_id}", "attributes": {
+                        "arrival_time": arrival, "departure_time": arrival, "status": None,
+                        "direction_id": n % 2, "schedule_relationship": None},
+                        "relationships": {
+                            "route": {"data": {"type": "route", "id": route_id}},
+                            "stop": {"data": {"type": "stop", "id": platform_id}},
+                            "trip": {"data": {"type": "trip", "id": trip_id}}}})
+        data.sort(key=lambda p: p["attributes"]["arrival_time"])
+        return {"data": data, "included": included}
+
+    def prediction_stream(self) -> str:
+        """
+        Body for GET /predictions with Accept: text/event-stream.
+
+        A fixed feed of reset, add, update and remove events (including a
+        prediction that arrives before its platform stop), so a stream
+        consumer can be checked against a known end state.
+        """
+        with open(os.path.join(FIXTURES, "prediction_stream.txt")) as f:
+            return f.read()
+
+    def geocode_payload(self, query: str) -> dict:
+        """Payload for GET /geocoding/v5/mapbox.places/{query}.json."""
+        key = " ".join(query.lower().replace(",", " ").split())
+        place = self.places.get(key)
+        if place is None:
+            # Unknown queries land on a stable point in Greater Boston
+            digest = hashlib.md5(key.encode()).digest()
+            place = {"latitude": 42.30 + digest[0] / 255 * 0.12,
+                     "longitude": -71.16 + digest[1] / 255 * 0.14,
+                     "place_name": f"{query.title()}, Boston, Massachusetts, United States"}
+        coordinates = [place["longitude"], place["latitude"]]
+        return {"type": "FeatureCollection", "query": key.split(), "features": [{
+            "id": f"poi.{int(hashlib.md5(key.encode()).hexdigest()[:8], 16)}", "type": "Feature", "place_type": ["poi"],
+            "relevance": 1, "text": query, "place_name": place["place_name"],
+            "center": coordinates, "geometry": {"type": "Point", "coordinates": coordinates}}]}
+
+    def write_gtfs(self, path: str, headway_minutes: int = 8, first_hour: int = 5, last_hour: int = 25) -> None:
+        """
+        Write a GTFS static feed for the fixture routes.
+
+        Every route runs both ways every headway_minutes, every day, with
+        running times from the distance between stations at 22 mph plus a
+        30 second dwell. Platforms match the ones the predictions payload
+        reports: one child stop per station and route.
+
+        Args:
+            path: Output zip file
+            headway_minutes: Minutes between trips in each direction
+            first_hour: Hour of the first departures
+            last_hour: Hour after which no trip starts (may exceed 24)
+        """
+        def miles(a, b):
+            dlat, dlon = radians(b["latitude"] - a["latitude"]), radians(b["longitude"] - a["longitude"])
+            h = sin(dlat / 2) ** 2 + cos(radians(a["latitude"])) * cos(radians(b["latitude"])) * sin(dlon / 2) ** 2
+            return 2 * 3958.8 * asin(sqrt(h))
+
+        def clock(seconds):
+            return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+        tables = {
+            "stops.txt": [("stop_id", "stop_name", "stop_lat", "stop_lon", "location_type",
+                           "parent_station", "wheelchair_boarding")],
+            "routes.txt": [("route_id", "route_short_name", "route_long_name", "route_type", "route_color")],
+            "calendar.txt": [("service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+                              "saturday", "sunday", "start_date", "end_date")],
+            "trips.txt": [("route_id", "service_id", "trip_id", "trip_headsign", "direction_id")],
+            "stop_times.txt": [("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence")],
+        }
+        tables["calendar.txt"].append(("daily", 1, 1, 1, 1, 1, 1, 1, 20200101, 20991231))
+        for station in self.stations.values():
+            tables["stops.txt"].append((station["id"], station["name"], station["latitude"], station["longitude"],
+                                        1, "", station["wheelchair_boarding"]))
+            for route_id in self.routes_at.get(station["id"], []):
+                platform = self._platform_resource(station, route_id)
+                tables["stops.txt"].append((platform["id"], station["name"], station["latitude"],
+                                            station["longitude"], 0, station["id"], station["wheelchair_boarding"]))
+        for route in self.routes.values():
+            tables["routes.txt"].append((route["id"], route["short_name"], route["long_name"],
+                                         route["type"], route["color"]))
+            for direction, stop_ids in enumerate((route["stops"], route["stops"][::-1])):
+                stations = [self.stations[s] for s in stop_ids]
+                offsets = [0]
+                for a, b in zip(stations, stations[1:]):
+                    offsets.append(offsets[-1] + 30 + int(miles(a, b) / 22 * 3600))
+                for start in range(first_hour * 3600, last_hour * 3600, headway_minutes * 60):
+                    trip_id = f"{route['id']}-{direction}-{clock(start).replace(':', '')}"
+                    tables["trips.txt"].append((route["id"], "daily", trip_id, stations[-1]["name"], direction))
+                    for sequence, (station, offset) in enumerate(zip(stations, offsets), 1):
+                        arrival = start + offset
+                        tables["stop_times.txt"].append((trip_id, clock(arrival), clock(arrival + 20),
+                                                         f"{station['id']}-{route['id']}", sequence))
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, rows in tables.items():
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                archive.writestr(name, buffer.getvalue())
+
+
+class StubServer:
+    """
+    Threaded HTTP server answering Mapbox and MBTA requests from fixtures.
+    """
+
+    def __init__(self, port: int = 0, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, host: str = "127.0.0.1", rate_limit: int = 0):
+        """
+        Initialize a StubServer.
+
+        Args:
+            port: Port to listen on (0 picks a free one)
+            latency_ms: Fixed delay added to every response
+            jitter_ms: Extra uniformly random delay up to this many milliseconds
+            error_rate: Share of requests answered with 503
+            host: Interface to bind
+            rate_limit: MBTA requests allowed per minute, with x-ratelimit headers
+                        and 429s past it like the V3 API (0 for unlimited)
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.fixtures = Fixtures()
+        self.requests = 0
+        self.throttled = 0
+        self._window = (0, 0)  # (minute, MBTA requests in it)
+        self._window_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL to use for both MBTA_API_URL and MAPBOX_API_URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _quota(self, path: str) -> dict:
+        """Count an MBTA request against the per-minute quota and return its rate limit headers."""
+        if not self.rate_limit or path.startswith("/geocoding/"):
+            return {}
+        now = time.time()
+        with self._window_lock:
+            minute, used = self._window
+            if minute != int(now // 60):
+                minute, used = int(now // 60), 0
+            used += 1
+            self._window = (minute, used)
+        return {"x-ratelimit-limit": str(self.rate_limit),
+                "x-ratelimit-remaining": str(max(0, self.rate_limit - used)),
+                "x-ratelimit-reset": str((minute + 1) * 60),
+                "over": used > self.rate_limit}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                delay = stub.latency_ms + random.uniform(0, stub.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    return self._send(503, {"errors": [{"status": "503"}]})
+                parts = urlsplit(self.path)
+                quota = stub._quota(parts.path)
+                if quota.pop("over", False):
+                    stub.throttled += 1
+                    return self._send(429, {"errors": [{"status": "429"}]}, quota)
+                if parts.path == "/predictions" and "text/event-stream" in self.headers.get("Accept", ""):
+                    return self._send_stream(stub.fixtures.prediction_stream(), quota)
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                payload = stub.route(parts.path, query)
+                if payload is None:
+                    return self._send(404, {"errors": [{"status": "404"}]}, quota)
+                self._send(200, payload, quota)
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/vnd.api+json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, body, headers=None):
+                # Replay the whole feed, then close: the client sees the stream end and reconnects
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+                self.wfile.write(body.encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+    def route(self, path: str, query: dict) -> dict:
+        """
+        Build the payload for a request path and query string.
+
+        Args:
+            path: URL path
+            query: Query parameters (first value of each)
+
+        Returns:
+            dict: Response payload, or None for an unknown path
+        """
+        fixtures = self.fixtures
+        if path.startswith("/geocoding/v5/mapbox.places/"):
+            return fixtures.geocode_payload(unquote(path.rsplit("/", 1)[1])[:-len(".json")])
+        if path == "/routes":
+            return fixtures.routes_payload(query.get("filter[type]"), query.get("filter[stop]"))
+        if path == "/stops":
+            latitude, longitude = query.get("filter[latitude]"), query.get("filter[longitude]")
+            return fixtures.stops_payload(
+                route_id=query.get("filter[route]"),
+                latitude=float(latitude) if latitude else None,
+                longitude=float(longitude) if longitude else None,
+                route_types=query.get("filter[route_type]"),
+                include_routes="route" in query.get("include", "").split(","),
+                stop_ids=query["filter[id]"].split(",") if query.get("filter[id]") else None,
+                include_children="child_stops" in query.get("include", "").split(","))
+        if path == "/predictions":
+            payload = fixtures.predictions_payload(query.get("filter[stop]", "").split(","))
+            limit = int(query.get("page[limit]", 0))
+            if limit:
+                payload["data"] = payload["data"][:limit]
+            return payload
+        if path == "/schedules":
+            return {"data": [], "included": []}
+        return None
+
+    def start(self) -> "StubServer":
+        """Serve in a background thread and return self."""
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve in the calling thread until interrupted."""
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0, help="MBTA requests per minute (0 for unlimited)")
+    args = parser.parse_args()
+    stub = StubServer(args.port, args.latency_ms, args.jitter_ms, args.error_rate, rate_limit=args.rate_limit)
+    print(f"Serving Mapbox/MBTA stub at {stub.url} (MBTA_API_URL and MAPBOX_API_URL)")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
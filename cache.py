@@ -0,0 +1,612 @@
+"""
+Bounded caches shared by app.py and mbta_helper.py
+
+TTLCache is an in-process LRU. SharedCache keeps entries in a SQLite file
+(WAL mode) that every worker process on the host reads and writes, and
+TieredCache puts a small TTLCache in front of it: L1 hits cost a dict
+lookup, L1 misses are answered by whichever worker loaded the value first.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import rate_limit
+
+
+class _Flight:
+    """An in-progress load that concurrent callers for the same key wait on."""
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+# Marks a miss where None could be a cached value
+_MISSING = object()
+
+# SharedCache writes between sweeps of expired and excess rows
+SWEEP_EVERY = 256
+
+# Seconds a SharedCache connection waits on another worker's write lock
+BUSY_TIMEOUT = 2.0
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after a time-to-live.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, name: str = "cache"):
+        """
+        Initialize a TTLCache.
+
+        Args:
+            maxsize: Maximum number of entries before least recently used ones are evicted
+            ttl: Default time-to-live of an entry in seconds
+            name: Label used when reporting statistics
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        """
+        Look up a live entry and mark it as recently used.
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default if missing or expired
+        """
+        return self._lookup(key, default)
+
+    def get_local(self, key: str, default=None):
+        """
+        Look up a live entry held in this process, never reading a shared tier.
+
+        A hit is counted and marks the entry as recently used; a miss is not
+        counted, as the caller is expected to go on to get().
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default if this process holds no live entry
+        """
+        with self._lock:
+            value = self._peek_locked(key)
+            if value is _MISSING:
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _lookup(self, key: str, default=None):
+        """Counted lookup that takes the lock itself, so subclasses can do slow work outside it."""
+        with self._lock:
+            return self._get_locked(key, default)
+
+    def _peek_locked(self, key: str):
+        """Uncounted L1 lookup: the live value, or _MISSING."""
+        entry = self._data.get(key)
+        return entry[0] if entry is not None and entry[1] > time.time() else _MISSING
+
+    def _get_locked(self, key: str, default=None):
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def get_or_load(self, key: str, loader, ttl: float = None):
+        """
+        Return a cached value, calling loader at most once per key on a miss.
+
+        Concurrent callers that miss on the same key wait for the first
+        caller's load instead of each calling loader ("single-flight").
+        None results are returned but not cached.
+
+        Args:
+            key: Cache key
+            loader: Zero-argument callable producing the value
+            ttl: Optional time-to-live overriding the cache default
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value
+        with self._lock:
+            # Filled by a load that finished since the lookup
+            value = self._peek_locked(key)
+            if value is not _MISSING and value is not None:
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            if flight.value is not None:
+                self.set(key, flight.value, ttl)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+        return flight.value
+
+    def get_or_revalidate(self, key: str, loader, ttl: float = None, max_stale: float = 600) -> tuple:
+        """
+        Return a value, serving it stale while it is refreshed in the background.
+
+        Within ttl of being loaded a value is fresh. For max_stale seconds after
+        that it is still returned immediately, flagged as stale, while one
+        background thread calls loader to replace it; if that refresh fails the
+        stale value keeps being served. Only a key with no usable value blocks
+        on loader (single-flight, as in get_or_load).
+
+        Args:
+            key: Cache key
+            loader: Zero-argument callable producing the value; raises on failure
+            ttl: Seconds a loaded value counts as fresh, defaulting to the cache TTL
+            max_stale: Seconds past freshness a value may still be served
+
+        Returns:
+            tuple: (value, stale)
+        """
+        ttl = self.ttl if ttl is None else ttl
+
+        def load():
+            value = loader()
+            return None if value is None else {"value": value, "fresh_until": time.time() + ttl}
+
+        entry = self._lookup(key)
+        if entry is not None and entry["fresh_until"] <= time.time():
+            with self._lock:
+                if key not in self._inflight:
+                    flight = self._inflight[key] = _Flight()
+                    threading.Thread(target=self._revalidate, args=(key, flight, load, ttl + max_stale),
+                                     name=f"{self.name}-revalidate", daemon=True).start()
+        if entry is not None:
+            return entry["value"], entry["fresh_until"] <= time.time()
+        entry = self.get_or_load(key, load, ttl + max_stale)
+        return (None, False) if entry is None else (entry["value"], False)
+
+    def get_revalidated(self, key: str) -> tuple:
+        """
+        Look up a value stored by get_or_revalidate without loading or refreshing it.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            tuple: (value, stale), or None if there is no usable value
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return entry["value"], entry["fresh_until"] <= time.time()
+
+    def set_revalidated(self, key: str, value, ttl: float = None, max_stale: float = 600) -> None:
+        """
+        Store a value for get_or_revalidate as if it had just been loaded.
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value to store
+            ttl: Seconds the value counts as fresh, defaulting to the cache TTL
+            max_stale: Seconds past freshness the value may still be served
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self.set(key, {"value": value, "fresh_until": time.time() + ttl}, ttl + max_stale)
+
+    def _revalidate(self, key: str, flight: _Flight, load, ttl: float) -> None:
+        """Refresh one stale entry on behalf of the flight registered by get_or_revalidate."""
+        try:
+            # Callers are already being served the stale value, so this can wait for budget
+            with rate_limit.priority(rate_limit.BACKGROUND):
+                flight.value = load()
+            if flight.value is not None:
+                self.set(key, flight.value, ttl)
+        except Exception as e:
+            flight.error = e
+            print(f"Background refresh of {self.name} entry {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        """
+        Store a value, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value to store
+            ttl: Optional time-to-live overriding the cache default
+        """
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_locked(key, value, expires)
+
+    def _store_locked(self, key: str, value, expires: float) -> None:
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        """Remove an entry if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """
+        Report hit/miss counters for this cache.
+
+        Returns:
+            dict: Name, size, hits, misses, evictions and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SharedCache:
+    """
+    Cache table in a local SQLite file shared by every worker process.
+
+    The file is opened in WAL mode, so readers in one worker never wait on a
+    writer in another. Each thread keeps its own connection. Values are stored
+    as JSON with an absolute expiry; expired and excess rows (earliest expiry
+    first) are swept every SWEEP_EVERY writes. A failing database only costs
+    hits: errors are printed and treated as misses.
+    """
+
+    def __init__(self, path: str, name: str = "cache", maxsize: int = 65536, ttl: float = 3600):
+        """
+        Initialize a SharedCache, creating its table if needed.
+
+        Args:
+            path: SQLite file, shared by every process that should see the entries
+            name: Table name (letters, digits and underscores) and statistics label
+            maxsize: Rows kept after a sweep
+            ttl: Default time-to-live of an entry in seconds
+        """
+        if not re.fullmatch(r"\w+", name):
+            raise ValueError(f"Invalid shared cache name: {name!r}")
+        self.path = path
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._execute(f"CREATE TABLE IF NOT EXISTS {name} "
+                      "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit: every statement is its own short transaction
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _execute(self, sql: str, args: tuple = ()) -> list:
+        try:
+            return self._connection().execute(sql, args).fetchall()
+        except Exception as e:
+            self.errors += 1
+            print(f"Shared cache {self.name} error: {e}")
+            return None
+
+    def get_entry(self, key: str) -> tuple:
+        """
+        Look up a live entry with its expiry.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            tuple: (value, expires as a Unix time), or None if missing or expired
+        """
+        rows = self._execute(f"SELECT value, expires FROM {self.name} WHERE key = ? AND expires > ?",
+                             (key, time.time()))
+        if not rows:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(rows[0][0]), rows[0][1]
+
+    def get(self, key: str, default=None):
+        """
+        Look up a live entry.
+
+        Args:
+            key: Cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value, or default if missing or expired
+        """
+        entry = self.get_entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: str, value, ttl: float = None, expires: float = None) -> None:
+        """
+        Store a value for every worker.
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value to store
+            ttl: Optional time-to-live overriding the cache default
+            expires: Optional absolute expiry (Unix time), overriding ttl
+        """
+        if expires is None:
+            expires = time.time() + (self.ttl if ttl is None else ttl)
+        try:
+            body = json.dumps(value, separators=(",", ":"))
+        except (TypeError, ValueError) as e:
+            print(f"Shared cache {self.name} cannot store {key}: {e}")
+            return
+        self._execute(f"INSERT OR REPLACE INTO {self.name} (key, value, expires) VALUES (?, ?, ?)",
+                      (key, body, expires))
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self.sweep()
+
+    def sweep(self) -> None:
+        """Delete expired rows, then the earliest-expiring rows beyond maxsize."""
+        self._execute(f"DELETE FROM {self.name} WHERE expires <= ?", (time.time(),))
+        self._execute(f"DELETE FROM {self.name} WHERE key IN "
+                      f"(SELECT key FROM {self.name} ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                      (self.maxsize,))
+
+    def delete(self, key: str) -> None:
+        """Remove an entry if present."""
+        self._execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Remove every entry and reset the counters."""
+        self._execute(f"DELETE FROM {self.name}")
+        self.hits = self.misses = self.errors = 0
+
+    def __len__(self) -> int:
+        rows = self._execute(f"SELECT COUNT(*) FROM {self.name} WHERE expires > ?", (time.time(),))
+        return rows[0][0] if rows else 0
+
+    def stats(self) -> dict:
+        """
+        Report this worker's view of the shared table.
+
+        Returns:
+            dict: Name, size (live rows, all workers), and this worker's hits,
+                  misses, errors and hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class TieredCache(TTLCache):
+    """
+    TTLCache (L1, per process) in front of a SharedCache (L2, per host).
+
+    Lookups that miss L1 fall through to L2 and copy the entry into L1 with
+    its remaining lifetime; stores write through to both. Single-flight and
+    stale-while-revalidate work as in TTLCache, within each process.
+    """
+
+    def __init__(self, shared: SharedCache, maxsize: int = 256, ttl: float = 3600, name: str = None):
+        """
+        Initialize a TieredCache.
+
+        Args:
+            shared: The L2 SharedCache
+            maxsize: Entries kept in this process's L1
+            ttl: Default time-to-live of an entry in seconds
+            name: Label used when reporting statistics (defaults to the shared table name)
+        """
+        super().__init__(maxsize=maxsize, ttl=ttl, name=name or shared.name)
+        self.shared = shared
+        self.shared_hits = 0
+
+    def _lookup(self, key: str, default=None):
+        value = super()._lookup(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        # Read L2 without the lock, so L1 hits in other threads are not held up by SQLite
+        entry = self.shared.get_entry(key)
+        with self._lock:
+            value = self._peek_locked(key)
+            if value is _MISSING and entry is None:
+                return default
+            # Counted as a hit overall; shared_hits tells how many came from L2
+            self.misses -= 1
+            self.hits += 1
+            if value is not _MISSING:
+                # Another thread filled L1 while L2 was being read
+                return value
+            self.shared_hits += 1
+            self._store_locked(key, entry[0], entry[1])
+            return entry[0]
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        """
+        Store a value in this process and for every other worker.
+
+        Args:
+            key: Cache key
+            value: JSON-serializable value to store
+            ttl: Optional time-to-live overriding the cache default
+        """
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_locked(key, value, expires)
+        self.shared.set(key, value, expires=expires)
+
+    def delete(self, key: str) -> None:
+        """Remove an entry from both tiers."""
+        super().delete(key)
+        self.shared.delete(key)
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers and reset the counters."""
+        super().clear()
+        self.shared.clear()
+        self.shared_hits = 0
+
+    def stats(self) -> dict:
+        """
+        Report hit/miss counters for both tiers.
+
+        Returns:
+            dict: TTLCache statistics plus shared_hits and shared_size
+        """
+        stats = super().stats()
+        stats["shared_hits"] = self.shared_hits
+        stats["shared_size"] = len(self.shared)
+        return stats
+
+
+def make_cache(maxsize: int, ttl: float, name: str, shared_path: str = None):
+    """
+    Build a cache that is shared across workers when a shared cache file is configured.
+
+    Args:
+        maxsize: Entries kept (when tiered, in the shared file; each worker's
+                 L1 holds at most SHARED_CACHE_L1_SIZE of them)
+        ttl: Default time-to-live of an entry in seconds
+        name: Statistics label, also the shared table name
+        shared_path: SQLite file for the shared tier (defaults to SHARED_CACHE_PATH)
+
+    Returns:
+        TTLCache: A TieredCache over the shared file, or a plain TTLCache without one
+    """
+    shared_path = shared_path or os.getenv("SHARED_CACHE_PATH")
+    if not shared_path:
+        return TTLCache(maxsize=maxsize, ttl=ttl, name=name)
+    l1_size = min(maxsize, int(os.getenv("SHARED_CACHE_L1_SIZE", "256")))
+    return TieredCache(SharedCache(shared_path, name, maxsize=maxsize, ttl=ttl),
+                       maxsize=l1_size, ttl=ttl, name=name)
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize free-text search input so trivially different spellings share a key.
+
+    Args:
+        text: Raw location query
+
+    Returns:
+        str: Lowercased query with punctuation and repeated whitespace removed
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+_geocode_cache = None
+_geocode_lock = threading.Lock()
+
+
+def get_geocode_cache() -> TTLCache:
+    """
+    Return the process-wide geocoding cache, creating it on first use.
+
+    Configured with the GEOCODE_CACHE_SIZE and GEOCODE_CACHE_TTL environment
+    variables. Geocodes persist across restarts and are shared between
+    workers in GEOCODE_CACHE_PATH, or else SHARED_CACHE_PATH, when either is set.
+
+    Returns:
+        TTLCache: The shared geocode cache
+    """
+    global _geocode_cache
+    with _geocode_lock:
+        if _geocode_cache is None:
+            _geocode_cache = make_cache(
+                maxsize=int(os.getenv("GEOCODE_CACHE_SIZE", "2048")),
+                ttl=float(os.getenv("GEOCODE_CACHE_TTL", str(7 * 24 * 3600))),
+                name="geocode",
+                shared_path=os.getenv("GEOCODE_CACHE_PATH"),
+            )
+        return _geocode_cache
+
+
+_upstream_cache = None
+_upstream_lock = threading.Lock()
+
+
+def get_upstream_cache() -> TTLCache:
+    """
+    Return the process-wide cache of last good MBTA responses, creating it on first use.
+
+    Used with get_or_revalidate so an upstream outage serves the last known
+    data (flagged as stale) instead of nothing. Sized by UPSTREAM_CACHE_SIZE,
+    and shared between workers when SHARED_CACHE_PATH is set.
+
+    Returns:
+        TTLCache: The shared upstream cache
+    """
+    global _upstream_cache
+    with _upstream_lock:
+        if _upstream_cache is None:
+            _upstream_cache = make_cache(maxsize=int(os.getenv("UPSTREAM_CACHE_SIZE", "4096")),
+                                         ttl=60, name="upstream")
+        return _upstream_cache
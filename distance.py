@@ -0,0 +1,128 @@
+"""
+Great-circle distance calculations, scalar and batched
+
+The batch functions take one origin (or M origins) and N points and compute
+every distance in a single vectorized NumPy pass. NumPy is optional: without
+it the same functions fall back to plain Python loops.
+"""
+from math import radians, sin, cos, sqrt, asin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EARTH_RADIUS_MILES = 3958.8
+
+# Below this many points NumPy's per-call overhead outweighs vectorization
+NUMPY_MIN_POINTS = 32
+
+
+def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle distance between two points in miles.
+
+    Args:
+        lat1: Latitude of first point
+        lon1: Longitude of first point
+        lat2: Latitude of second point
+        lon2: Longitude of second point
+
+    Returns:
+        float: Distance in miles
+    """
+    lat1, lon1 = radians(lat1), radians(lon1)
+    lat2, lon2 = radians(lat2), radians(lon2)
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * asin(min(1.0, sqrt(a)))
+
+
+def distance_matrix(origin_lats, origin_lons, lats, lons):
+    """
+    Distances from each of M origins to each of N points.
+
+    Args:
+        origin_lats: Sequence of M origin latitudes
+        origin_lons: Sequence of M origin longitudes
+        lats: Sequence of N point latitudes
+        lons: Sequence of N point longitudes
+
+    Returns:
+        An M x N NumPy array of miles, or a list of M lists without NumPy
+    """
+    if np is None:
+        return [[haversine_miles(olat, olon, lat, lon) for lat, lon in zip(lats, lons)]
+                for olat, olon in zip(origin_lats, origin_lons)]
+    olat = np.radians(np.asarray(origin_lats, dtype=float))[:, None]
+    olon = np.radians(np.asarray(origin_lons, dtype=float))[:, None]
+    lat = np.radians(np.asarray(lats, dtype=float))[None, :]
+    lon = np.radians(np.asarray(lons, dtype=float))[None, :]
+    a = np.sin((lat - olat) / 2) ** 2 + np.cos(olat) * np.cos(lat) * np.sin((lon - olon) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distances_from(latitude: float, longitude: float, lats, lons):
+    """
+    Distances from one origin to N points.
+
+    Args:
+        latitude: Origin latitude
+        longitude: Origin longitude
+        lats: Sequence of N point latitudes
+        lons: Sequence of N point longitudes
+
+    Returns:
+        A length-N NumPy array of miles, or a list without NumPy or for small N
+    """
+    if np is None or len(lats) < NUMPY_MIN_POINTS:
+        return [haversine_miles(latitude, longitude, lat, lon) for lat, lon in zip(lats, lons)]
+    return distance_matrix((latitude,), (longitude,), lats, lons)[0]
+
+
+def nearest_k(latitude: float, longitude: float, lats, lons, k: int) -> list:
+    """
+    Rank N points by distance from an origin and keep the closest k.
+
+    Args:
+        latitude: Origin latitude
+        longitude: Origin longitude
+        lats: Sequence of N point latitudes
+        lons: Sequence of N point longitudes
+        k: Number of points to keep
+
+    Returns:
+        list: (index, miles) pairs, nearest first
+    """
+    distances = distances_from(latitude, longitude, lats, lons)
+    if isinstance(distances, list):
+        order = sorted(range(len(distances)), key=distances.__getitem__)[:k]
+    else:
+        k = min(k, len(distances))
+        if k <= 0:
+            return []
+        order = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(k)
+        order = order[np.argsort(distances[order], kind="stable")].tolist()
+    return [(i, float(distances[i])) for i in order]
+
+
+def within(latitude: float, longitude: float, lats, lons, miles: float) -> list:
+    """
+    Find the points within a radius of an origin.
+
+    Args:
+        latitude: Origin latitude
+        longitude: Origin longitude
+        lats: Sequence of N point latitudes
+        lons: Sequence of N point longitudes
+        miles: Search radius
+
+    Returns:
+        list: (index, miles) pairs inside the radius, nearest first
+    """
+    distances = distances_from(latitude, longitude, lats, lons)
+    if isinstance(distances, list):
+        hits = [(i, d) for i, d in enumerate(distances) if d <= miles]
+    else:
+        hits = [(int(i), float(distances[i])) for i in np.flatnonzero(distances <= miles)]
+    hits.sort(key=lambda hit: hit[1])
+    return hits
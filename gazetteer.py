@@ -0,0 +1,346 @@
+"""
+Offline geocoder for Greater Boston backed by a bundled gazetteer
+
+Place names, aliases and MBTA station names are tokenized into an inverted
+index, so common searches ("fenway park", "harvard sq", "Boston Common,
+Boston, MA") resolve locally and Mapbox is only called on a miss. Matching
+is deliberately conservative: a query must name every token of a place (in
+multi-word queries the last one may be a prefix), a station only matches a
+query that says "station" or gives its full multi-word name, a city named
+in the query must be the place's city, and ambiguous answers count as misses.
+"""
+import csv
+import os
+import threading
+from bisect import bisect_left
+
+from cache import normalize_query
+from distance import haversine_miles
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.csv")
+
+# Expanded wherever they appear, so "harvard sq" and "harvard square" share tokens
+ABBREVIATIONS = {
+    "st": "street",
+    "ave": "avenue",
+    "av": "avenue",
+    "rd": "road",
+    "sq": "square",
+    "mt": "mount",
+    "ctr": "center",
+    "univ": "university",
+}
+
+# Trailing tokens that narrow a query to the region without naming a place
+CONTEXT_TOKENS = {"boston", "ma", "mass", "massachusetts", "usa", "us", "united", "states"}
+
+# Shortest query token matched as a prefix of a place token
+MIN_PREFIX = 3
+
+# Equally ranked matches further apart than this are ambiguous
+AMBIGUOUS_MILES = 1.0
+
+# A place not naming its city in its address is taken to be in a city within this distance of it
+CITY_MILES = 2.0
+
+# Rank given to MBTA station names added from the station index
+STATION_RANK = 6
+
+
+def _words(text: str) -> list:
+    """Normalized, abbreviation-expanded tokens of a name or query, without a leading "the"."""
+    tokens = [ABBREVIATIONS.get(t, t) for t in normalize_query(text.replace("'", "")).split()]
+    if len(tokens) > 1 and tokens[0] == "the":
+        tokens = tokens[1:]
+    return tokens
+
+
+def tokenize(text: str) -> list:
+    """
+    Split a place name or query into normalized, abbreviation-expanded tokens.
+
+    Args:
+        text: Raw name or query
+
+    Returns:
+        list: Tokens in order, with a leading "the" and a trailing "station" dropped
+    """
+    tokens = _words(text)
+    if len(tokens) > 1 and tokens[-1] == "station":
+        tokens = tokens[:-1]
+    return tokens
+
+
+def _station_keys(name: str) -> list:
+    """
+    Token lists a station name is indexed under.
+
+    Always the name ending in "station"; the bare name too if it has several
+    words, so "north" or "arlington" alone never reach a station but
+    "north station", "arlington station" and "park street" do.
+    """
+    tokens = _words(name)
+    if not tokens:
+        return []
+    if tokens[-1] == "station":
+        return [tokens]
+    keys = [tokens + ["station"]]
+    if len(tokens) > 1:
+        keys.append(tokens)
+    return keys
+
+
+class _Index:
+    """
+    Immutable lookup structures over one set of places.
+
+    Every name and alias of a place is a key; keys are reachable by their
+    exact token string and through per-token postings, and the sorted token
+    list turns a prefix into a contiguous bisect range.
+    """
+
+    __slots__ = ("places", "keys", "exact", "postings", "tokens", "cities")
+
+    def __init__(self, places: list):
+        self.places = places
+        self.keys = []       # (place index, token tuple)
+        self.exact = {}      # joined tokens -> place indexes
+        self.postings = {}   # token -> key indexes
+        for i, place in enumerate(places):
+            names = [place["name"]] + place["aliases"]
+            if place["kind"] == "station":
+                token_lists = [keys for name in names for keys in _station_keys(name)]
+            else:
+                token_lists = [tokenize(name) for name in names]
+            for tokens in token_lists:
+                tokens = tuple(tokens)
+                if not tokens:
+                    continue
+                k = len(self.keys)
+                self.keys.append((i, tokens))
+                self.exact.setdefault(" ".join(tokens), []).append(i)
+                for token in set(tokens):
+                    self.postings.setdefault(token, set()).add(k)
+        self.tokens = sorted(self.postings)
+        # One-word city names, which narrow "..., Cambridge, MA" to places in that city
+        self.cities = {tokens[0]: places[i] for i, tokens in self.keys
+                       if places[i]["kind"] == "city" and len(tokens) == 1}
+
+    def match(self, tokens: list) -> list:
+        """
+        Return indexes of places matching a token list.
+
+        Exact key matches win; otherwise, for queries of several tokens, a key
+        matches when it has the same number of tokens, contains every query
+        token but the last, and has a token starting with the last query
+        token. A single word must name a place in full.
+        """
+        exact = self.exact.get(" ".join(tokens))
+        if exact:
+            return exact
+        last = tokens[-1]
+        if len(tokens) == 1 or len(last) < MIN_PREFIX:
+            return []
+        prefixed = set()
+        start = bisect_left(self.tokens, last)
+        for token in self.tokens[start:]:
+            if not token.startswith(last):
+                break
+            prefixed |= self.postings[token]
+        candidates = prefixed
+        for token in tokens[:-1]:
+            candidates = candidates & self.postings.get(token, set())
+            if not candidates:
+                return []
+        return list({self.keys[k][0] for k in candidates if len(self.keys[k][1]) == len(tokens)})
+
+
+class Gazetteer:
+    """
+    Resolves place names in Greater Boston to coordinates without a network call.
+
+    Bundled places are loaded once; MBTA station names can be swapped in
+    whenever the station index reloads. Lookups run against an immutable
+    index, so a rebuild never blocks readers.
+    """
+
+    def __init__(self, places: list = None):
+        """
+        Initialize a Gazetteer.
+
+        Args:
+            places: Place dictionaries with name, aliases, latitude, longitude,
+                    address, kind and rank
+        """
+        self._places = list(places or [])
+        self._stations = []
+        self._index = _Index(self._places)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_csv(cls, path: str) -> "Gazetteer":
+        """
+        Load a gazetteer file.
+
+        Args:
+            path: CSV with name, aliases ("|"-separated), latitude, longitude,
+                  address, kind and rank columns
+
+        Returns:
+            Gazetteer: The loaded gazetteer (empty if the file could not be read)
+        """
+        places = []
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    places.append({
+                        "name": row["name"],
+                        "aliases": [a for a in (row.get("aliases") or "").split("|") if a],
+                        "latitude": float(row["latitude"]),
+                        "longitude": float(row["longitude"]),
+                        "address": row.get("address") or row["name"],
+                        "kind": row.get("kind") or "place",
+                        "rank": int(row.get("rank") or 0),
+                    })
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Gazetteer load error ({path}): {e}")
+        return cls(places)
+
+    def __len__(self) -> int:
+        return len(self._index.places)
+
+    @property
+    def places(self) -> list:
+        """The bundled places, without station entries."""
+        return list(self._places)
+
+    def set_stations(self, stations: list) -> None:
+        """
+        Replace the MBTA station entries and rebuild the index.
+
+        Args:
+            stations: Stop dictionaries with id, name, latitude and longitude
+        """
+        entries = [{
+            "name": s["name"],
+            "aliases": [],
+            "latitude": s["latitude"],
+            "longitude": s["longitude"],
+            "address": (s["name"] if _words(s["name"])[-1:] == ["station"] else f"{s['name']} Station")
+                       + ", Massachusetts",
+            "kind": "station",
+            "rank": STATION_RANK,
+            "station_id": s["id"],
+        } for s in stations]
+        index = _Index(self._places + entries)
+        with self._lock:
+            self._stations = entries
+            self._index = index
+
+    def on_station_index_load(self, station_index) -> None:
+        """StationIndex listener feeding the loaded stops into the gazetteer."""
+        self.set_stations(station_index.stops())
+
+    def lookup(self, query: str) -> dict:
+        """
+        Resolve a query to a single place.
+
+        Trailing regional context ("..., Boston, MA") is peeled off one
+        token at a time until something matches. A trailing city name is
+        peeled off too, but then the match must lie in that city: "Park
+        Street, Cambridge" is not Boston's Park Street and is left to Mapbox.
+
+        Args:
+            query: Free-text location query
+
+        Returns:
+            dict: latitude, longitude and address, or None on a miss or an
+                  ambiguous match
+        """
+        index = self._index
+        # Keep a trailing "station": it is what lets a query reach a station entry
+        tokens = _words(query)
+        city = None
+        while tokens:
+            matches = index.match(tokens)
+            if not matches and len(tokens) > 1 and tokens[-1] == "station":
+                matches = index.match(tokens[:-1])
+            if matches:
+                place = self._best(index, matches)
+                if place is not None and (city is None or self._in_city(index, place, city)):
+                    self.hits += 1
+                    return {"latitude": place["latitude"], "longitude": place["longitude"],
+                            "address": place["address"]}
+                break
+            if len(tokens) == 1:
+                break
+            if tokens[-1] in index.cities and city is None:
+                city = tokens[-1]
+            elif tokens[-1] not in CONTEXT_TOKENS:
+                break
+            tokens = tokens[:-1]
+        self.misses += 1
+        return None
+
+    @staticmethod
+    def _in_city(index: _Index, place: dict, city: str) -> bool:
+        """Whether a place lies in the city named by a one-word city token."""
+        named = {t for t in tokenize(place["address"]) if t in index.cities or t == "boston"}
+        if named:
+            return city in named
+        center = index.cities[city]
+        return haversine_miles(place["latitude"], place["longitude"],
+                               center["latitude"], center["longitude"]) <= CITY_MILES
+
+    @staticmethod
+    def _best(index: _Index, matches: list) -> dict:
+        ranked = sorted((index.places[i] for i in matches), key=lambda p: -p["rank"])
+        best = ranked[0]
+        for other in ranked[1:]:
+            if other["rank"] < best["rank"]:
+                break
+            if haversine_miles(best["latitude"], best["longitude"],
+                               other["latitude"], other["longitude"]) > AMBIGUOUS_MILES:
+                return None
+        return best
+
+    def stats(self) -> dict:
+        """
+        Report lookup counters.
+
+        Returns:
+            dict: places, stations, hits, misses and hit_ratio
+        """
+        total = self.hits + self.misses
+        return {
+            "places": len(self._places),
+            "stations": len(self._stations),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+_shared_gazetteer = None
+_shared_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Return the process-wide Gazetteer, creating it on first use.
+
+    The place file defaults to the bundled data/gazetteer.csv and can be
+    replaced with the GAZETTEER_PATH environment variable; set it to an
+    empty string to disable local geocoding.
+
+    Returns:
+        Gazetteer: The shared gazetteer instance
+    """
+    global _shared_gazetteer
+    with _shared_lock:
+        if _shared_gazetteer is None:
+            path = os.getenv("GAZETTEER_PATH", DEFAULT_PATH)
+            _shared_gazetteer = Gazetteer.from_csv(path) if path else Gazetteer()
+        return _shared_gazetteer
@@ -0,0 +1,438 @@
+"""
+Compact, memory-mapped store of MBTA GTFS static data (stops, routes, trips, schedules)
+
+Build the store file once from the MBTA GTFS zip:
+
+    python gtfs_store.py build MBTA_GTFS.zip mbta_gtfs.bin
+
+and point GTFS_STORE_PATH at it. Every worker process maps the same file
+read-only, so the operating system shares one copy of its pages.
+"""
+import csv
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zipfile
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+MAGIC = b"GTFSMAP1"
+AGENCY_TZ = ZoneInfo("America/New_York")
+
+
+def _parse_time(value: str) -> int:
+    """Convert a GTFS HH:MM:SS time (which may exceed 24:00:00) to seconds."""
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def _read_csv(archive: zipfile.ZipFile, name: str):
+    with archive.open(name) as handle:
+        yield from csv.DictReader(io.TextIOWrapper(handle, encoding="utf-8-sig"))
+
+
+class _StringTable:
+    """Interns strings and serializes them as one UTF-8 blob plus offsets."""
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def add(self, value: str) -> int:
+        value = value or ""
+        position = self.index.get(value)
+        if position is None:
+            position = self.index[value] = len(self.values)
+            self.values.append(value)
+        return position
+
+    def columns(self) -> dict:
+        blob = bytearray()
+        offsets = array("I", [0])
+        for value in self.values:
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+        return {"str_offsets": offsets, "str_blob": array("B", bytes(blob))}
+
+
+def build_store(gtfs_zip: str, output_path: str) -> None:
+    """
+    Convert a GTFS zip into a columnar store file.
+
+    Args:
+        gtfs_zip: Path to a GTFS static feed (stops, routes, trips, stop_times, calendar)
+        output_path: Path of the store file to write
+    """
+    strings = _StringTable()
+    cols = {}
+    with zipfile.ZipFile(gtfs_zip) as archive:
+        names = set(archive.namelist())
+
+        # Stops, with parent stations resolved to stop indices
+        stop_rows = list(_read_csv(archive, "stops.txt"))
+        stop_pos = {row["stop_id"]: i for i, row in enumerate(stop_rows)}
+        cols["stop_id"] = array("i", (strings.add(r["stop_id"]) for r in stop_rows))
+        cols["stop_name"] = array("i", (strings.add(r["stop_name"]) for r in stop_rows))
+        cols["stop_lat"] = array("d", (float(r["stop_lat"] or 0) for r in stop_rows))
+        cols["stop_lon"] = array("d", (float(r["stop_lon"] or 0) for r in stop_rows))
+        cols["stop_parent"] = array("i", (stop_pos.get(r.get("parent_station") or "", -1) for r in stop_rows))
+        cols["stop_location_type"] = array("b", (int(r.get("location_type") or 0) for r in stop_rows))
+        cols["stop_wheelchair"] = array("b", (int(r.get("wheelchair_boarding") or 0) for r in stop_rows))
+
+        route_rows = list(_read_csv(archive, "routes.txt"))
+        route_pos = {row["route_id"]: i for i, row in enumerate(route_rows)}
+        cols["route_id"] = array("i", (strings.add(r["route_id"]) for r in route_rows))
+        cols["route_short_name"] = array("i", (strings.add(r.get("route_short_name")) for r in route_rows))
+        cols["route_long_name"] = array("i", (strings.add(r.get("route_long_name")) for r in route_rows))
+        cols["route_color"] = array("i", (strings.add(r.get("route_color")) for r in route_rows))
+        cols["route_type"] = array("h", (int(r["route_type"]) for r in route_rows))
+
+        service_pos = {}
+        cols["service_id"] = array("i")
+        cols["service_days"] = array("B")    # bit 0 = Monday ... bit 6 = Sunday
+        cols["service_start"] = array("i")   # YYYYMMDD
+        cols["service_end"] = array("i")
+        if "calendar.txt" in names:
+            weekdays = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+            for row in _read_csv(archive, "calendar.txt"):
+                service_pos[row["service_id"]] = len(cols["service_id"])
+                cols["service_id"].append(strings.add(row["service_id"]))
+                cols["service_days"].append(sum(1 << i for i, d in enumerate(weekdays) if row[d] == "1"))
+                cols["service_start"].append(int(row["start_date"]))
+                cols["service_end"].append(int(row["end_date"]))
+
+        def service(service_id):
+            if service_id not in service_pos:
+                # Services defined only through calendar_dates.txt
+                service_pos[service_id] = len(cols["service_id"])
+                cols["service_id"].append(strings.add(service_id))
+                cols["service_days"].append(0)
+                cols["service_start"].append(0)
+                cols["service_end"].append(0)
+            return service_pos[service_id]
+
+        cols["exception_service"] = array("i")
+        cols["exception_date"] = array("i")
+        cols["exception_type"] = array("b")  # 1 = added, 2 = removed
+        if "calendar_dates.txt" in names:
+            for row in _read_csv(archive, "calendar_dates.txt"):
+                cols["exception_service"].append(service(row["service_id"]))
+                cols["exception_date"].append(int(row["date"]))
+                cols["exception_type"].append(int(row["exception_type"]))
+
+        trip_rows = list(_read_csv(archive, "trips.txt"))
+        trip_pos = {row["trip_id"]: i for i, row in enumerate(trip_rows)}
+        cols["trip_id"] = array("i", (strings.add(r["trip_id"]) for r in trip_rows))
+        cols["trip_route"] = array("i", (route_pos[r["route_id"]] for r in trip_rows))
+        cols["trip_service"] = array("i", (service(r["service_id"]) for r in trip_rows))
+        cols["trip_headsign"] = array("i", (strings.add(r.get("trip_headsign")) for r in trip_rows))
+        cols["trip_direction"] = array("b", (int(r.get("direction_id") or 0) for r in trip_rows))
+
+        # Stop times grouped by trip in stop_sequence order
+        stop_times = []
+        for row in _read_csv(archive, "stop_times.txt"):
+            if row["trip_id"] not in trip_pos or row["stop_id"] not in stop_pos:
+                continue
+            arrival = row.get("arrival_time") or row.get("departure_time")
+            departure = row.get("departure_time") or arrival
+            stop_times.append((trip_pos[row["trip_id"]], int(row["stop_sequence"]),
+                               stop_pos[row["stop_id"]], _parse_time(arrival), _parse_time(departure)))
+        stop_times.sort()
+        cols["st_trip"] = array("i", (st[0] for st in stop_times))
+        cols["st_stop"] = array("i", (st[2] for st in stop_times))
+        cols["st_arrival"] = array("i", (st[3] for st in stop_times))
+        cols["st_departure"] = array("i", (st[4] for st in stop_times))
+
+    # CSR offsets: stop times of trip t are st_*[trip_st_offsets[t]:trip_st_offsets[t + 1]]
+    trip_st_offsets = array("i", [0] * (len(trip_rows) + 1))
+    for trip in cols["st_trip"]:
+        trip_st_offsets[trip + 1] += 1
+    for i in range(len(trip_rows)):
+        trip_st_offsets[i + 1] += trip_st_offsets[i]
+    cols["trip_st_offsets"] = trip_st_offsets
+
+    # Stop times at each stop ordered by departure time, for departure boards
+    by_stop = [[] for _ in stop_rows]
+    for i, stop in enumerate(cols["st_stop"]):
+        by_stop[stop].append(i)
+    stop_st_offsets = array("i", [0])
+    stop_st_index = array("i")
+    departures = cols["st_departure"]
+    for entries in by_stop:
+        entries.sort(key=departures.__getitem__)
+        stop_st_index.extend(entries)
+        stop_st_offsets.append(len(stop_st_index))
+    cols["stop_st_offsets"] = stop_st_offsets
+    cols["stop_st_index"] = stop_st_index
+
+    # Routes serving each stop; parent stations inherit their platforms' routes
+    stop_routes = [set() for _ in stop_rows]
+    trips_route = cols["trip_route"]
+    for trip, stop in zip(cols["st_trip"], cols["st_stop"]):
+        stop_routes[stop].add(trips_route[trip])
+    for stop, parent in enumerate(cols["stop_parent"]):
+        if parent >= 0:
+            stop_routes[parent] |= stop_routes[stop]
+    stop_route_offsets = array("i", [0])
+    stop_route_index = array("i")
+    for routes in stop_routes:
+        stop_route_index.extend(sorted(routes))
+        stop_route_offsets.append(len(stop_route_index))
+    cols["stop_route_offsets"] = stop_route_offsets
+    cols["stop_route_index"] = stop_route_index
+
+    cols.update(strings.columns())
+    _write_store(output_path, cols)
+
+
+def _write_store(path: str, cols: dict) -> None:
+    layout = {}
+    offset = 0
+    for name, values in cols.items():
+        offset = (offset + 7) & ~7  # 8-byte alignment for every column
+        layout[name] = [values.typecode, offset, len(values)]
+        offset += len(values) * values.itemsize
+    header = json.dumps(layout).encode("utf-8")
+    data_start = (len(MAGIC) + 4 + len(header) + 7) & ~7
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for name, values in cols.items():
+            handle.seek(data_start + layout[name][1])
+            values.tofile(handle)
+    os.replace(tmp_path, path)
+
+
+class GTFSStore:
+    """
+    Read-only view over a store file built by build_store.
+
+    Columns are memoryviews straight into the mapped file; only the small
+    stop and route ID lookups are materialized as Python dicts.
+    """
+
+    def __init__(self, path: str):
+        """
+        Map a store file.
+
+        Args:
+            path: Path of a file written by build_store
+        """
+        self.path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a GTFS store file")
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        layout = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_len])
+        data_start = (len(MAGIC) + 4 + header_len + 7) & ~7
+        view = memoryview(self._mmap)
+        self._cols = {}
+        for name, (typecode, offset, length) in layout.items():
+            start = data_start + offset
+            size = array(typecode).itemsize * length
+            self._cols[name] = view[start:start + size].cast(typecode)
+        self._stop_lookup = None
+        self._children = None
+        self._exceptions = None
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        cols = self.__dict__.get("_cols", {})
+        if name in cols:
+            return cols[name]
+        raise AttributeError(name)
+
+    def string(self, position: int) -> str:
+        """Decode an interned string by its table position."""
+        offsets = self._cols["str_offsets"]
+        return bytes(self._cols["str_blob"][offsets[position]:offsets[position + 1]]).decode("utf-8")
+
+    def stop_position(self, stop_id: str) -> int:
+        """
+        Look up the row of a stop.
+
+        Args:
+            stop_id: GTFS stop ID
+
+        Returns:
+            int: Row index, or -1 if the stop is unknown
+        """
+        if self._stop_lookup is None:
+            with self._lock:
+                if self._stop_lookup is None:
+                    self._stop_lookup = {self.string(s): i for i, s in enumerate(self.stop_id)}
+        return self._stop_lookup.get(stop_id, -1)
+
+    def route(self, position: int) -> dict:
+        """
+        Describe a route row in the same shape as the MBTA API attributes.
+
+        Args:
+            position: Route row index
+
+        Returns:
+            dict: id, long_name, short_name, color and type
+        """
+        return {
+            "id": self.string(self.route_id[position]),
+            "long_name": self.string(self.route_long_name[position]),
+            "short_name": self.string(self.route_short_name[position]),
+            "color": self.string(self.route_color[position]),
+            "type": self.route_type[position],
+        }
+
+    def routes_at_stop(self, stop_id: str) -> list:
+        """
+        Get the routes that serve a stop or parent station.
+
+        Args:
+            stop_id: GTFS stop or parent station ID
+
+        Returns:
+            list: Route dictionaries, empty if the stop is unknown
+        """
+        stop = self.stop_position(stop_id)
+        if stop < 0:
+            return []
+        offsets = self.stop_route_offsets
+        return [self.route(r) for r in self.stop_route_index[offsets[stop]:offsets[stop + 1]]]
+
+    def active_services(self, day: datetime) -> frozenset:
+        """
+        Get the services running on a calendar day.
+
+        Args:
+            day: The service date
+
+        Returns:
+            frozenset: Service row indices active that day
+        """
+        date = day.year * 10000 + day.month * 100 + day.day
+        active = self._active.get(date)
+        if active is not None:
+            return active
+        if self._exceptions is None:
+            self._exceptions = {
+                (self.exception_service[i], self.exception_date[i]): self.exception_type[i]
+                for i in range(len(self.exception_service))
+            }
+        weekday = 1 << day.weekday()
+        active = set()
+        for s in range(len(self.service_id)):
+            running = (self.service_start[s] <= date <= self.service_end[s]
+                       and bool(self.service_days[s] & weekday))
+            exception = self._exceptions.get((s, date))
+            if exception is not None:
+                running = exception == 1
+            if running:
+                active.add(s)
+        active = frozenset(active)
+        with self._lock:
+            if len(self._active) > 8:
+                self._active.clear()
+            self._active[date] = active
+        return active
+
+    def _child_stops(self, stop: int) -> list:
+        if self._children is None:
+            children = {}
+            for i, parent in enumerate(self.stop_parent):
+                if parent >= 0:
+                    children.setdefault(parent, []).append(i)
+            self._children = children
+        return [stop] + self._children.get(stop, [])
+
+    def scheduled_departures(self, stop_id: str, after: datetime = None, limit: int = 5,
+                             window: timedelta = timedelta(hours=2)) -> list:
+        """
+        Get the next scheduled departures from a stop or parent station.
+
+        Args:
+            stop_id: GTFS stop or parent station ID
+            after: Earliest departure time (defaults to now)
+            limit: Maximum number of departures to return
+            window: How far ahead to look
+
+        Returns:
+            list: Departures with trip_id, route, headsign and departure_time, earliest first
+        """
+        stop = self.stop_position(stop_id)
+        if stop < 0:
+            return []
+        after = (after or datetime.now(AGENCY_TZ)).astimezone(AGENCY_TZ)
+        today = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        found = []
+        index, departures = self.stop_st_index, self.st_departure
+        # Trips of yesterday's service day can still run after midnight (times past 24:00)
+        for service_day in (today - timedelta(days=1), today):
+            services = self.active_services(service_day)
+            start = int((after - service_day).total_seconds())
+            end = start + int(window.total_seconds())
+            for s in self._child_stops(stop):
+                # Each stop's stop times are sorted by departure: skip straight to the first one due
+                lo, hi = self.stop_st_offsets[s], self.stop_st_offsets[s + 1]
+                taken = 0
+                for position in range(bisect_left(index, start, lo, hi, key=departures.__getitem__), hi):
+                    i = index[position]
+                    departure = departures[i]
+                    if departure > end:
+                        break
+                    trip = self.st_trip[i]
+                    if self.trip_service[trip] in services:
+                        found.append((departure, service_day, trip))
+                        taken += 1
+                        if taken == limit:
+                            break
+        found.sort(key=lambda f: (f[1] + timedelta(seconds=f[0])))
+        departures = []
+        for departure, service_day, trip in found[:limit]:
+            departures.append({
+                "trip_id": self.string(self.trip_id[trip]),
+                "route": self.route(self.trip_route[trip]),
+                "headsign": self.string(self.trip_headsign[trip]),
+                "departure_time": service_day + timedelta(seconds=departure),
+            })
+        return departures
+
+
+_store = None
+_store_failed = None  # Path that could not be opened, so it is not retried on every call
+_store_lock = threading.Lock()
+
+
+def get_gtfs_store():
+    """
+    Return the process-wide GTFSStore mapped from GTFS_STORE_PATH.
+
+    A file that cannot be opened is reported once and not retried.
+
+    Returns:
+        GTFSStore: The shared store, or None if no usable store file is configured
+    """
+    global _store, _store_failed
+    path = os.getenv("GTFS_STORE_PATH")
+    if not path:
+        return None
+    with _store_lock:
+        if _store is None and path != _store_failed:
+            try:
+                _store = GTFSStore(path)
+            except Exception as e:
+                print(f"Error opening GTFS store {path}: {e}")
+                _store_failed = path
+        return _store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "build":
+        sys.exit("usage: python gtfs_store.py build <gtfs.zip> <output.bin>")
+    build_store(sys.argv[2], sys.argv[3])
+    print(f"Wrote {sys.argv[3]}")
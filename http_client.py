@@ -0,0 +1,325 @@
+"""
+Shared, connection-pooling HTTP client for the Mapbox and MBTA APIs
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import rate_limit
+from rate_limit import RateLimitDeferred
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Retry transient failures this many times after the first attempt
+DEFAULT_RETRIES = 2
+
+# Responses worth retrying: rate limiting and upstream hiccups
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Responses that count against a host's circuit breaker (429 means busy, not broken)
+FAILURE_STATUSES = frozenset({500, 502, 503, 504})
+
+# Upper bound in seconds on one call, including every retry and backoff
+DEFAULT_DEADLINE = 10.0
+
+# Upstream base URLs; point these at a local stub to test failure handling
+MBTA_API_URL = os.getenv("MBTA_API_URL", "https://api-v3.mbta.com").rstrip("/")
+MAPBOX_API_URL = os.getenv("MAPBOX_API_URL", "https://api.mapbox.com").rstrip("/")
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class BudgetExhaustedError(requests.ConnectionError, RateLimitDeferred):
+    """Raised instead of calling a rate-limited host whose budget is spent for this call's priority."""
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    After failure_threshold consecutive failed calls the circuit opens and
+    calls fail immediately for reset_timeout seconds. Then a single probe call
+    is let through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize a CircuitBreaker.
+
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds to fail fast before probing the host again
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Decide whether a call may go to the host now.
+
+        Returns:
+            bool: False while the circuit is open or a probe is already in flight
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            # Also re-probes if an earlier probe never reported back
+            if now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a healthy response."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit at the threshold or after a failed probe."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """
+        Report the breaker's state.
+
+        Returns:
+            dict: State, consecutive failures and calls rejected while open
+        """
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class HTTPClient:
+    """
+    Thin wrapper around a requests.Session with per-host keep-alive pools.
+
+    Every request gets explicit connect/read timeouts, asks for gzip, and is
+    retried a bounded number of times with jittered exponential backoff, all
+    within an overall deadline. Each host has its own circuit breaker, so a
+    failing upstream is answered immediately instead of tying up workers.
+    Hosts with a request quota also get a TokenBucket that every attempt
+    draws from, at the calling thread's priority.
+    """
+
+    def __init__(self, timeout: tuple = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 backoff: float = 0.25, pool_maxsize: int = 20, deadline: float = DEFAULT_DEADLINE,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, rate_limits: dict = None):
+        """
+        Initialize an HTTPClient.
+
+        Args:
+            timeout: Default (connect, read) timeout in seconds
+            retries: Number of retries after the first attempt
+            backoff: Base delay in seconds for exponential backoff
+            pool_maxsize: Maximum keep-alive connections held per host
+            deadline: Default upper bound in seconds on one call including retries
+            failure_threshold: Consecutive failures that open a host's circuit
+            reset_timeout: Seconds a host's circuit stays open before a probe
+            rate_limits: Optional host -> TokenBucket for hosts with a request quota
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.deadline = deadline
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.rate_limits = dict(rate_limits or {})
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        # One pool per host; pool_maxsize bounds concurrent connections to it
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """
+        Get the circuit breaker for a URL's host, creating it on first use.
+
+        Args:
+            url: Absolute URL
+
+        Returns:
+            CircuitBreaker: The breaker shared by every request to that host
+        """
+        host = urlsplit(url).netloc
+        with self._breakers_lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def _sleep_before_retry(self, attempt: int, remaining: float) -> None:
+        # "Full jitter": a random delay up to the exponential ceiling, never past the deadline
+        time.sleep(max(0.0, min(remaining, random.uniform(0, self.backoff * (2 ** attempt)))))
+
+    def get(self, url: str, params: dict = None, headers: dict = None,
+            timeout=None, deadline: float = None, priority: int = None) -> requests.Response:
+        """
+        Issue a GET request over a pooled connection, retrying transient failures.
+
+        Args:
+            url: Absolute URL to request
+            params: Optional query string parameters
+            headers: Optional extra request headers
+            timeout: Optional (connect, read) timeout overriding the client default
+            deadline: Optional seconds allowed for the whole call, including retries
+                      and waiting for rate limit budget
+            priority: Optional rate_limit priority class (defaults to the calling thread's)
+
+        Returns:
+            requests.Response: The final response (which may still be an error status)
+
+        Raises:
+            CircuitOpenError: If the host's circuit breaker is open
+            BudgetExhaustedError: If the host's request budget had no token for
+                this priority before the deadline
+            requests.RequestException: If every attempt failed to connect or timed out,
+                or the deadline passed
+        """
+        with metrics.timer("upstream_request_duration", endpoint=_endpoint_label(url)):
+            return self._get(url, params, headers, timeout, deadline, priority)
+
+    def _get(self, url: str, params: dict, headers: dict, timeout, deadline: float,
+             priority: int = None) -> requests.Response:
+        host = urlsplit(url).netloc
+        breaker = self.breaker(url)
+        bucket = self.rate_limits.get(host)
+        level = rate_limit.current_priority() if priority is None else priority
+        connect_timeout, read_timeout = timeout or self.timeout
+        give_up_at = time.monotonic() + (deadline or self.deadline)
+        for attempt in range(self.retries + 1):
+            remaining = give_up_at - time.monotonic()
+            if bucket is not None and not bucket.acquire(level, max(0.0, remaining)):
+                raise BudgetExhaustedError(
+                    f"Request budget for {host} spent for {rate_limit.PRIORITY_NAMES[level]} calls")
+            if attempt == 0 and not breaker.allow():
+                if bucket is not None:
+                    bucket.refund()
+                raise CircuitOpenError(f"Circuit open for {host}")
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0:
+                breaker.record_failure()
+                raise requests.Timeout(f"Deadline exceeded for {url}")
+            try:
+                response = self.session.get(url, params=params, headers=headers,
+                                            timeout=(min(connect_timeout, remaining),
+                                                     min(read_timeout, remaining)))
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    breaker.record_failure()
+                    raise
+            else:
+                if bucket is not None:
+                    bucket.update(response.headers, response.status_code)
+                if response.status_code == 429 and bucket is not None and attempt < self.retries:
+                    # The bucket now waits out MBTA's reset before the next attempt
+                    response.close()
+                    continue
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    if response.status_code in FAILURE_STATUSES:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return response
+                response.close()
+            self._sleep_before_retry(attempt, give_up_at - time.monotonic())
+
+    def get_json(self, url: str, params: dict = None, headers: dict = None,
+                 timeout=None, deadline: float = None, priority: int = None) -> dict:
+        """
+        GET a URL and decode its JSON body.
+
+        Args:
+            url: Absolute URL to request
+            params: Optional query string parameters
+            headers: Optional extra request headers
+            timeout: Optional timeout overriding the client default
+            deadline: Optional seconds allowed for the whole call, including retries
+            priority: Optional rate_limit priority class (defaults to the calling thread's)
+
+        Returns:
+            dict: The decoded JSON response
+
+        Raises:
+            requests.RequestException: On connection failure or an error status
+        """
+        response = self.get(url, params=params, headers=headers, timeout=timeout, deadline=deadline,
+                            priority=priority)
+        response.raise_for_status()
+        return response.json()
+
+
+def _endpoint_label(url: str) -> str:
+    """Host plus first path segment, e.g. "api-v3.mbta.com/predictions", for metrics."""
+    parts = urlsplit(url)
+    return f"{parts.netloc}/{parts.path.lstrip('/').split('/', 1)[0]}"
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HTTPClient:
+    """
+    Return the process-wide HTTPClient, creating it on first use.
+
+    Configured with the HTTP_POOL_MAXSIZE, HTTP_DEADLINE, CIRCUIT_FAILURE_THRESHOLD
+    and CIRCUIT_RESET_TIMEOUT environment variables. MBTA calls share one
+    request budget of MBTA_RATE_LIMIT requests per minute (by default the
+    V3 quota: 1000 with MBTA_API_KEY set, 20 without); background and batch
+    calls leave RATE_LIMIT_BACKGROUND_RESERVE and RATE_LIMIT_BATCH_RESERVE
+    (shares of the budget, default 0.2 and 0.4) to interactive ones.
+
+    Returns:
+        HTTPClient: The shared client
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            default_quota = rate_limit.KEYED_PER_MINUTE if os.getenv("MBTA_API_KEY") else rate_limit.ANONYMOUS_PER_MINUTE
+            reserves = (0.0, float(os.getenv("RATE_LIMIT_BACKGROUND_RESERVE", "0.2")),
+                        float(os.getenv("RATE_LIMIT_BATCH_RESERVE", "0.4")))
+            mbta_budget = rate_limit.TokenBucket(int(os.getenv("MBTA_RATE_LIMIT", str(default_quota))), reserves)
+            _client = HTTPClient(
+                pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "20")),
+                deadline=float(os.getenv("HTTP_DEADLINE", str(DEFAULT_DEADLINE))),
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+                rate_limits={urlsplit(MBTA_API_URL).netloc: mbta_budget},
+            )
+        return _client
+
+
+def get(url: str, params: dict = None, **kwargs) -> requests.Response:
+    """Issue a GET request through the shared client."""
+    return get_client().get(url, params=params, **kwargs)
+
+
+def get_json(url: str, params: dict = None, **kwargs) -> dict:
+    """GET a URL through the shared client and decode its JSON body."""
+    return get_client().get_json(url, params=params, **kwargs)
@@ -0,0 +1,454 @@
+"""
+Round-based public transit routing (RAPTOR) over the GTFS store
+
+Trips are grouped into patterns: trips of one route that visit the same stop
+sequence and never overtake each other. Round k of the search scans every
+pattern touched by a stop improved in round k - 1, once, in stop order, so
+the result holds the earliest arrival for each number of trips taken
+instead of one arrival time. Everything runs in-process against the
+memory-mapped timetable; no external trip planner is called.
+
+The timetable is built from the store once per process (a few seconds for
+the full MBTA feed) in a background thread.
+"""
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+from distance import haversine_miles
+from gtfs_store import AGENCY_TZ, get_gtfs_store
+
+# Walking model: straight-line miles times a detour factor, at a steady pace
+WALK_MPH = 3.0
+WALK_DETOUR = 1.25
+
+# Furthest walk to the first stop or from the last one
+MAX_ACCESS_MILES = 0.75
+
+# Longest whole-journey walk suggested when no transit journey is faster
+MAX_WALK_MILES = 2.0
+
+# Furthest walk between stops when changing vehicles
+TRANSFER_MILES = 0.2
+
+# Minimum time to change platforms within one station
+PLATFORM_CHANGE_SECONDS = 120
+
+# Trips per journey (so at most MAX_ROUNDS - 1 transfers)
+MAX_ROUNDS = 5
+
+# Grid cell size in degrees for nearby-stop searches (about 0.28 x 0.26 miles in Boston)
+CELL_LAT = 0.004
+CELL_LON = 0.005
+
+INFINITY = float("inf")
+
+
+def walk_seconds(miles: float) -> int:
+    """Estimated walking time for a straight-line distance."""
+    return int(miles * WALK_DETOUR / WALK_MPH * 3600)
+
+
+class _Timetable:
+    """
+    Pattern-organized copy of the store's trips, plus walking links between stops.
+
+    Pattern p visits pattern_stops[p]; its trips (pattern_trips[p]) are sorted
+    by departure, and pattern_dep[p][i] / pattern_arr[p][i] hold every trip's
+    time at the pattern's i-th stop, so the first usable trip at a stop is one
+    bisect.
+    """
+
+    __slots__ = ("pattern_route", "pattern_stops", "pattern_trips", "pattern_dep", "pattern_arr",
+                 "stop_patterns", "footpaths", "children", "grid", "built_in")
+
+    def __init__(self, store, route_types: tuple = None):
+        started = time.perf_counter()
+        offsets, st_stop = store.trip_st_offsets, store.st_stop
+        st_dep, st_arr = store.st_departure, store.st_arrival
+        trip_route, route_type = store.trip_route, store.route_type
+
+        trips = [t for t in range(len(trip_route))
+                 if offsets[t + 1] - offsets[t] >= 2
+                 and (route_types is None or route_type[trip_route[t]] in route_types)]
+        trips.sort(key=lambda t: st_dep[offsets[t]])
+
+        # Same route and stop sequence; a trip overtaking the previous one starts a new pattern
+        groups = {}
+        for t in trips:
+            lo, hi = offsets[t], offsets[t + 1]
+            patterns = groups.setdefault((trip_route[t], st_stop[lo:hi].tobytes()), [])
+            for pattern in patterns:
+                last = offsets[pattern[-1]]
+                if all(st_dep[last + i] <= st_dep[lo + i] and st_arr[last + i] <= st_arr[lo + i]
+                       for i in range(hi - lo)):
+                    pattern.append(t)
+                    break
+            else:
+                patterns.append([t])
+
+        self.pattern_route, self.pattern_stops, self.pattern_trips = [], [], []
+        self.pattern_dep, self.pattern_arr = [], []
+        self.stop_patterns = {}
+        for (route, _), patterns in groups.items():
+            for pattern in patterns:
+                p = len(self.pattern_stops)
+                first = offsets[pattern[0]]
+                length = offsets[pattern[0] + 1] - first
+                stops = array("i", st_stop[first:first + length])
+                self.pattern_route.append(route)
+                self.pattern_stops.append(stops)
+                self.pattern_trips.append(array("i", pattern))
+                self.pattern_dep.append([array("i", (st_dep[offsets[t] + i] for t in pattern))
+                                         for i in range(length)])
+                self.pattern_arr.append([array("i", (st_arr[offsets[t] + i] for t in pattern))
+                                         for i in range(length)])
+                for i, stop in enumerate(stops):
+                    self.stop_patterns.setdefault(stop, []).append((p, i))
+
+        # Served stops bucketed on a lat/lon grid, and each parent station's served platforms
+        self.grid = {}
+        self.children = {}
+        for stop in self.stop_patterns:
+            self.grid.setdefault(self._cell(store.stop_lat[stop], store.stop_lon[stop]), []).append(stop)
+            parent = store.stop_parent[stop]
+            if parent >= 0:
+                self.children.setdefault(parent, []).append(stop)
+
+        self.footpaths = {}
+        for stop in self.stop_patterns:
+            links = {}
+            parent = store.stop_parent[stop]
+            for other in self.children.get(parent, ()) if parent >= 0 else ():
+                if other != stop:
+                    links[other] = PLATFORM_CHANGE_SECONDS
+            for other, miles in self.nearby(store, store.stop_lat[stop], store.stop_lon[stop], TRANSFER_MILES):
+                if other != stop:
+                    links[other] = max(links.get(other, 0), walk_seconds(miles))
+            self.footpaths[stop] = list(links.items())
+        self.built_in = time.perf_counter() - started
+
+    @staticmethod
+    def _cell(latitude: float, longitude: float) -> tuple:
+        return (int(latitude // CELL_LAT), int(longitude // CELL_LON))
+
+    def nearby(self, store, latitude: float, longitude: float, miles: float) -> list:
+        """
+        Find served stops within a straight-line radius.
+
+        Returns:
+            list: (stop row, miles) pairs
+        """
+        cy, cx = self._cell(latitude, longitude)
+        # Grid cells are at least 0.25 miles on a side at Boston's latitude
+        reach = int(miles / 0.25) + 1
+        found = []
+        for y in range(cy - reach, cy + reach + 1):
+            for x in range(cx - reach, cx + reach + 1):
+                for stop in self.grid.get((y, x), ()):
+                    d = haversine_miles(latitude, longitude, store.stop_lat[stop], store.stop_lon[stop])
+                    if d <= miles:
+                        found.append((stop, d))
+        return found
+
+
+class JourneyPlanner:
+    """
+    Plans journeys between two points from the locally stored GTFS timetable.
+    """
+
+    def __init__(self, store, route_types: tuple = None):
+        """
+        Initialize a JourneyPlanner.
+
+        Args:
+            store: GTFSStore with the timetable
+            route_types: Optional GTFS route types to plan with (default: all)
+        """
+        self.store = store
+        self.route_types = route_types
+        self._timetable = None
+        self._builder = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """True once the pattern timetable has been built."""
+        return self._timetable is not None
+
+    def build(self) -> None:
+        """Build the pattern timetable in the calling thread."""
+        timetable = _Timetable(self.store, self.route_types)
+        self._timetable = timetable
+        print(f"Journey planner: {len(timetable.pattern_stops)} patterns built in {timetable.built_in:.1f}s")
+
+    def start_background_build(self) -> None:
+        """Build the pattern timetable in a daemon thread."""
+        with self._lock:
+            if self._builder is not None or self.ready:
+                return
+
+            def run():
+                try:
+                    self.build()
+                except Exception as e:
+                    print(f"Journey planner build error: {e}")
+
+            self._builder = threading.Thread(target=run, name="journey-planner-build", daemon=True)
+            self._builder.start()
+
+    def _access(self, latitude: float, longitude: float, stations: list) -> dict:
+        """
+        Walking times from a point to nearby served stops.
+
+        Stations found by the station index (dicts with id and distance) are
+        expanded to their platforms; stops the index does not hold (buses,
+        for example) come from the planner's own grid.
+        """
+        timetable, store = self._timetable, self.store
+        access = {}
+        for station in stations or ():
+            position = store.stop_position(station["id"])
+            if position < 0:
+                continue
+            seconds = walk_seconds(station["distance"])
+            platforms = timetable.children.get(position, [position])
+            for stop in platforms:
+                if stop in timetable.stop_patterns:
+                    access[stop] = min(access.get(stop, INFINITY), seconds)
+        for stop, miles in timetable.nearby(store, latitude, longitude, MAX_ACCESS_MILES):
+            access[stop] = min(access.get(stop, INFINITY), walk_seconds(miles))
+        return access
+
+    def plan(self, origin: tuple, destination: tuple, depart: datetime = None,
+             origin_stations: list = None, destination_stations: list = None) -> list:
+        """
+        Plan journeys between two points.
+
+        Args:
+            origin: (latitude, longitude) of the start
+            destination: (latitude, longitude) of the end
+            depart: Earliest departure (defaults to now)
+            origin_stations: Optional stations near the start, from the station index
+            destination_stations: Optional stations near the end, from the station index
+
+        Returns:
+            list: Journeys, fastest first; each one is the earliest arrival
+                  for its number of transfers, so slower journeys have fewer
+                  transfers. Transit has to beat walking the whole way; if it
+                  cannot, a direct walk is returned for short distances.
+                  Empty if the timetable is not built yet.
+        """
+        timetable = self._timetable
+        if timetable is None:
+            return []
+        depart = (depart or datetime.now(AGENCY_TZ)).astimezone(AGENCY_TZ)
+        # Times are seconds after midnight of the service day; trips of the
+        # previous service day still running after midnight are not considered
+        service_day = depart.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = int((depart - service_day).total_seconds())
+        services = self.store.active_services(service_day)
+
+        access = self._access(origin[0], origin[1], origin_stations)
+        egress = self._access(destination[0], destination[1], destination_stations)
+        direct = walk_seconds(haversine_miles(origin[0], origin[1], destination[0], destination[1]))
+        found, labels = self._raptor(timetable, access, egress, start, services, start + direct)
+
+        journeys = [self._journey(timetable, labels, k, stop, egress[stop], service_day)
+                    for k, stop in found]
+        if not journeys and direct <= walk_seconds(MAX_WALK_MILES):
+            journeys.append({
+                "departure": depart.isoformat(timespec="minutes"),
+                "arrival": (depart + timedelta(seconds=direct)).isoformat(timespec="minutes"),
+                "duration_minutes": round(direct / 60),
+                "transfers": 0,
+                "legs": [{"mode": "walk", "from": "Start", "to": "Destination", "minutes": round(direct / 60)}],
+            })
+        journeys.sort(key=lambda j: (j["arrival"], j["transfers"]))
+        return journeys
+
+    def _raptor(self, timetable: _Timetable, access: dict, egress: dict, start: int,
+                services: frozenset, cutoff: int) -> tuple:
+        """
+        Run the rounds.
+
+        Args:
+            timetable: Pattern timetable
+            access: Stop -> walking seconds from the origin
+            egress: Stop -> walking seconds to the destination
+            start: Departure in seconds after service-day midnight
+            services: Active service rows
+            cutoff: Arrival to beat (the direct walk)
+
+        Returns:
+            tuple: ([(round, final stop)] for every round that improved the
+                    arrival at the destination, per-round label dicts)
+        """
+        trip_service = self.store.trip_service
+        pattern_stops, pattern_trips = timetable.pattern_stops, timetable.pattern_trips
+        pattern_dep, pattern_arr = timetable.pattern_dep, timetable.pattern_arr
+        best = {}
+        labels = [{}]
+        for stop, seconds in access.items():
+            best[stop] = start + seconds
+            labels[0][stop] = ("access", seconds)
+        marked = set(access)
+        target = cutoff
+        found = []
+
+        for k in range(1, MAX_ROUNDS + 1):
+            # Each pattern is scanned from the first stop at which it was touched
+            queue = {}
+            for stop in marked:
+                for p, i in timetable.stop_patterns.get(stop, ()):
+                    if i < queue.get(p, INFINITY):
+                        queue[p] = i
+            previous = dict(best)
+            improved, round_labels = {}, {}
+
+            for p, first in queue.items():
+                stops, trips = pattern_stops[p], pattern_trips[p]
+                dep, arr = pattern_dep[p], pattern_arr[p]
+                trip = board = -1
+                for i in range(first, len(stops)):
+                    stop = stops[i]
+                    if trip >= 0:
+                        arrival = arr[i][trip]
+                        if arrival < best.get(stop, INFINITY) and arrival < target:
+                            best[stop] = improved[stop] = arrival
+                            round_labels[stop] = ("ride", p, trip, board, i)
+                    ready = previous.get(stop)
+                    if ready is not None and (trip < 0 or ready <= dep[i][trip]):
+                        # Earliest trip at this stop that runs today, if earlier than the current one
+                        column = dep[i]
+                        j = bisect_left(column, ready)
+                        limit = trip if trip >= 0 else len(column)
+                        while j < limit and trip_service[trips[j]] not in services:
+                            j += 1
+                        if j < limit:
+                            trip, board = j, i
+
+            for stop in list(improved):
+                arrival = improved[stop]
+                for other, seconds in timetable.footpaths.get(stop, ()):
+                    walked = arrival + seconds
+                    if walked < best.get(other, INFINITY) and walked < target:
+                        best[other] = improved[other] = walked
+                        round_labels[other] = ("walk", stop, seconds)
+
+            labels.append(round_labels)
+            arrivals = [(improved[s] + egress[s], s) for s in improved if s in egress]
+            if arrivals:
+                arrival, stop = min(arrivals)
+                if arrival < target:
+                    target = arrival
+                    found.append((k, stop))
+            marked = set(improved)
+            if not marked:
+                break
+        return found, labels
+
+    def _journey(self, timetable: _Timetable, labels: list, k: int, final_stop: int,
+                 egress_seconds: int, service_day: datetime) -> dict:
+        """Follow the labels back from the final stop and describe the legs."""
+        store = self.store
+        steps = []
+        stop = final_stop
+        while True:
+            # The label the search used is the latest one at or before this round
+            while stop not in labels[k]:
+                k -= 1
+            label = labels[k][stop]
+            steps.append(label + (stop,))
+            if label[0] == "access":
+                break
+            if label[0] == "walk":
+                stop = label[1]
+            else:
+                stop = timetable.pattern_stops[label[1]][label[3]]
+                k -= 1
+        steps.reverse()
+
+        def at(seconds):
+            return (service_day + timedelta(seconds=seconds)).isoformat(timespec="minutes")
+
+        # Leave just in time for the first vehicle
+        _, access_seconds, first_stop = steps[0]
+        _, p, trip, board, _, _ = steps[1]
+        departure = timetable.pattern_dep[p][board][trip] - access_seconds
+        legs = [self._walk_leg(None, first_stop, access_seconds)]
+        clock, rides = departure + access_seconds, 0
+        for step in steps[1:]:
+            if step[0] == "walk":
+                _, from_stop, seconds, to_stop = step
+                legs.append(self._walk_leg(from_stop, to_stop, seconds))
+                clock += seconds
+                continue
+            _, p, trip, board, alight, _ = step
+            rides += 1
+            stops, trip_row = timetable.pattern_stops[p], timetable.pattern_trips[p][trip]
+            clock = timetable.pattern_arr[p][alight][trip]
+            legs.append({
+                "mode": "transit",
+                "route": store.route(timetable.pattern_route[p]),
+                "headsign": store.string(store.trip_headsign[trip_row]),
+                "trip_id": store.string(store.trip_id[trip_row]),
+                "from": self._stop(stops[board]),
+                "to": self._stop(stops[alight]),
+                "depart": at(timetable.pattern_dep[p][board][trip]),
+                "arrive": at(clock),
+                "stops": alight - board,
+            })
+        legs.append(self._walk_leg(final_stop, None, egress_seconds))
+        arrival = clock + egress_seconds
+        return {
+            "departure": at(departure),
+            "arrival": at(arrival),
+            "duration_minutes": round((arrival - departure) / 60),
+            "transfers": rides - 1,
+            "legs": legs,
+        }
+
+    def _stop(self, stop: int) -> dict:
+        """ID and name of a stop's parent station (or of the stop itself)."""
+        store = self.store
+        parent = store.stop_parent[stop]
+        row = parent if parent >= 0 else stop
+        return {"id": store.string(store.stop_id[row]), "name": store.string(store.stop_name[row])}
+
+    def _walk_leg(self, from_stop: int, to_stop: int, seconds: int) -> dict:
+        """Describe a walk; None stands for the journey's start or destination."""
+        origin = self._stop(from_stop)["name"] if from_stop is not None else "Start"
+        target = self._stop(to_stop)["name"] if to_stop is not None else "Destination"
+        return {"mode": "transfer" if origin == target else "walk",
+                "from": origin, "to": target, "minutes": round(seconds / 60)}
+
+
+_shared_planner = None
+_shared_lock = threading.Lock()
+
+
+def get_journey_planner():
+    """
+    Return the process-wide JourneyPlanner, creating it on first use.
+
+    Needs the GTFS store (GTFS_STORE_PATH). Route types can be limited with
+    the JOURNEY_ROUTE_TYPES environment variable, e.g. "0,1,2" to plan
+    without buses.
+
+    Returns:
+        JourneyPlanner: The shared planner, or None if no GTFS store is configured
+    """
+    global _shared_planner
+    store = get_gtfs_store()
+    if store is None:
+        return None
+    with _shared_lock:
+        if _shared_planner is None:
+            types = os.getenv("JOURNEY_ROUTE_TYPES")
+            route_types = tuple(int(t) for t in types.split(",")) if types else None
+            _shared_planner = JourneyPlanner(store, route_types)
+        return _shared_planner
@@ -0,0 +1,135 @@
+"""
+JSON:API response decoding with O(1) resolution of included resources
+"""
+
+
+class Resource:
+    """
+    A single JSON:API resource object.
+    """
+
+    __slots__ = ("type", "id", "attributes", "relationships")
+
+    def __init__(self, raw: dict):
+        self.type = raw.get("type")
+        self.id = raw.get("id")
+        self.attributes = raw.get("attributes") or {}
+        self.relationships = raw.get("relationships") or {}
+
+    def related_id(self, name: str) -> str:
+        """
+        Get the ID of a to-one relationship.
+
+        Args:
+            name: Relationship name, e.g. "route"
+
+        Returns:
+            str: The related resource ID, or None if absent
+        """
+        data = (self.relationships.get(name) or {}).get("data")
+        if isinstance(data, dict):
+            return data.get("id")
+        return None
+
+    def related_ids(self, name: str) -> list:
+        """
+        Get the IDs of a relationship, whether it is to-one or to-many.
+
+        Args:
+            name: Relationship name, e.g. "route"
+
+        Returns:
+            list: Related resource IDs in document order
+        """
+        data = (self.relationships.get(name) or {}).get("data")
+        if isinstance(data, list):
+            return [item["id"] for item in data if item]
+        if isinstance(data, dict):
+            return [data["id"]]
+        return []
+
+    def __repr__(self) -> str:
+        return f"Resource({self.type!r}, {self.id!r})"
+
+
+class Document:
+    """
+    A decoded JSON:API response.
+
+    The included resources are indexed by (type, id) once, so resolving a
+    relationship is a dictionary lookup instead of a scan over "included".
+    """
+
+    __slots__ = ("data", "included", "_index")
+
+    def __init__(self, payload: dict):
+        """
+        Decode a JSON:API payload.
+
+        Args:
+            payload: Parsed JSON response with "data" and optional "included"
+        """
+        data = payload.get("data") or []
+        if isinstance(data, dict):
+            data = [data]
+        self.data = [Resource(item) for item in data]
+        self.included = [Resource(item) for item in payload.get("included") or []]
+        self._index = {(r.type, r.id): r for r in self.included}
+
+    def find(self, resource_type: str, resource_id: str) -> Resource:
+        """
+        Look up an included resource.
+
+        Args:
+            resource_type: JSON:API type, e.g. "route"
+            resource_id: Resource ID
+
+        Returns:
+            Resource: The included resource, or None if it was not included
+        """
+        return self._index.get((resource_type, resource_id))
+
+    def related(self, resource: Resource, name: str, resource_type: str = None) -> Resource:
+        """
+        Resolve a to-one relationship against the included resources.
+
+        Args:
+            resource: The resource holding the relationship
+            name: Relationship name
+            resource_type: Type of the related resource (defaults to name)
+
+        Returns:
+            Resource: The related resource, or None if it was not included
+        """
+        return self._index.get((resource_type or name, resource.related_id(name)))
+
+    def related_all(self, resource: Resource, name: str, resource_type: str = None) -> list:
+        """
+        Resolve every resource of a relationship that was included.
+
+        Args:
+            resource: The resource holding the relationship
+            name: Relationship name
+            resource_type: Type of the related resources (defaults to name)
+
+        Returns:
+            list: Related resources in relationship order, skipping any not included
+        """
+        resource_type = resource_type or name
+        found = (self._index.get((resource_type, rid)) for rid in resource.related_ids(name))
+        return [r for r in found if r is not None]
+
+
+def decode(payload: dict) -> Document:
+    """
+    Decode a JSON:API payload, tolerating empty or failed responses.
+
+    Args:
+        payload: Parsed JSON response, or None
+
+    Returns:
+        Document: The decoded document, or None if there is no "data" member
+    """
+    if not payload or "data" not in payload:
+        return None
+    return Document(payload)
@@ -2,14 +2,21 @@
 MBTA Helper functions for interacting with the Mapbox and MBTA APIs
 """
 
-import json
 import os
 import urllib.parse
-import urllib.request
 from datetime import datetime, timedelta
 
 from dotenv import load_dotenv
 
+import http_client
+import jsonapi
+import metrics
+from cache import get_geocode_cache, get_upstream_cache, normalize_query
+from gazetteer import get_gazetteer
+from gtfs_store import get_gtfs_store
+from prediction_stream import get_prediction_store
+from station_index import get_station_index
+
 # Load environment variables
 load_dotenv()
 
@@ -18,8 +25,12 @@ MAPBOX_TOKEN = os.getenv("MAPBOX_TOKEN")
 MBTA_API_KEY = os.getenv("MBTA_API_KEY")
 
 # Base URLs for APIs
-MAPBOX_BASE_URL = "https://api.mapbox.com/geocoding/v5/mapbox.places"
-MBTA_BASE_URL = "https://api-v3.mbta.com"
+MAPBOX_BASE_URL = f"{http_client.MAPBOX_API_URL}/geocoding/v5/mapbox.places"
+MBTA_BASE_URL = http_client.MBTA_API_URL
+
+# Seconds predictions stay fresh, and how much longer they may be served as stale
+PREDICTIONS_FRESH_TTL = 10
+PREDICTIONS_MAX_STALE = float(os.getenv("PREDICTIONS_MAX_STALE", "300"))
 
 # Line colors mapping
 LINE_COLORS = {
@@ -45,14 +56,13 @@ def get_json(url):
     a Python JSON object containing the response to that request.
     """
     try:
-        with urllib.request.urlopen(url) as response:
-            response_text = response.read().decode("utf-8")
-            return json.loads(response_text)
+        return http_client.get_json(url)
     except Exception as e:
         print(f"Error fetching data from {url}: {e}")
         return None
 
 
+@metrics.timed("mbta_helper.get_lat_lng")
 def get_lat_lng(place_name):
     """
     Given a place name or address, return a (latitude, longitude) tuple
@@ -61,6 +71,18 @@ def get_lat_lng(place_name):
     See https://docs.mapbox.com/api/search/geocoding/
     for Mapbox Geocoding API URL formatting requirements.
     """
+    # Well-known places resolve from the bundled gazetteer without a Mapbox call
+    local = get_gazetteer().lookup(place_name)
+    if local is not None:
+        return (local['latitude'], local['longitude'])
+
+    # Repeat searches are answered from the geocode cache shared with app.py
+    cache = get_geocode_cache()
+    cache_key = normalize_query(place_name)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return (cached['latitude'], cached['longitude'])
+
     # URL encode the place name
     encoded_place = urllib.parse.quote(place_name)
     
@@ -73,7 +95,13 @@ def get_lat_lng(place_name):
     # Check if we got a valid response with features
     if response_data and 'features' in response_data and len(response_data['features']) > 0:
         # Extract coordinates [longitude, latitude]
-        coordinates = response_data['features'][0]['geometry']['coordinates']
+        feature = response_data['features'][0]
+        coordinates = feature['geometry']['coordinates']
+        cache.set(cache_key, {
+            'longitude': coordinates[0],
+            'latitude': coordinates[1],
+            'address': feature.get('place_name', place_name)
+        })
         # Return as (latitude, longitude) tuple - note the order swap
         print(f"Mapbox response for {place_name}: {response_data}")
         return (coordinates[1], coordinates[0])
@@ -81,6 +109,18 @@ def get_lat_lng(place_name):
     return None
 
 
+def _route_color(route_name, route_type):
+    """
+    Map a route short name (or ID) and route type to a display color.
+    """
+    if route_name in LINE_COLORS:
+        return LINE_COLORS[route_name]
+    if route_type == 2:
+        return 'commuter-rail'
+    return 'bus'
+
+
+@metrics.timed("mbta_helper.get_nearest_stations")
 def get_nearest_stations(latitude, longitude, types=None, limit=5):
     """
     Given latitude and longitude strings, return a list of the `limit` closest MBTA stations
@@ -94,6 +134,31 @@ def get_nearest_stations(latitude, longitude, types=None, limit=5):
     
     Returns a list of dictionaries containing information about each station
     """
+    # Answer from the local stop index when it holds every requested route type
+    index = get_station_index(MBTA_API_KEY)
+    if index.loaded and index.covers(types):
+        stations = []
+        for stop in index.nearest(float(latitude), float(longitude), k=limit, route_types=types):
+            routes = []
+            for route in stop['routes']:
+                route_name = route['short_name'] or route['id']
+                routes.append({
+                    'id': route['id'],
+                    'name': route['long_name'] or route_name,
+                    'short_name': route_name,
+                    'color': _route_color(route_name, route['type'])
+                })
+            stations.append({
+                'id': stop['id'],
+                'name': stop['name'],
+                'latitude': stop['latitude'],
+                'longitude': stop['longitude'],
+                'wheelchair_accessible': stop['wheelchair_boarding'] == 1,
+                'distance': stop['distance'],
+                'routes': routes
+            })
+        return stations
+
     # Base URL parameters
     params = {
         'api_key': MBTA_API_KEY,
@@ -112,48 +177,36 @@ def get_nearest_stations(latitude, longitude, types=None, limit=5):
     url += urllib.parse.urlencode(params)
     
     # Make the request
-    response_data = get_json(url)
+    document = jsonapi.decode(get_json(url))
     
-    if not response_data or 'data' not in response_data:
+    if document is None:
         return []
     
     # Process each station
     stations = []
-    for stop in response_data['data'][:limit]:  # Limit to specified number
-        # Get related routes information from included data
-        route_ids = []
-        if 'relationships' in stop and 'route' in stop['relationships']:
-            route_ids = [route_data['id'] for route_data in stop['relationships']['route'].get('data', [])]
-        
-        # Find route information in included data
+    for stop in document.data[:limit]:  # Limit to specified number
+        # Resolve related routes against the included data
         routes = []
-        if 'included' in response_data:
-            for included in response_data['included']:
-                if included['type'] == 'route' and included['id'] in route_ids:
-                    route_color = 'bus'  # Default
-                    
-                    # Determine line color based on route short name or ID
-                    route_name = included.get('attributes', {}).get('short_name', '') or included['id']
-                    if route_name in LINE_COLORS:
-                        route_color = LINE_COLORS[route_name]
-                    elif included.get('attributes', {}).get('type') == 2:
-                        route_color = 'commuter-rail'
-                    
-                    routes.append({
-                        'id': included['id'],
-                        'name': included.get('attributes', {}).get('long_name', '') or route_name,
-                        'short_name': route_name,
-                        'color': route_color
-                    })
+        for route in document.related_all(stop, 'route'):
+            # Determine line color based on route short name or ID
+            route_name = route.attributes.get('short_name', '') or route.id
+            route_color = _route_color(route_name, route.attributes.get('type'))
+            
+            routes.append({
+                'id': route.id,
+                'name': route.attributes.get('long_name', '') or route_name,
+                'short_name': route_name,
+                'color': route_color
+            })
         
         # Create station dictionary
         station = {
-            'id': stop['id'],
-            'name': stop['attributes']['name'],
-            'latitude': stop['attributes']['latitude'],
-            'longitude': stop['attributes']['longitude'],
-            'wheelchair_accessible': stop['attributes']['wheelchair_boarding'] == 1,
-            'distance': stop['attributes'].get('distance', None),
+            'id': stop.id,
+            'name': stop.attributes['name'],
+            'latitude': stop.attributes['latitude'],
+            'longitude': stop.attributes['longitude'],
+            'wheelchair_accessible': stop.attributes['wheelchair_boarding'] == 1,
+            'distance': stop.attributes.get('distance', None),
             'routes': routes
         }
         
@@ -191,6 +244,38 @@ def find_stop_near(place_name, types=None):
             nearest['latitude'], nearest['longitude'], nearest['routes'], coords)
 
 
+@metrics.timed("mbta_helper.get_scheduled_departures")
+def get_scheduled_departures(station_id, limit=5):
+    """
+    Get the next scheduled departures for a station from the local GTFS store
+    
+    Parameters:
+    - station_id: MBTA station ID
+    - limit: Maximum number of departures to return
+    
+    Returns:
+    - List of arrival dictionaries (empty if GTFS_STORE_PATH is not configured)
+    """
+    store = get_gtfs_store()
+    if store is None:
+        return []
+    
+    arrivals = []
+    for departure in store.scheduled_departures(station_id, limit=limit):
+        route = departure['route']
+        route_name = route['short_name'] or route['id']
+        arrivals.append({
+            'id': f"schedule-{departure['trip_id']}-{station_id}",
+            'arrival_time': departure['departure_time'].isoformat(),
+            'line': route_name,
+            'line_color': _route_color(route_name, route['type']),
+            'destination': departure['headsign'] or "Unknown",
+            'status': 'Scheduled',
+        })
+    return arrivals
+
+
+@metrics.timed("mbta_helper.get_station_arrivals")
 def get_station_arrivals(station_id):
     """
     Get upcoming arrivals for a specific station
@@ -201,6 +286,70 @@ def get_station_arrivals(station_id):
     Returns:
     - Dictionary with arrival predictions
     """
+    # Serve from the in-memory prediction store when the stream ingester is running
+    store = get_prediction_store()
+    if store.ready:
+        now = datetime.now().astimezone()
+        max_time = now + timedelta(hours=1)
+        arrivals = []
+        for prediction in store.arrivals(station_id):
+            if not prediction['arrival_time']:
+                continue
+            if not now <= datetime.fromisoformat(prediction['arrival_time']) <= max_time:
+                continue
+            route_name = prediction['route'].get('short_name', '') or prediction['route_id'] or "Unknown"
+            arrivals.append({
+                'id': prediction['id'],
+                'arrival_time': prediction['arrival_time'],
+                'line': route_name,
+                'line_color': _route_color(route_name, prediction['route'].get('type')),
+                'destination': prediction['headsign'] or "Unknown",
+                'status': prediction['status'],
+            })
+        # The stream may not have reported this station yet - show the timetable meanwhile
+        return {'arrivals': arrivals or get_scheduled_departures(station_id)}
+
+    # Last good arrivals are served (flagged stale) while MBTA is slow or failing
+    try:
+        arrivals, stale = get_upstream_cache().get_or_revalidate(
+            f"station_arrivals:{station_id}", lambda: _fetch_station_arrivals(station_id),
+            ttl=PREDICTIONS_FRESH_TTL, max_stale=PREDICTIONS_MAX_STALE)
+    except Exception as e:
+        print(f"Error fetching arrivals for {station_id}: {e}")
+        arrivals, stale = [], False
+    
+    # Fall back to the timetable when there is no real-time data
+    if not arrivals:
+        return {'arrivals': get_scheduled_departures(station_id)}
+    
+    if stale:
+        return {'arrivals': arrivals, 'stale': True}
+    return {'arrivals': arrivals}
+
+
+def _fetch_station_arrivals(station_id):
+    """
+    Fetch the next hour of predictions for a station from the MBTA API
+    
+    Parameters:
+    - station_id: MBTA station ID
+    
+    Returns:
+    - List of arrival dictionaries; raises on upstream failure
+    """
+    return _parse_station_arrivals(http_client.get_json(_station_arrivals_url(station_id)))
+
+
+def _station_arrivals_url(station_id):
+    """
+    Build the MBTA predictions URL for a station's next hour of arrivals
+    
+    Parameters:
+    - station_id: MBTA station ID
+    
+    Returns:
+    - URL string including the query string
+    """
     # Get the current time
     now = datetime.now()
     
@@ -219,60 +368,53 @@ def get_station_arrivals(station_id):
     }
     
     # Build URL
-    url = f"{MBTA_BASE_URL}/predictions?"
-    url += urllib.parse.urlencode(params)
+    return f"{MBTA_BASE_URL}/predictions?" + urllib.parse.urlencode(params)
+
+
+def _parse_station_arrivals(payload):
+    """
+    Turn an MBTA predictions response into arrival dictionaries
     
-    # Make the request
-    response_data = get_json(url)
+    Parameters:
+    - payload: Decoded JSON:API predictions response (with trip and route included)
     
-    if not response_data or 'data' not in response_data:
-        return {'arrivals': []}
+    Returns:
+    - List of arrival dictionaries
+    """
+    document = jsonapi.Document(payload)
     
     # Process predictions
     arrivals = []
-    for prediction in response_data['data']:
-        if 'attributes' not in prediction or not prediction['attributes'].get('arrival_time'):
+    for prediction in document.data:
+        if not prediction.attributes.get('arrival_time'):
             continue
-            
-        # Get route information
-        route_id = None
-        if 'relationships' in prediction and 'route' in prediction['relationships']:
-            route_data = prediction['relationships']['route'].get('data')
-            if route_data:
-                route_id = route_data.get('id')
         
         # Find route information in included data
         route_name = "Unknown"
         route_color = "bus"
-        if 'included' in response_data:
-            for included in response_data['included']:
-                if included['type'] == 'route' and included['id'] == route_id:
-                    route_name = included.get('attributes', {}).get('short_name', '') or included['id']
-                    
-                    # Determine line color
-                    if route_name in LINE_COLORS:
-                        route_color = LINE_COLORS[route_name]
-                    elif included.get('attributes', {}).get('type') == 2:
-                        route_color = 'commuter-rail'
+        route = document.related(prediction, 'route')
+        if route is not None:
+            route_name = route.attributes.get('short_name', '') or route.id
+            
+            # Determine line color
+            route_color = _route_color(route_name, route.attributes.get('type'))
         
         # Get destination information
         destination = "Unknown"
-        if 'relationships' in prediction and 'trip' in prediction['relationships']:
-            trip_id = prediction['relationships']['trip'].get('data', {}).get('id')
-            if trip_id and 'included' in response_data:
-                for included in response_data['included']:
-                    if included['type'] == 'trip' and included['id'] == trip_id:
-                        destination = included.get('attributes', {}).get('headsign', 'Unknown')
+        trip = document.related(prediction, 'trip')
+        if trip is not None:
+            destination = trip.attributes.get('headsign', 'Unknown')
         
         # Create arrival dictionary
         arrival = {
-            'arrival_time': prediction['attributes']['arrival_time'],
+            'id': prediction.id,
+            'arrival_time': prediction.attributes['arrival_time'],
             'line': route_name,
             'line_color': route_color,
             'destination': destination,
-            'status': prediction['attributes'].get('status', ''),
+            'status': prediction.attributes.get('status', ''),
         }
         
         arrivals.append(arrival)
     
-    return {'arrivals': arrivals}
\ No newline at end of file
+    return arrivals
@@ -0,0 +1,264 @@
+"""
+In-process latency histograms and a Prometheus text-format exporter
+
+Timings are recorded with the timed decorator or the timer context manager.
+Each series keeps cumulative bucket counts (for Prometheus histograms) and a
+sliding window of recent samples from which p50/p95/p99 are computed at
+scrape time, so recording a sample is a bisect and two appends.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+PREFIX = "mbta_finder"
+
+# Upper bounds in seconds; Prometheus adds +Inf
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Recent samples per series used for the quantile gauges
+WINDOW_SIZE = 1024
+
+HELP = {
+    "operation_duration": "Time spent in instrumented finder and helper operations",
+    "upstream_request_duration": "Time spent in Mapbox and MBTA HTTP calls, retries included",
+    "http_request_duration": "Time spent handling incoming requests, by Flask endpoint",
+    "render_duration": "Time spent rendering templates",
+}
+
+
+class Histogram:
+    """
+    Latency distribution of one labelled series.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count", "window", "_lock")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, window: int = WINDOW_SIZE):
+        """
+        Initialize a Histogram.
+
+        Args:
+            buckets: Sorted bucket upper bounds in seconds
+            window: Number of recent samples kept for quantiles
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.window = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """Record one duration."""
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+            self.window.append(seconds)
+
+    def quantiles(self, qs: tuple = QUANTILES) -> dict:
+        """
+        Compute quantiles over the recent-sample window.
+
+        Args:
+            qs: Quantiles between 0 and 1
+
+        Returns:
+            dict: Quantile -> seconds, empty if nothing was recorded
+        """
+        with self._lock:
+            samples = sorted(self.window)
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in qs}
+
+    def snapshot(self) -> tuple:
+        """
+        Copy the cumulative counters.
+
+        Returns:
+            tuple: (cumulative bucket counts including +Inf, sum, count)
+        """
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class Registry:
+    """
+    Named, labelled histograms plus callbacks that report gauges at scrape time.
+    """
+
+    def __init__(self):
+        self._histograms = {}   # (name, sorted label items) -> Histogram
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        """
+        Get (or create) the histogram for a metric name and label set.
+
+        Args:
+            name: Metric name without the common prefix
+            help_text: HELP line for the metric
+            **labels: Label values identifying the series
+
+        Returns:
+            Histogram: The series' histogram
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                if help_text:
+                    self._help.setdefault(name, help_text)
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Record a duration in the named series."""
+        self.histogram(name, **labels).observe(seconds)
+
+    def register_collector(self, collector) -> None:
+        """
+        Add a callback reporting gauges whenever metrics are rendered.
+
+        Args:
+            collector: Zero-argument callable returning (name, help, labels, value)
+                       tuples; names are given without the common prefix
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition body
+        """
+        lines = []
+        with self._lock:
+            series = sorted(self._histograms.items())
+            collectors = list(self._collectors)
+
+        by_name = {}
+        for (name, labels), histogram in series:
+            by_name.setdefault(name, []).append((dict(labels), histogram))
+        for name, entries in by_name.items():
+            metric = f"{PREFIX}_{name}_seconds"
+            lines.append(f"# HELP {metric} {self._help.get(name) or HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} histogram")
+            quantile_lines = []
+            for labels, histogram in entries:
+                cumulative, total, count = histogram.snapshot()
+                for bound, value in zip(histogram.buckets + (float("inf"),), cumulative):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{metric}_bucket{_labels(labels, le=le)} {value}")
+                lines.append(f"{metric}_sum{_labels(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{_labels(labels)} {count}")
+                for q, value in histogram.quantiles().items():
+                    quantile_lines.append(f"{metric}_quantile{_labels(labels, quantile=str(q))} {value:.6f}")
+            if quantile_lines:
+                lines.append(f"# HELP {metric}_quantile Recent p50/p95/p99 of {name}")
+                lines.append(f"# TYPE {metric}_quantile gauge")
+                lines.extend(quantile_lines)
+
+        gauges = {}
+        for collector in collectors:
+            try:
+                for name, help_text, labels, value in collector():
+                    gauges.setdefault(name, (help_text, []))[1].append((labels, value))
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        for name, (help_text, samples) in gauges.items():
+            metric = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in samples:
+                lines.append(f"{metric}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    """Escape a label value as the Prometheus text format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict, **extra) -> str:
+    """Format a label set as {k="v",...}."""
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+registry = Registry()
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record a duration in the shared registry."""
+    registry.observe(name, seconds, **labels)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """
+    Time the enclosed block into the shared registry, whether or not it raises.
+
+    Args:
+        name: Metric name without the common prefix
+        **labels: Label values identifying the series
+    """
+    histogram = registry.histogram(name, **labels)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def timed(operation: str, name: str = "operation_duration"):
+    """
+    Decorator timing every call of a function into the shared registry.
+
+    Args:
+        operation: Value of the "operation" label
+        name: Metric name without the common prefix
+
+    Returns:
+        The decorator
+    """
+    def decorator(func):
+        histogram = registry.histogram(name, operation=operation)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def register_collector(collector) -> None:
+    """Add a gauge callback to the shared registry (see Registry.register_collector)."""
+    registry.register_collector(collector)
+
+
+def render() -> str:
+    """Render the shared registry in the Prometheus text format."""
+    return registry.render()
@@ -0,0 +1,354 @@
+"""
+Background ingester for the MBTA V3 streaming predictions feed
+"""
+import json
+import os
+import random
+import threading
+import time
+
+import http_client
+
+MBTA_BASE_URL = http_client.MBTA_API_URL
+
+
+class PredictionStore:
+    """
+    In-process copy of the MBTA predictions feed, indexed by stop.
+
+    Predictions are indexed under both their platform stop and its parent
+    station, so lookups by "place-..." station IDs work the same way the
+    MBTA filter[stop] parameter does. Route, trip and stop resources that
+    arrive alongside predictions are kept to resolve names and headsigns,
+    and dropped once the last prediction referring to them is gone.
+    """
+
+    def __init__(self):
+        self._predictions = {}   # prediction id -> resource
+        self._by_stop = {}       # stop or parent station id -> set of prediction ids
+        self._keys = {}          # prediction id -> tuple of stop keys it is indexed under
+        self._included = {}      # (type, id) -> resource for stops, routes and trips
+        self._refs = {}          # (type, id) -> number of predictions referring to it
+        self._lock = threading.Lock()
+        self.ready = False
+        self.updated_at = None
+
+    def _stop_keys(self, resource: dict) -> tuple:
+        stop = ((resource.get("relationships") or {}).get("stop") or {}).get("data")
+        if not stop:
+            return ()
+        stop_resource = self._included.get(("stop", stop["id"]))
+        if stop_resource:
+            parent = ((stop_resource.get("relationships") or {}).get("parent_station") or {}).get("data")
+            if parent:
+                return (stop["id"], parent["id"])
+        return (stop["id"],)
+
+    @staticmethod
+    def _references(resource: dict) -> list:
+        relationships = resource.get("relationships") or {}
+        refs = []
+        for name in ("route", "trip", "stop"):
+            data = (relationships.get(name) or {}).get("data")
+            if data:
+                refs.append((data["type"], data["id"]))
+        return refs
+
+    def _retain(self, resource: dict) -> None:
+        for key in self._references(resource):
+            self._refs[key] = self._refs.get(key, 0) + 1
+
+    def _release(self, resource: dict) -> None:
+        for key in self._references(resource):
+            count = self._refs.get(key, 0) - 1
+            if count > 0:
+                self._refs[key] = count
+            else:
+                self._refs.pop(key, None)
+                self._included.pop(key, None)
+
+    def _unindex(self, prediction_id: str) -> None:
+        for key in self._keys.pop(prediction_id, ()):
+            ids = self._by_stop.get(key)
+            if ids:
+                ids.discard(prediction_id)
+                if not ids:
+                    del self._by_stop[key]
+
+    def _apply_locked(self, resource: dict) -> None:
+        if resource.get("type") != "prediction":
+            self._included[(resource.get("type"), resource.get("id"))] = resource
+            if resource.get("type") == "stop":
+                # Re-index predictions that arrived before their stop did
+                for prediction_id in list(self._by_stop.get(resource.get("id"), ())):
+                    self._apply_locked(self._predictions[prediction_id])
+            return
+        prediction_id = resource["id"]
+        self._unindex(prediction_id)
+        # Retain before releasing, so resources the old and new versions share are kept
+        self._retain(resource)
+        previous = self._predictions.get(prediction_id)
+        if previous is not None:
+            self._release(previous)
+        self._predictions[prediction_id] = resource
+        keys = self._stop_keys(resource)
+        self._keys[prediction_id] = keys
+        for key in keys:
+            self._by_stop.setdefault(key, set()).add(prediction_id)
+
+    def reset(self, resources: list) -> None:
+        """
+        Replace the whole store with a fresh set of resources.
+
+        Args:
+            resources: Predictions and included resources from a "reset" event
+        """
+        with self._lock:
+            self._predictions.clear()
+            self._by_stop.clear()
+            self._keys.clear()
+            self._included.clear()
+            self._refs.clear()
+            # Included stops first so predictions can be indexed by parent station
+            for resource in sorted(resources, key=lambda r: r.get("type") == "prediction"):
+                self._apply_locked(resource)
+            self.ready = True
+            self.updated_at = time.time()
+
+    def upsert(self, resource: dict) -> None:
+        """
+        Apply an "add" or "update" event.
+
+        Args:
+            resource: The added or updated JSON:API resource
+        """
+        with self._lock:
+            self._apply_locked(resource)
+            self.updated_at = time.time()
+
+    def remove(self, resource: dict) -> None:
+        """
+        Apply a "remove" event.
+
+        Args:
+            resource: Resource identifier with "type" and "id"
+        """
+        with self._lock:
+            if resource.get("type") == "prediction":
+                self._unindex(resource["id"])
+                previous = self._predictions.pop(resource["id"], None)
+                if previous is not None:
+                    self._release(previous)
+            else:
+                self._included.pop((resource.get("type"), resource.get("id")), None)
+            self.updated_at = time.time()
+
+    def arrivals(self, stop_id: str) -> list:
+        """
+        Get stored predictions for a stop or parent station.
+
+        Args:
+            stop_id: MBTA stop or station ID
+
+        Returns:
+            list: Dictionaries with id, arrival_time, departure_time, status,
+                  route attributes and trip headsign, sorted by arrival time
+        """
+        with self._lock:
+            results = []
+            for prediction_id in self._by_stop.get(stop_id, ()):
+                prediction = self._predictions[prediction_id]
+                attributes = prediction.get("attributes") or {}
+                relationships = prediction.get("relationships") or {}
+                route_ref = (relationships.get("route") or {}).get("data") or {}
+                trip_ref = (relationships.get("trip") or {}).get("data") or {}
+                route = self._included.get(("route", route_ref.get("id")), {})
+                trip = self._included.get(("trip", trip_ref.get("id")), {})
+                results.append({
+                    "id": prediction_id,
+                    "arrival_time": attributes.get("arrival_time"),
+                    "departure_time": attributes.get("departure_time"),
+                    "status": attributes.get("status") or "",
+                    "route_id": route_ref.get("id"),
+                    "route": route.get("attributes") or {},
+                    "headsign": (trip.get("attributes") or {}).get("headsign"),
+                })
+        results.sort(key=lambda a: a["arrival_time"] or a["departure_time"] or "")
+        return results
+
+    def stats(self) -> dict:
+        """
+        Report store size and freshness.
+
+        Returns:
+            dict: Prediction count, indexed stop count, readiness and last update time
+        """
+        with self._lock:
+            return {
+                "predictions": len(self._predictions),
+                "stops": len(self._by_stop),
+                "ready": self.ready,
+                "updated_at": self.updated_at,
+            }
+
+
+def iter_events(lines):
+    """
+    Parse a text/event-stream into (event, data) pairs.
+
+    Args:
+        lines: Iterable of decoded lines without trailing newlines
+
+    Yields:
+        tuple: Event name and the raw data string of each complete event
+    """
+    event, data = "message", []
+    for line in lines:
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+class PredictionStreamIngester:
+    """
+    Keeps one long-lived subscription to the MBTA predictions event stream
+    and applies its reset/add/update/remove events to a PredictionStore.
+    """
+
+    def __init__(self, store: PredictionStore, mbta_key: str = None,
+                 route_types: str = "0,1", base_url: str = MBTA_BASE_URL):
+        """
+        Initialize a PredictionStreamIngester.
+
+        Args:
+            store: PredictionStore receiving the events
+            mbta_key: Optional authentication key for MBTA API
+            route_types: Comma-separated MBTA route types to subscribe to
+            base_url: API base URL (point at a local server to replay a recorded feed)
+        """
+        self.store = store
+        self.mbta_key = mbta_key
+        self.route_types = route_types
+        self.base_url = base_url
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def apply(self, event: str, data: str) -> None:
+        """
+        Apply a single stream event to the store.
+
+        Args:
+            event: Event name (reset, add, update or remove)
+            data: JSON payload of the event
+        """
+        payload = json.loads(data)
+        if event == "reset":
+            self.store.reset(payload)
+        elif event in ("add", "update"):
+            self.store.upsert(payload)
+        elif event == "remove":
+            self.store.remove(payload)
+
+    def consume(self) -> None:
+        """
+        Open the event stream and apply events until it closes.
+        """
+        params = {
+            "filter[route_type]": self.route_types,
+            "include": "stop,route,trip",
+        }
+        if self.mbta_key:
+            params["api_key"] = self.mbta_key
+        response = http_client.get_client().session.get(
+            f"{self.base_url}/predictions", params=params,
+            headers={"Accept": "text/event-stream"},
+            stream=True, timeout=(http_client.DEFAULT_TIMEOUT[0], 60))
+        try:
+            response.raise_for_status()
+            # chunk_size=None hands over each chunk as soon as it arrives instead of
+            # waiting for a fixed-size buffer to fill
+            lines = response.iter_lines(chunk_size=None, decode_unicode=True)
+            for event, data in iter_events(lines):
+                if self._stopped.is_set():
+                    break
+                self.apply(event, data)
+        finally:
+            response.close()
+
+    def run(self) -> None:
+        """
+        Consume the stream forever, reconnecting with jittered backoff.
+        """
+        failures = 0
+        while not self._stopped.is_set():
+            try:
+                self.consume()
+                failures = 0
+            except Exception as e:
+                print(f"Prediction stream error: {e}")
+                failures += 1
+            # Until the next "reset" arrives, lookups fall back to the REST API
+            self.store.ready = False
+            self._stopped.wait(random.uniform(0, min(60, 2 ** failures)))
+
+    def start(self) -> None:
+        """Start consuming in a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="prediction-stream", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the consumer thread to exit after its current event."""
+        self._stopped.set()
+
+
+_store = PredictionStore()
+_ingester = None
+_ingester_lock = threading.Lock()
+
+
+def get_prediction_store() -> PredictionStore:
+    """
+    Return the process-wide PredictionStore.
+
+    Returns:
+        PredictionStore: The shared store (only filled once the ingester runs)
+    """
+    return _store
+
+
+def start_prediction_stream(mbta_key: str = None) -> PredictionStreamIngester:
+    """
+    Start the shared ingester if MBTA_STREAM_PREDICTIONS is enabled.
+
+    MBTA_STREAM_ROUTE_TYPES and MBTA_STREAM_URL configure the subscription.
+
+    Args:
+        mbta_key: Optional authentication key for MBTA API
+
+    Returns:
+        PredictionStreamIngester: The running ingester, or None if disabled
+    """
+    global _ingester
+    if os.getenv("MBTA_STREAM_PREDICTIONS", "").lower() not in ("1", "true", "yes"):
+        return None
+    with _ingester_lock:
+        if _ingester is None:
+            _ingester = PredictionStreamIngester(
+                _store, mbta_key,
+                route_types=os.getenv("MBTA_STREAM_ROUTE_TYPES", "0,1"),
+                base_url=os.getenv("MBTA_STREAM_URL", MBTA_BASE_URL))
+            _ingester.start()
+        return _ingester
@@ -0,0 +1,176 @@
+"""
+Background prefetch of arrivals for the stations users keep coming back to
+
+Favorites and recent searches across every session feed a bounded,
+popularity-weighted working set (LFU with aging). On a fixed schedule the
+most popular stations have their predictions refreshed in bulk, within a
+per-minute request budget, so pages for those stations render from memory.
+"""
+import os
+import threading
+import time
+
+import rate_limit
+
+# Weights of the signals feeding the working set
+FAVORITE_WEIGHT = 3.0
+SEARCH_WEIGHT = 1.0
+VIEW_WEIGHT = 0.5
+
+# Counts are multiplied by this after every cycle so old popularity fades
+DEFAULT_DECAY = 0.98
+
+
+class ArrivalPrefetcher:
+    """
+    Keeps arrivals warm for a bounded set of popular stations.
+
+    Popularity counts are kept for at most max_stations stations; a new
+    station evicts the least frequently used one. Each cycle spends the
+    request budget accumulated since the last one on the most popular
+    stations, chunk_size stations per request.
+    """
+
+    def __init__(self, refresh, max_stations: int = 200, budget_per_minute: float = 6,
+                 interval: float = 10, chunk_size: int = 40, decay: float = DEFAULT_DECAY):
+        """
+        Initialize an ArrivalPrefetcher.
+
+        Args:
+            refresh: Callable taking a list of station IDs and refreshing their
+                     cached arrivals with one upstream request per chunk_size stations
+            max_stations: Upper bound on tracked stations
+            budget_per_minute: Upstream requests the prefetcher may make per minute
+            interval: Seconds between refresh cycles
+            chunk_size: Stations refreshed per upstream request
+            decay: Factor applied to every count after each cycle
+        """
+        self.refresh = refresh
+        self.max_stations = max_stations
+        self.budget_per_minute = budget_per_minute
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.decay = decay
+        self.counts = {}
+        self.evictions = 0
+        self.cycles = 0
+        self.refreshed = 0
+        self.requests = 0
+        self._credit = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def track(self, station_id: str, weight: float = SEARCH_WEIGHT) -> None:
+        """
+        Record interest in a station.
+
+        Args:
+            station_id: MBTA station ID (ignored if empty)
+            weight: How strongly this signal predicts a future visit
+        """
+        if not station_id:
+            return
+        with self._lock:
+            if station_id not in self.counts and len(self.counts) >= self.max_stations:
+                coldest = min(self.counts, key=self.counts.get)
+                del self.counts[coldest]
+                self.evictions += 1
+            self.counts[station_id] = self.counts.get(station_id, 0.0) + weight
+
+    def working_set(self, limit: int = None) -> list:
+        """
+        List tracked stations, most popular first.
+
+        Args:
+            limit: Optional maximum number of stations
+
+        Returns:
+            list: Station IDs
+        """
+        with self._lock:
+            ranked = sorted(self.counts, key=self.counts.get, reverse=True)
+        return ranked if limit is None else ranked[:limit]
+
+    def run_once(self) -> int:
+        """
+        Run one refresh cycle.
+
+        Returns:
+            int: Number of stations refreshed
+        """
+        self._credit = min(self._credit + self.budget_per_minute * self.interval / 60.0,
+                           max(1.0, self.budget_per_minute))
+        requests = int(self._credit)
+        stations = self.working_set(requests * self.chunk_size) if requests else []
+        if stations:
+            # Interactive searches keep priority over warming the cache
+            with rate_limit.priority(rate_limit.BACKGROUND):
+                self.refresh(stations)
+            spent = -(-len(stations) // self.chunk_size)
+            self._credit -= spent
+            self.requests += spent
+            self.refreshed += len(stations)
+        with self._lock:
+            for station_id in self.counts:
+                self.counts[station_id] *= self.decay
+            self.cycles += 1
+        return len(stations)
+
+    def start(self) -> None:
+        """Run refresh cycles in a daemon thread every interval seconds."""
+        if self._thread is not None or self.budget_per_minute <= 0:
+            return
+
+        def run():
+            while True:
+                started = time.monotonic()
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"Arrival prefetch error: {e}")
+                time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+        self._thread = threading.Thread(target=run, name="arrival-prefetch", daemon=True)
+        self._thread.start()
+
+    def stats(self) -> dict:
+        """
+        Report working set size and refresh activity.
+
+        Returns:
+            dict: tracked, evictions, cycles, refreshed (stations) and requests
+        """
+        return {"tracked": len(self.counts), "evictions": self.evictions, "cycles": self.cycles,
+                "refreshed": self.refreshed, "requests": self.requests}
+
+
+_shared_prefetcher = None
+_shared_lock = threading.Lock()
+
+
+def get_arrival_prefetcher(refresh) -> ArrivalPrefetcher:
+    """
+    Return the process-wide ArrivalPrefetcher, creating it on first use.
+
+    Configured with PREFETCH_MAX_STATIONS, PREFETCH_BUDGET (requests per
+    minute; 0 disables refreshing) and PREFETCH_INTERVAL (seconds).
+
+    Args:
+        refresh: Callable taking a list of station IDs, as for ArrivalPrefetcher
+
+    Returns:
+        ArrivalPrefetcher: The shared prefetcher (not started)
+    """
+    global _shared_prefetcher
+    with _shared_lock:
+        if _shared_prefetcher is None:
+            _shared_prefetcher = ArrivalPrefetcher(
+                refresh,
+                max_stations=int(os.getenv("PREFETCH_MAX_STATIONS", "200")),
+                budget_per_minute=float(os.getenv("PREFETCH_BUDGET", "6")),
+                interval=float(os.getenv("PREFETCH_INTERVAL", "10")),
+            )
+        return _shared_prefetcher
@@ -0,0 +1,189 @@
+"""
+Shared MBTA request budget: a token bucket with priority classes
+
+Every outbound MBTA call takes a token from its host's bucket before it is
+sent. The bucket refills at the key's per-minute quota and is corrected from
+the x-ratelimit-limit / -remaining / -reset headers on every response, so the
+local view never drifts far from MBTA's. Interactive requests may spend the
+whole budget; background refreshes and batch jobs stop short of a reserve,
+waiting (up to their deadline) for tokens instead of drawing 429s.
+
+The priority of a call comes from the calling thread:
+
+    with rate_limit.priority(rate_limit.BACKGROUND):
+        refresh_everything()
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE, BACKGROUND, BATCH = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "background", "batch")
+
+# Share of the bucket each class must leave for the classes above it
+DEFAULT_RESERVES = (0.0, 0.2, 0.4)
+
+# MBTA V3 quotas: requests per minute with and without an API key
+KEYED_PER_MINUTE = 1000
+ANONYMOUS_PER_MINUTE = 20
+
+_context = threading.local()
+
+
+class RateLimitDeferred(Exception):
+    """Raised when a call could not get a token before its deadline."""
+
+
+def current_priority() -> int:
+    """The priority class of the calling thread (INTERACTIVE unless set)."""
+    return getattr(_context, "priority", INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """
+    Run the enclosed block's upstream calls at a priority class.
+
+    Args:
+        level: INTERACTIVE, BACKGROUND or BATCH
+    """
+    previous = current_priority()
+    _context.priority = level
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+class TokenBucket:
+    """
+    Request budget for one host.
+
+    Waiters are served strictly by priority: while a more urgent call is
+    waiting, less urgent ones do not take tokens even if their reserve allows.
+    """
+
+    def __init__(self, per_minute: int, reserves: tuple = DEFAULT_RESERVES):
+        """
+        Initialize a full TokenBucket.
+
+        Args:
+            per_minute: Requests allowed per minute (bucket size and refill rate)
+            reserves: Per priority class, the share of the bucket it must leave untouched
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.reserves = reserves
+        self.tokens = self.capacity
+        self.blocked_until = 0.0
+        self.granted = [0] * len(reserves)
+        self.deferred = [0] * len(reserves)
+        self.throttled = 0
+        self._waiting = [0] * len(reserves)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _floor(self, level: int) -> float:
+        return self.capacity * self.reserves[level]
+
+    def acquire(self, level: int = INTERACTIVE, timeout: float = 0.0) -> bool:
+        """
+        Take one token, waiting up to timeout seconds for one to be available.
+
+        Args:
+            level: Priority class of the call
+            timeout: Seconds the caller is willing to wait
+
+        Returns:
+            bool: True if a token was taken, False if the call should be deferred
+        """
+        give_up_at = time.monotonic() + timeout
+        with self._cond:
+            self._waiting[level] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    ahead = any(self._waiting[p] for p in range(level))
+                    if not ahead and now >= self.blocked_until and self.tokens - 1 >= self._floor(level):
+                        self.tokens -= 1
+                        self.granted[level] += 1
+                        return True
+                    remaining = give_up_at - now
+                    if remaining <= 0:
+                        self.deferred[level] += 1
+                        return False
+                    if now < self.blocked_until:
+                        wait = self.blocked_until - now
+                    else:
+                        wait = max(0.01, (self._floor(level) + 1 - self.tokens) / self.rate)
+                    self._cond.wait(min(remaining, wait))
+            finally:
+                self._waiting[level] -= 1
+                self._cond.notify_all()
+
+    def refund(self) -> None:
+        """Return a token taken for a call that was never sent."""
+        with self._cond:
+            self.tokens = min(self.capacity, self.tokens + 1)
+            self._cond.notify_all()
+
+    def update(self, headers, status_code: int = 200) -> None:
+        """
+        Correct the budget from a response's rate limit headers.
+
+        Args:
+            headers: Response headers (case-insensitive mapping)
+            status_code: Response status; a 429 blocks the bucket until the reset time
+        """
+        try:
+            limit = headers.get("x-ratelimit-limit")
+            remaining = headers.get("x-ratelimit-remaining")
+            reset = headers.get("x-ratelimit-reset")
+            retry_after = headers.get("retry-after")
+            with self._cond:
+                now = time.monotonic()
+                self._refill(now)
+                if limit is not None and float(limit) > 0 and float(limit) != self.capacity:
+                    self.capacity = float(limit)
+                    self.rate = self.capacity / 60.0
+                if remaining is not None:
+                    # MBTA's count is authoritative when it is lower than ours
+                    self.tokens = min(self.tokens, float(remaining))
+                if status_code == 429 or (remaining is not None and float(remaining) <= 0):
+                    self.throttled += status_code == 429
+                    if retry_after is not None:
+                        wait = float(retry_after)
+                    elif reset is not None:
+                        # Reset is a Unix timestamp
+                        wait = float(reset) - time.time()
+                    else:
+                        wait = 1 / self.rate
+                    self.tokens = min(self.tokens, 0.0)
+                    self.blocked_until = max(self.blocked_until, now + min(max(wait, 0.0), 60.0))
+                self._cond.notify_all()
+        except (TypeError, ValueError):
+            pass
+
+    def stats(self) -> dict:
+        """
+        Report the budget.
+
+        Returns:
+            dict: tokens, capacity, waiting/granted/deferred per priority name,
+                  and 429 responses seen
+        """
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "tokens": round(self.tokens, 1),
+                "capacity": self.capacity,
+                "waiting": dict(zip(PRIORITY_NAMES, self._waiting)),
+                "granted": dict(zip(PRIORITY_NAMES, self.granted)),
+                "deferred": dict(zip(PRIORITY_NAMES, self.deferred)),
+                "throttled": self.throttled,
+            }
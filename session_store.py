@@ -0,0 +1,323 @@
+"""
+Server-side storage for per-user recent searches and favorites
+
+The browser cookie only carries a short session ID; the lists themselves live
+in a local SQLite file (or, for single-process development, in process
+memory). Both stores keep entries keyed by address, so re-adding an address
+replaces it in O(1) instead of scanning and copying the list.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class _UserData:
+    """Recent searches and favorites of one session, keyed by address in insertion order."""
+
+    __slots__ = ("recent", "favorites", "last_seen")
+
+    def __init__(self):
+        self.recent = OrderedDict()
+        self.favorites = OrderedDict()
+        self.last_seen = time.time()
+
+
+class MemorySessionStore:
+    """
+    Keeps session data in process memory.
+
+    Sessions idle for longer than the TTL are dropped, and the least recently
+    active sessions are evicted once max_sessions is reached. Data does not
+    survive a restart and is not shared between worker processes.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 30 * 24 * 3600):
+        """
+        Initialize a MemorySessionStore.
+
+        Args:
+            max_sessions: Maximum number of sessions kept before evicting idle ones
+            ttl: Seconds of inactivity after which a session is forgotten
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _user(self, session_id: str, create: bool = True) -> _UserData:
+        """
+        Fetch a session's data and mark it as recently active. Caller holds the lock.
+
+        Reads pass create=False, so visitors who never save anything (and
+        crawlers) do not take up sessions; they get None instead.
+        """
+        now = time.time()
+        user = self._sessions.get(session_id)
+        if user is not None and user.last_seen + self.ttl <= now:
+            del self._sessions[session_id]
+            user = None
+        if user is None:
+            if not create:
+                return None
+            user = self._sessions[session_id] = _UserData()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        user.last_seen = now
+        self._sessions.move_to_end(session_id)
+        return user
+
+    def recent_searches(self, session_id: str) -> list:
+        """
+        Get a session's recent searches.
+
+        Args:
+            session_id: Session ID from the cookie
+
+        Returns:
+            list: Search entries, newest first
+        """
+        with self._lock:
+            user = self._user(session_id, create=False)
+            return list(reversed(user.recent.values())) if user is not None else []
+
+    def add_recent_search(self, session_id: str, entry: dict, limit: int) -> None:
+        """
+        Record a search, replacing any earlier search for the same address.
+
+        Args:
+            session_id: Session ID from the cookie
+            entry: Search entry with an "address" key
+            limit: Number of searches to keep
+        """
+        with self._lock:
+            recent = self._user(session_id).recent
+            recent.pop(entry["address"], None)
+            recent[entry["address"]] = entry
+            while len(recent) > limit:
+                recent.popitem(last=False)
+
+    def clear_recent_searches(self, session_id: str) -> None:
+        """Forget every recent search of a session."""
+        with self._lock:
+            user = self._user(session_id, create=False)
+            if user is not None:
+                user.recent.clear()
+
+    def favorites(self, session_id: str) -> list:
+        """
+        Get a session's favorites.
+
+        Args:
+            session_id: Session ID from the cookie
+
+        Returns:
+            list: Favorite entries in the order they were added
+        """
+        with self._lock:
+            user = self._user(session_id, create=False)
+            return list(user.favorites.values()) if user is not None else []
+
+    def add_favorite(self, session_id: str, favorite: dict) -> bool:
+        """
+        Save a favorite unless its address is already saved.
+
+        Args:
+            session_id: Session ID from the cookie
+            favorite: Favorite entry with an "address" key
+
+        Returns:
+            bool: True if added, False if the address was already a favorite
+        """
+        with self._lock:
+            favorites = self._user(session_id).favorites
+            if favorite["address"] in favorites:
+                return False
+            favorites[favorite["address"]] = favorite
+            return True
+
+    def remove_favorite(self, session_id: str, address: str) -> bool:
+        """
+        Remove a favorite by address.
+
+        Args:
+            session_id: Session ID from the cookie
+            address: Address of the favorite
+
+        Returns:
+            bool: True if a favorite was removed
+        """
+        with self._lock:
+            user = self._user(session_id, create=False)
+            return user is not None and user.favorites.pop(address, None) is not None
+
+    def stats(self) -> dict:
+        """
+        Report the size of the store.
+
+        Returns:
+            dict: Backend name and number of sessions held
+        """
+        return {"backend": "memory", "sessions": len(self._sessions)}
+
+
+class SQLiteSessionStore:
+    """
+    Keeps session data in a local SQLite file.
+
+    Every entry is a row keyed by (session ID, address), so adding, replacing
+    and removing an entry touches one row plus an index lookup. Data survives
+    restarts and is shared by every worker process on the host. Sessions idle
+    for longer than the TTL are deleted on opening and every expire_every writes.
+    """
+
+    def __init__(self, path: str, ttl: float = 90 * 24 * 3600, expire_every: int = 1000):
+        """
+        Initialize a SQLiteSessionStore, creating its tables if needed.
+
+        Args:
+            path: SQLite database file
+            ttl: Seconds without changes after which a session is deleted
+            expire_every: Writes between sweeps for expired sessions
+        """
+        self.ttl = ttl
+        self.expire_every = expire_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            for table in ("recent_searches", "favorites"):
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} "
+                    "(session_id TEXT NOT NULL, address TEXT NOT NULL, seq INTEGER NOT NULL, "
+                    "entry TEXT NOT NULL, PRIMARY KEY (session_id, address))")
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_seq ON {table} (session_id, seq)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+            self._expire()
+
+    def _expire(self) -> None:
+        """Delete sessions that have not changed within the TTL."""
+        cutoff = time.time() - self.ttl
+        for table in ("recent_searches", "favorites"):
+            self._db.execute(
+                f"DELETE FROM {table} WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_seen < ?)", (cutoff,))
+        self._db.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+
+    def _touch(self, session_id: str) -> None:
+        self._db.execute("INSERT OR REPLACE INTO sessions (session_id, last_seen) VALUES (?, ?)",
+                         (session_id, time.time()))
+        # Sweep now and then, so a long-running process does not keep idle sessions forever
+        self._writes += 1
+        if self._writes >= self.expire_every:
+            self._writes = 0
+            self._expire()
+
+    def _entries(self, table: str, session_id: str, order: str) -> list:
+        rows = self._db.execute(
+            f"SELECT entry FROM {table} WHERE session_id = ? ORDER BY seq {order}", (session_id,))
+        return [json.loads(entry) for entry, in rows]
+
+    def _insert(self, table: str, session_id: str, entry: dict, replace: bool) -> bool:
+        (seq,) = self._db.execute(
+            f"SELECT COALESCE(MAX(seq), 0) + 1 FROM {table} WHERE session_id = ?", (session_id,)).fetchone()
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        cursor = self._db.execute(
+            f"{verb} INTO {table} (session_id, address, seq, entry) VALUES (?, ?, ?, ?)",
+            (session_id, entry["address"], seq, json.dumps(entry)))
+        return cursor.rowcount > 0
+
+    def recent_searches(self, session_id: str) -> list:
+        """Get a session's recent searches, newest first."""
+        with self._lock:
+            return self._entries("recent_searches", session_id, "DESC")
+
+    def add_recent_search(self, session_id: str, entry: dict, limit: int) -> None:
+        """Record a search, replacing any earlier search for the same address."""
+        with self._lock, self._db:
+            self._insert("recent_searches", session_id, entry, replace=True)
+            self._db.execute(
+                "DELETE FROM recent_searches WHERE session_id = ? AND seq <= "
+                "(SELECT seq FROM recent_searches WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                (session_id, session_id, limit))
+            self._touch(session_id)
+
+    def clear_recent_searches(self, session_id: str) -> None:
+        """Forget every recent search of a session."""
+        with self._lock, self._db:
+            if self._db.execute("DELETE FROM recent_searches WHERE session_id = ?", (session_id,)).rowcount:
+                self._touch(session_id)
+
+    def favorites(self, session_id: str) -> list:
+        """Get a session's favorites in the order they were added."""
+        with self._lock:
+            return self._entries("favorites", session_id, "ASC")
+
+    def add_favorite(self, session_id: str, favorite: dict) -> bool:
+        """Save a favorite unless its address is already saved; True if added."""
+        with self._lock, self._db:
+            added = self._insert("favorites", session_id, favorite, replace=False)
+            self._touch(session_id)
+            return added
+
+    def remove_favorite(self, session_id: str, address: str) -> bool:
+        """Remove a favorite by address; True if one was removed."""
+        with self._lock, self._db:
+            cursor = self._db.execute("DELETE FROM favorites WHERE session_id = ? AND address = ?",
+                                      (session_id, address))
+            if cursor.rowcount:
+                self._touch(session_id)
+            return cursor.rowcount > 0
+
+    def stats(self) -> dict:
+        """
+        Report the size of the store.
+
+        Returns:
+            dict: Backend name and number of sessions held
+        """
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        return {"backend": "sqlite", "sessions": count}
+
+
+_session_store = None
+_session_lock = threading.Lock()
+
+
+def get_session_store():
+    """
+    Return the process-wide session store, creating it on first use.
+
+    SESSION_STORE selects "sqlite" (the default) or "memory"; the SQLite
+    file is SESSION_DB_PATH and the in-memory store holds at most
+    MAX_SESSIONS sessions. The in-memory store loses every session on
+    restart and gives each worker process its own sessions, so it is only
+    meant for single-process development; a warning is printed when
+    WEB_CONCURRENCY asks for more workers. Falls back to memory if the
+    database cannot be opened.
+
+    Returns:
+        MemorySessionStore or SQLiteSessionStore: The shared session store
+    """
+    global _session_store
+    with _session_lock:
+        if _session_store is None:
+            if os.getenv("SESSION_STORE", "sqlite").lower() != "memory":
+                try:
+                    _session_store = SQLiteSessionStore(os.getenv("SESSION_DB_PATH", "sessions.db"))
+                except Exception as e:
+                    print(f"Session store error, keeping sessions in memory: {e}")
+            if _session_store is None:
+                if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+                    print("Warning: in-memory sessions are not shared between worker processes; "
+                          "recent searches and favorites will come and go between requests "
+                          "(use SESSION_STORE=sqlite)")
+                _session_store = MemorySessionStore(max_sessions=int(os.getenv("MAX_SESSIONS", "10000")))
+        return _session_store
@@ -0,0 +1,321 @@
+"""
+Station metadata catalog: lines, accessibility, address and child platforms
+
+Built from the station index's stop set plus one chunked /stops call for
+addresses and platforms, and rebuilt whenever the index reloads. Stations can
+be looked up by MBTA ID, by normalized name, or by a fuzzy-matched alias.
+"""
+import difflib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import http_client
+import jsonapi
+from gazetteer import tokenize
+
+MBTA_BASE_URL = http_client.MBTA_API_URL
+
+# Station IDs per /stops request (keeps the query string a sensible length)
+FETCH_CHUNK = 100
+
+# Minimum difflib similarity for a fuzzy alias match
+FUZZY_CUTOFF = 0.8
+
+# Words folded to the short form riders type, so "Mass Ave" and
+# "Massachusetts Avenue" share a key
+SPELLINGS = {
+    "massachusetts": "mass",
+    "avenue": "ave",
+    "street": "st",
+    "square": "sq",
+    "center": "ctr",
+    "saint": "st",
+}
+
+# Route type -> noun for the "lines" list when a route has no long name
+ROUTE_KINDS = {0: "Light Rail", 1: "Subway", 2: "Commuter Rail", 3: "Bus", 4: "Ferry"}
+
+
+class StationRecord:
+    """
+    Metadata for one parent station.
+    """
+
+    __slots__ = ("id", "name", "lines", "wheelchair_boarding", "address",
+                 "latitude", "longitude", "platforms", "etag")
+
+    def __init__(self, station_id: str, name: str, lines: tuple, wheelchair_boarding: int,
+                 address: str, latitude: float, longitude: float, platforms: tuple):
+        self.id = station_id
+        self.name = name
+        self.lines = lines
+        self.wheelchair_boarding = wheelchair_boarding
+        self.address = address
+        self.latitude = latitude
+        self.longitude = longitude
+        self.platforms = platforms  # (id, name, wheelchair_boarding) tuples
+        body = json.dumps(self.to_dict(), sort_keys=True)
+        self.etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the record for the API.
+
+        Returns:
+            dict: id, name, lines, accessible, wheelchair_boarding, address,
+                  latitude, longitude and platforms
+        """
+        return {
+            "id": self.id,
+            "name": self.name,
+            "lines": list(self.lines),
+            # MBTA wheelchair_boarding: 0 = no information, 1 = accessible, 2 = inaccessible
+            "accessible": self.wheelchair_boarding == 1,
+            "wheelchair_boarding": self.wheelchair_boarding,
+            "address": self.address,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "platforms": [{"id": p[0], "name": p[1], "wheelchair_boarding": p[2]} for p in self.platforms],
+        }
+
+
+def station_key(text: str) -> str:
+    """
+    Normalize a station name or query into a lookup key.
+
+    Args:
+        text: Station name or query
+
+    Returns:
+        str: Lowercased tokens with common words in their short form
+    """
+    return " ".join(SPELLINGS.get(t, t) for t in tokenize(text))
+
+
+def aliases(name: str) -> set:
+    """
+    Alternative keys for a station name.
+
+    Besides the name itself, each half of a compound name
+    ("Science Park/West End") is an alias.
+
+    Args:
+        name: Station name
+
+    Returns:
+        set: Non-empty lookup keys
+    """
+    parts = [name] + (name.split("/") if "/" in name else [])
+    return {key for key in (station_key(part) for part in parts) if key}
+
+
+class _Catalog:
+    """
+    Immutable lookup tables over one set of station records.
+    """
+
+    __slots__ = ("by_id", "by_name", "by_alias", "alias_keys", "loaded_at")
+
+    def __init__(self, records: list):
+        self.by_id = {r.id: r for r in records}
+        self.by_name = {}
+        self.by_alias = {}
+        for record in records:
+            self.by_name.setdefault(station_key(record.name), record)
+            for alias in aliases(record.name):
+                self.by_alias.setdefault(alias, record)
+        self.alias_keys = sorted(self.by_alias)
+        self.loaded_at = time.time()
+
+
+class StationCatalog:
+    """
+    Station metadata held in memory and rebuilt whenever the station index reloads.
+    """
+
+    def __init__(self, mbta_key: str = None):
+        """
+        Initialize an empty StationCatalog.
+
+        Args:
+            mbta_key: Optional authentication key for MBTA API
+        """
+        self.mbta_key = mbta_key
+        self._catalog = None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._builder = None
+
+    @property
+    def loaded(self) -> bool:
+        """True once a catalog has been built."""
+        return self._catalog is not None
+
+    def __len__(self) -> int:
+        catalog = self._catalog
+        return len(catalog.by_id) if catalog is not None else 0
+
+    def _fetch_details(self, station_ids: list) -> dict:
+        """
+        Fetch addresses and child platforms for stations.
+
+        Args:
+            station_ids: Parent station IDs
+
+        Returns:
+            dict: Station ID -> (address, tuple of platform tuples)
+        """
+        details = {}
+        for start in range(0, len(station_ids), FETCH_CHUNK):
+            params = {"filter[id]": ",".join(station_ids[start:start + FETCH_CHUNK]),
+                      "include": "child_stops"}
+            if self.mbta_key:
+                params["api_key"] = self.mbta_key
+            doc = jsonapi.Document(http_client.get_json(f"{MBTA_BASE_URL}/stops", params=params))
+            for stop in doc.data:
+                platforms = tuple(
+                    (child.id,
+                     child.attributes.get("platform_name") or child.attributes.get("name") or "",
+                     child.attributes.get("wheelchair_boarding") or 0)
+                    for child in doc.related_all(stop, "child_stops", "stop")
+                    if (child.attributes.get("location_type") or 0) == 0)
+                details[stop.id] = (stop.attributes.get("address"), platforms)
+        return details
+
+    def build(self, stops: list, routes: dict) -> None:
+        """
+        Build a new catalog and swap it in.
+
+        If the detail fetch fails, stations keep their previous address and
+        platforms (or none on the first build) rather than disappearing.
+
+        Args:
+            stops: Stop dictionaries from StationIndex.stops()
+            routes: Route ID -> route dictionary from StationIndex.routes()
+        """
+        try:
+            details = self._fetch_details([s["id"] for s in stops])
+        except Exception as e:
+            print(f"Station catalog detail fetch error: {e}")
+            previous = self._catalog.by_id if self._catalog is not None else {}
+            details = {sid: (r.address, r.platforms) for sid, r in previous.items()}
+
+        records = []
+        for stop in stops:
+            address, platforms = details.get(stop["id"], (None, ()))
+            lines = []
+            for route_id in stop["routes"]:
+                route = routes.get(route_id, {})
+                line = (route.get("long_name") or route.get("short_name")
+                        or ROUTE_KINDS.get(route.get("type"), route_id))
+                if line not in lines:
+                    lines.append(line)
+            records.append(StationRecord(
+                stop["id"], stop["name"], tuple(lines), stop["wheelchair_boarding"],
+                address or stop.get("description") or None,
+                stop["latitude"], stop["longitude"], platforms))
+        self._catalog = _Catalog(records)
+
+    def on_station_index_load(self, station_index) -> None:
+        """
+        StationIndex listener rebuilding the catalog in a daemon thread.
+
+        The detail fetch makes network calls, so it runs off the index's
+        refresh thread. Loads arriving while a build runs are coalesced into
+        one more build from the latest stop set.
+        """
+        with self._lock:
+            self._pending = (station_index.stops(), station_index.routes())
+            if self._builder is not None:
+                return
+            self._builder = threading.Thread(target=self._run_builds, name="station-catalog-build", daemon=True)
+            self._builder.start()
+
+    def _run_builds(self) -> None:
+        """Build from pending stop sets until none is left."""
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    self._builder = None
+                    return
+            try:
+                self.build(*pending)
+            except Exception as e:
+                print(f"Station catalog build error: {e}")
+
+    def get(self, station_id: str) -> StationRecord:
+        """
+        Look up a station by MBTA ID.
+
+        Args:
+            station_id: Parent station ID, e.g. "place-pktrm"
+
+        Returns:
+            StationRecord: The station, or None if unknown or not loaded
+        """
+        catalog = self._catalog
+        return catalog.by_id.get(station_id) if catalog is not None else None
+
+    def lookup(self, key: str) -> StationRecord:
+        """
+        Resolve an ID, name or approximate name to a station.
+
+        Tries the MBTA ID, then the normalized name, then known aliases, and
+        finally the closest alias by string similarity.
+
+        Args:
+            key: Station ID, name or something close to it
+
+        Returns:
+            StationRecord: The best match, or None if nothing is close enough
+        """
+        catalog = self._catalog
+        if catalog is None:
+            return None
+        record = catalog.by_id.get(key)
+        if record is not None:
+            return record
+        name = station_key(key)
+        record = catalog.by_name.get(name) or catalog.by_alias.get(name)
+        if record is not None:
+            return record
+        close = difflib.get_close_matches(name, catalog.alias_keys, n=1, cutoff=FUZZY_CUTOFF)
+        return catalog.by_alias[close[0]] if close else None
+
+    def stats(self) -> dict:
+        """
+        Report catalog size and age.
+
+        Returns:
+            dict: stations, aliases and age_seconds (None if not loaded)
+        """
+        catalog = self._catalog
+        if catalog is None:
+            return {"stations": 0, "aliases": 0, "age_seconds": None}
+        return {"stations": len(catalog.by_id), "aliases": len(catalog.alias_keys),
+                "age_seconds": round(time.time() - catalog.loaded_at, 1)}
+
+
+_shared_catalog = None
+_shared_lock = threading.Lock()
+
+
+def get_station_catalog(mbta_key: str = None) -> StationCatalog:
+    """
+    Return the process-wide StationCatalog, creating it on first use.
+
+    Args:
+        mbta_key: Optional authentication key for MBTA API
+
+    Returns:
+        StationCatalog: The shared catalog instance
+    """
+    global _shared_catalog
+    with _shared_lock:
+        if _shared_catalog is None:
+            _shared_catalog = StationCatalog(mbta_key or os.getenv("MBTA_API_KEY"))
+        return _shared_catalog
@@ -0,0 +1,470 @@
+"""
+In-memory spatial index of MBTA stops for nearest-station lookups
+"""
+import os
+import threading
+import time
+from array import array
+from math import radians, cos
+
+import http_client
+import rate_limit
+from distance import nearest_k, within as within_radius
+
+MBTA_BASE_URL = http_client.MBTA_API_URL
+
+# Miles per degree of latitude (and of longitude at the equator)
+MILES_PER_DEGREE = 69.09
+
+# Default set of route types kept in the index (0=light rail, 1=subway)
+DEFAULT_ROUTE_TYPES = (0, 1)
+
+
+class _Snapshot:
+    """
+    Immutable view of one loaded stop set.
+
+    Coordinates live in parallel arrays and are bucketed into a square grid
+    over a local equirectangular projection, so a k-nearest query only has to
+    look at the few cells around the query point.
+    """
+
+    __slots__ = ("ids", "names", "descriptions", "lats", "lons", "xs", "ys",
+                 "type_masks", "wheelchair", "stop_routes", "routes",
+                 "lat0", "lon0", "x_scale", "cell_miles", "grid", "bounds", "loaded_at")
+
+    def __init__(self, stops: list, routes: dict, cell_miles: float):
+        self.routes = routes
+        self.cell_miles = cell_miles
+        self.ids = [s["id"] for s in stops]
+        self.names = [s["name"] for s in stops]
+        self.descriptions = [s["description"] for s in stops]
+        self.lats = array("d", (s["latitude"] for s in stops))
+        self.lons = array("d", (s["longitude"] for s in stops))
+        self.type_masks = array("H", (s["type_mask"] for s in stops))
+        self.wheelchair = array("b", (s["wheelchair_boarding"] for s in stops))
+        self.stop_routes = [tuple(s["routes"]) for s in stops]
+
+        # Project around the centroid so grid cells are roughly square in miles
+        count = len(stops) or 1
+        self.lat0 = sum(self.lats) / count
+        self.lon0 = sum(self.lons) / count
+        self.x_scale = MILES_PER_DEGREE * cos(radians(self.lat0))
+        self.xs = array("d", ((lon - self.lon0) * self.x_scale for lon in self.lons))
+        self.ys = array("d", ((lat - self.lat0) * MILES_PER_DEGREE for lat in self.lats))
+
+        self.grid = {}
+        for i in range(len(self.ids)):
+            self.grid.setdefault(self._cell(self.xs[i], self.ys[i]), []).append(i)
+        gxs = [gx for gx, _ in self.grid] or [0]
+        gys = [gy for _, gy in self.grid] or [0]
+        self.bounds = (min(gxs), max(gxs), min(gys), max(gys))
+        self.loaded_at = time.time()
+
+    def _cell(self, x: float, y: float) -> tuple:
+        return (int(x // self.cell_miles), int(y // self.cell_miles))
+
+    def project(self, latitude: float, longitude: float) -> tuple:
+        return ((longitude - self.lon0) * self.x_scale, (latitude - self.lat0) * MILES_PER_DEGREE)
+
+    def nearest(self, latitude: float, longitude: float, k: int, type_mask: int,
+                max_miles: float = None) -> list:
+        """
+        Return up to k (squared planar distance, index) pairs, nearest first.
+
+        Rings of cells are scanned outward from the query cell until the
+        k-th best candidate is closer than anything an unscanned ring could hold.
+        """
+        if not self.ids or k <= 0:
+            return []
+        x, y = self.project(latitude, longitude)
+        cx, cy = self._cell(x, y)
+        xs, ys, masks, grid, cell = self.xs, self.ys, self.type_masks, self.grid, self.cell_miles
+        limit_sq = max_miles * max_miles if max_miles is not None else None
+        found = []
+        # Beyond this ring every cell in the grid has been visited
+        min_gx, max_gx, min_gy, max_gy = self.bounds
+        max_ring = max(cx - min_gx, max_gx - cx, cy - min_gy, max_gy - cy, 0)
+        ring = 0
+        while ring <= max_ring:
+            if ring == 0:
+                cells = ((cx, cy),)
+            else:
+                cells = [(cx + dx, cy + dy)
+                         for dx in range(-ring, ring + 1)
+                         for dy in (-ring, ring)]
+                cells += [(cx + dx, cy + dy)
+                          for dx in (-ring, ring)
+                          for dy in range(-ring + 1, ring)]
+            for key in cells:
+                for i in grid.get(key, ()):
+                    if not masks[i] & type_mask:
+                        continue
+                    dx, dy = xs[i] - x, ys[i] - y
+                    d = dx * dx + dy * dy
+                    if limit_sq is None or d <= limit_sq:
+                        found.append((d, i))
+            # Any point outside the scanned rings is at least `ring` cells away
+            bound = ring * cell
+            if len(found) >= k:
+                found.sort()
+                del found[k:]
+                if found[-1][0] <= bound * bound:
+                    break
+            if limit_sq is not None and bound * bound > limit_sq:
+                break
+            ring += 1
+        found.sort()
+        return found[:k]
+
+
+class StationIndex:
+    """
+    Holds the full MBTA stop set in memory and answers k-nearest queries locally.
+
+    The stop set is fetched once (one /routes call plus one /stops call per route)
+    and refreshed in the background, so searches never wait on MBTA to rank stops.
+    """
+
+    def __init__(self, mbta_key: str = None, route_types: tuple = DEFAULT_ROUTE_TYPES,
+                 cell_miles: float = 0.5, max_age: float = 24 * 3600):
+        """
+        Initialize an empty StationIndex.
+
+        Args:
+            mbta_key: Optional authentication key for MBTA API
+            route_types: MBTA route types whose stops are loaded into the index
+            cell_miles: Edge length of a grid cell in miles
+            max_age: Seconds before the stop set is considered stale and reloaded
+        """
+        self.mbta_key = mbta_key
+        self.route_types = tuple(sorted(int(t) for t in route_types))
+        self.cell_miles = cell_miles
+        self.max_age = max_age
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._listeners = []
+        self.raster = None
+        self._raster_map = (None, None)  # (snapshot, raster position -> snapshot position)
+
+    @property
+    def loaded(self) -> bool:
+        """True once a stop set has been loaded."""
+        return self._snapshot is not None
+
+    def covers(self, route_types) -> bool:
+        """
+        Check whether a route type filter can be answered from the index.
+
+        Args:
+            route_types: Iterable of route types, or None for all types
+
+        Returns:
+            bool: True if every requested type is held in the index
+        """
+        if route_types is None:
+            return False
+        return {int(t) for t in route_types} <= set(self.route_types)
+
+    def _get(self, path: str, params: dict) -> dict:
+        if self.mbta_key:
+            params["api_key"] = self.mbta_key
+        return http_client.get_json(f"{MBTA_BASE_URL}{path}", params=params)
+
+    def load(self) -> None:
+        """
+        Fetch every stop served by the indexed route types and swap in a new snapshot.
+        """
+        route_data = self._get("/routes", {"filter[type]": ",".join(str(t) for t in self.route_types)})
+        routes = {}
+        stops = {}
+        for route in route_data.get("data", []):
+            attributes = route.get("attributes", {})
+            routes[route["id"]] = {
+                "id": route["id"],
+                "long_name": attributes.get("long_name", ""),
+                "short_name": attributes.get("short_name", ""),
+                "color": attributes.get("color", ""),
+                "type": attributes.get("type"),
+            }
+            stop_data = self._get("/stops", {"filter[route]": route["id"]})
+            for stop in stop_data.get("data", []):
+                attributes = stop["attributes"]
+                if attributes.get("latitude") is None or attributes.get("longitude") is None:
+                    continue
+                entry = stops.get(stop["id"])
+                if entry is None:
+                    entry = stops[stop["id"]] = {
+                        "id": stop["id"],
+                        "name": attributes["name"],
+                        "description": attributes.get("description") or "",
+                        "latitude": attributes["latitude"],
+                        "longitude": attributes["longitude"],
+                        "wheelchair_boarding": attributes.get("wheelchair_boarding") or 0,
+                        "type_mask": 0,
+                        "routes": [],
+                    }
+                entry["routes"].append(route["id"])
+                if routes[route["id"]]["type"] is not None:
+                    entry["type_mask"] |= 1 << routes[route["id"]]["type"]
+        self._snapshot = _Snapshot(list(stops.values()), routes, self.cell_miles)
+        for listener in list(self._listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                print(f"Station index listener error: {e}")
+
+    def attach_raster(self, raster) -> None:
+        """
+        Answer nearest-stop queries from a precomputed StationRaster when possible.
+
+        The raster is only used while its stop set matches the loaded one.
+
+        Args:
+            raster: A StationRaster built from this index's route types, or None
+        """
+        self.raster = raster
+        self._raster_map = (None, None)
+
+    def _raster_positions(self, snapshot: _Snapshot) -> list:
+        """Map raster stop positions onto a snapshot, or None if the stop sets differ."""
+        mapped_snapshot, positions = self._raster_map
+        if mapped_snapshot is snapshot:
+            return positions
+        raster = self.raster
+        positions = None
+        if raster.route_types == self.route_types and set(raster.stop_ids) == set(snapshot.ids):
+            lookup = {stop_id: i for i, stop_id in enumerate(snapshot.ids)}
+            positions = [lookup[stop_id] for stop_id in raster.stop_ids]
+        else:
+            print("Station raster does not match the loaded stops; using the index until it is rebuilt")
+        self._raster_map = (snapshot, positions)
+        return positions
+
+    def _from_raster(self, snapshot: _Snapshot, latitude: float, longitude: float,
+                     k: int, type_mask: int) -> list:
+        """Answer a k-nearest query from the raster, or return None to use the grid."""
+        raster = self.raster
+        if raster is None or k > raster.k or type_mask != self._type_mask(None):
+            return None
+        positions = self._raster_positions(snapshot)
+        hit = raster.lookup(latitude, longitude) if positions is not None else None
+        if hit is not None:
+            candidates, slack = hit
+            records = self._records(snapshot, latitude, longitude, [positions[p] for p in candidates], k)
+            # Distances are rounded to 0.01 miles; compare the worst case
+            if records and records[-1]["distance"] + 0.005 <= slack:
+                raster.record(True)
+                return records
+        raster.record(False)
+        return None
+
+    def add_listener(self, callback) -> None:
+        """
+        Register a callback run after every successful load.
+
+        The callback is also run immediately if a stop set is already loaded.
+
+        Args:
+            callback: Callable taking this StationIndex
+        """
+        self._listeners.append(callback)
+        if self.loaded:
+            callback(self)
+
+    def stops(self) -> list:
+        """
+        List every stop in the current snapshot.
+
+        Returns:
+            list: Stop dictionaries with id, name, description, latitude,
+                  longitude, wheelchair_boarding and route IDs, empty if not loaded
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        return [{
+            "id": snapshot.ids[i],
+            "name": snapshot.names[i],
+            "description": snapshot.descriptions[i],
+            "latitude": snapshot.lats[i],
+            "longitude": snapshot.lons[i],
+            "wheelchair_boarding": snapshot.wheelchair[i],
+            "routes": list(snapshot.stop_routes[i]),
+        } for i in range(len(snapshot.ids))]
+
+    def routes(self) -> dict:
+        """
+        Get the routes of the current snapshot.
+
+        Returns:
+            dict: Route ID -> route dictionary, empty if not loaded
+        """
+        snapshot = self._snapshot
+        return dict(snapshot.routes) if snapshot is not None else {}
+
+    def refresh_if_stale(self) -> None:
+        """
+        Reload the stop set if it was never loaded or is older than max_age.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - snapshot.loaded_at < self.max_age:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # Another thread is already reloading
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Station index load error: {e}")
+        finally:
+            self._lock.release()
+
+    def start_background_refresh(self, interval: float = None) -> None:
+        """
+        Load the index in a daemon thread and keep reloading it on a schedule.
+
+        Args:
+            interval: Seconds between staleness checks (defaults to max_age)
+        """
+        if self._refresher is not None:
+            return
+        interval = interval or self.max_age
+
+        def run():
+            while True:
+                with rate_limit.priority(rate_limit.BACKGROUND):
+                    self.refresh_if_stale()
+                # Retry sooner while nothing has loaded yet
+                time.sleep(interval if self.loaded else min(interval, 60))
+
+        self._refresher = threading.Thread(target=run, name="station-index-refresh", daemon=True)
+        self._refresher.start()
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1,
+                route_types=None, max_miles: float = None) -> list:
+        """
+        Find the k stops nearest to a point.
+
+        Args:
+            latitude: The latitude coordinate
+            longitude: The longitude coordinate
+            k: Maximum number of stops to return
+            route_types: Optional iterable of route types to filter by
+            max_miles: Optional search radius in miles
+
+        Returns:
+            list: Stop dictionaries ordered by distance, empty if the index is not loaded
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        type_mask = self._type_mask(route_types)
+        if max_miles is None:
+            records = self._from_raster(snapshot, latitude, longitude, k, type_mask)
+            if records is not None:
+                return records
+        # Over-fetch a little so near-ties in the flat projection survive re-ranking
+        candidates = [i for _, i in snapshot.nearest(latitude, longitude, 2 * k + 2, type_mask, max_miles)]
+        return self._records(snapshot, latitude, longitude, candidates, k)
+
+    def nearest_many(self, points: list, route_types=None) -> list:
+        """
+        Find the nearest stop to each of many points against one snapshot.
+
+        Args:
+            points: List of (latitude, longitude) tuples
+            route_types: Optional iterable of route types to filter by
+
+        Returns:
+            list: The nearest stop dictionary (or None) for each point, in order
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return [None] * len(points)
+        type_mask = self._type_mask(route_types)
+        results = []
+        for latitude, longitude in points:
+            records = self._from_raster(snapshot, latitude, longitude, 1, type_mask)
+            if records is None:
+                candidates = [i for _, i in snapshot.nearest(latitude, longitude, 4, type_mask)]
+                records = self._records(snapshot, latitude, longitude, candidates, 1)
+            results.append(records[0] if records else None)
+        return results
+
+    def within(self, latitude: float, longitude: float, miles: float, route_types=None) -> list:
+        """
+        Find every stop within a radius of a point.
+
+        Args:
+            latitude: The latitude coordinate
+            longitude: The longitude coordinate
+            miles: Search radius in miles
+            route_types: Optional iterable of route types to filter by
+
+        Returns:
+            list: Stop dictionaries ordered by distance, empty if the index is not loaded
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        type_mask = self._type_mask(route_types)
+        # Pad the planar radius slightly; exact great-circle distances decide below
+        candidates = [i for _, i in snapshot.nearest(latitude, longitude, len(snapshot.ids),
+                                                     type_mask, miles * 1.01)]
+        hits = within_radius(latitude, longitude,
+                             [snapshot.lats[i] for i in candidates],
+                             [snapshot.lons[i] for i in candidates], miles)
+        return [self._record(snapshot, candidates[j], d) for j, d in hits]
+
+    def _type_mask(self, route_types) -> int:
+        type_mask = 0
+        for t in self.route_types if route_types is None else route_types:
+            type_mask |= 1 << int(t)
+        return type_mask
+
+    def _records(self, snapshot: _Snapshot, latitude: float, longitude: float,
+                 candidates: list, k: int) -> list:
+        # Re-rank on true great-circle distance; the grid works in a flat projection
+        ranked = nearest_k(latitude, longitude,
+                           [snapshot.lats[i] for i in candidates],
+                           [snapshot.lons[i] for i in candidates], k)
+        return [self._record(snapshot, candidates[j], d) for j, d in ranked]
+
+    def _record(self, snapshot: _Snapshot, i: int, miles: float) -> dict:
+        return {
+            "id": snapshot.ids[i],
+            "name": snapshot.names[i],
+            "description": snapshot.descriptions[i],
+            "latitude": snapshot.lats[i],
+            "longitude": snapshot.lons[i],
+            "wheelchair_boarding": snapshot.wheelchair[i],
+            "distance": round(miles, 2),
+            "routes": [snapshot.routes[r] for r in snapshot.stop_routes[i]],
+        }
+
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+
+def get_station_index(mbta_key: str = None) -> StationIndex:
+    """
+    Return the process-wide StationIndex, creating it on first use.
+
+    Route types can be configured with the STATION_INDEX_ROUTE_TYPES
+    environment variable, e.g. "0,1,2".
+
+    Args:
+        mbta_key: Optional authentication key for MBTA API
+
+    Returns:
+        StationIndex: The shared index instance
+    """
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            types = os.getenv("STATION_INDEX_ROUTE_TYPES")
+            route_types = tuple(int(t) for t in types.split(",")) if types else DEFAULT_ROUTE_TYPES
+            _shared_index = StationIndex(mbta_key, route_types)
+        return _shared_index
@@ -0,0 +1,227 @@
+"""
+Precomputed nearest-station raster over the MBTA service area
+
+Build the raster once from the live stop set:
+
+    python station_raster.py build mbta_raster.bin [--cell-miles 0.1] [--k 4]
+
+and point STATION_RASTER_PATH at it. The bounding box of the indexed stops
+(plus a margin) is cut into a grid; each cell stores its k nearest stops,
+ranked from the cell center, and the distance from the center to the nearest
+stop that did not make the list. A query reads one cell, measures exact
+distances to its k candidates, and accepts the best one only if no stop
+outside the list could be closer. Queries near a cell edge that fail that
+check, and queries outside the box, fall back to the station index.
+
+Like the GTFS store, the file is memory-mapped read-only, so worker
+processes share one copy of its pages.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from math import cos, radians
+
+from distance import haversine_miles
+from station_index import MILES_PER_DEGREE, StationIndex
+
+MAGIC = b"STNRAST1"
+
+# Cell slot with no stop (fewer than k stops in the whole set)
+EMPTY = 0xFFFF
+
+# Shaved off each cell's bound to absorb float32 rounding
+BOUND_MARGIN = 0.001
+
+
+def build_raster(station_index: StationIndex, output_path: str, cell_miles: float = 0.1,
+                 k: int = 4, pad_miles: float = 2.0) -> dict:
+    """
+    Rasterize a loaded StationIndex's stops into a raster file.
+
+    Args:
+        station_index: Loaded index holding the stops to rasterize
+        output_path: Path of the raster file to write
+        cell_miles: Approximate edge length of a cell in miles
+        k: Candidate stops stored per cell
+        pad_miles: Margin around the stops' bounding box
+
+    Returns:
+        dict: The header written (grid geometry and stop list)
+    """
+    stops = station_index.stops()
+    if not stops:
+        raise ValueError("Station index has no stops to rasterize")
+    if len(stops) >= EMPTY:
+        raise ValueError(f"Too many stops for a raster ({len(stops)})")
+    position = {s["id"]: i for i, s in enumerate(stops)}
+    lats = [s["latitude"] for s in stops]
+    lons = [s["longitude"] for s in stops]
+    x_scale = MILES_PER_DEGREE * cos(radians(sum(lats) / len(lats)))
+    dlat, dlon = cell_miles / MILES_PER_DEGREE, cell_miles / x_scale
+    lat_min = min(lats) - pad_miles / MILES_PER_DEGREE
+    lon_min = min(lons) - pad_miles / x_scale
+    rows = int((max(lats) + pad_miles / MILES_PER_DEGREE - lat_min) / dlat) + 1
+    cols = int((max(lons) + pad_miles / x_scale - lon_min) / dlon) + 1
+
+    cells = array("H", [EMPTY]) * (rows * cols * k)
+    bounds = array("f", [float("inf")]) * (rows * cols)
+    for row in range(rows):
+        center_lat = lat_min + (row + 0.5) * dlat
+        for col in range(cols):
+            center_lon = lon_min + (col + 0.5) * dlon
+            nearest = station_index.nearest(center_lat, center_lon, k=k + 1)
+            cell = row * cols + col
+            for slot, stop in enumerate(nearest[:k]):
+                cells[cell * k + slot] = position[stop["id"]]
+            if len(nearest) > k:
+                # Exact distance: the index rounds its distances to 0.01 miles
+                outside = nearest[k]
+                bound = haversine_miles(center_lat, center_lon, outside["latitude"], outside["longitude"])
+                bounds[cell] = max(0.0, bound - BOUND_MARGIN)
+
+    header = {
+        "lat_min": lat_min, "lon_min": lon_min, "dlat": dlat, "dlon": dlon,
+        "rows": rows, "cols": cols, "k": k,
+        "route_types": list(station_index.route_types),
+        "stop_ids": [s["id"] for s in stops],
+        "built_at": time.time(),
+    }
+    _write_raster(output_path, header, cells, bounds)
+    return header
+
+
+def _write_raster(path: str, header: dict, cells: array, bounds: array) -> None:
+    header = dict(header, cells_offset=0, bounds_offset=(len(cells) * cells.itemsize + 7) & ~7)
+    blob = json.dumps(header).encode("utf-8")
+    data_start = (len(MAGIC) + 4 + len(blob) + 7) & ~7
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as handle:
+        handle.write(MAGIC + struct.pack("<I", len(blob)) + blob)
+        handle.seek(data_start)
+        cells.tofile(handle)
+        handle.seek(data_start + header["bounds_offset"])
+        bounds.tofile(handle)
+    os.replace(tmp_path, path)
+
+
+class StationRaster:
+    """
+    Read-only view over a raster file built by build_raster.
+    """
+
+    def __init__(self, path: str):
+        """
+        Map a raster file.
+
+        Args:
+            path: Path of a file written by build_raster
+        """
+        self.path = path
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a station raster file")
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        header = json.loads(self._mmap[len(MAGIC) + 4:len(MAGIC) + 4 + header_len])
+        data_start = (len(MAGIC) + 4 + header_len + 7) & ~7
+        self.lat_min, self.lon_min = header["lat_min"], header["lon_min"]
+        self.dlat, self.dlon = header["dlat"], header["dlon"]
+        self.rows, self.cols, self.k = header["rows"], header["cols"], header["k"]
+        self.route_types = tuple(header["route_types"])
+        self.stop_ids = header["stop_ids"]
+        self.built_at = header["built_at"]
+        cell_count = self.rows * self.cols
+        view = memoryview(self._mmap)
+        start = data_start + header["cells_offset"]
+        self.cells = view[start:start + cell_count * self.k * 2].cast("H")
+        start = data_start + header["bounds_offset"]
+        self.bounds = view[start:start + cell_count * 4].cast("f")
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, latitude: float, longitude: float) -> tuple:
+        """
+        Read the cell containing a point.
+
+        Args:
+            latitude: The latitude coordinate
+            longitude: The longitude coordinate
+
+        Returns:
+            tuple: (candidate stop positions in stop_ids, nearest first from the
+                    cell center; slack in miles), or None outside the raster.
+                    Any stop not among the candidates is at least slack miles
+                    from the point.
+        """
+        row = int((latitude - self.lat_min) / self.dlat)
+        col = int((longitude - self.lon_min) / self.dlon)
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+        cell = row * self.cols + col
+        candidates = [p for p in self.cells[cell * self.k:(cell + 1) * self.k] if p != EMPTY]
+        center_lat = self.lat_min + (row + 0.5) * self.dlat
+        center_lon = self.lon_min + (col + 0.5) * self.dlon
+        return candidates, self.bounds[cell] - haversine_miles(latitude, longitude, center_lat, center_lon)
+
+    def record(self, hit: bool) -> None:
+        """Count a query answered from the raster (hit) or passed to the index."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.fallbacks += 1
+
+    def stats(self) -> dict:
+        """
+        Report raster size and usage.
+
+        Returns:
+            dict: cells, stops, bytes (file size), hits and fallbacks
+        """
+        return {"cells": self.rows * self.cols, "stops": len(self.stop_ids), "bytes": len(self._mmap),
+                "hits": self.hits, "fallbacks": self.fallbacks}
+
+
+def get_station_raster():
+    """
+    Open the raster file named by STATION_RASTER_PATH.
+
+    Returns:
+        StationRaster: The raster, or None if none is configured or it cannot be read
+    """
+    path = os.getenv("STATION_RASTER_PATH")
+    if not path:
+        return None
+    try:
+        return StationRaster(path)
+    except Exception as e:
+        print(f"Error opening station raster {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the nearest-station raster from the MBTA API")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("output", help="raster file to write")
+    parser.add_argument("--cell-miles", type=float, default=0.1)
+    parser.add_argument("--k", type=int, default=4, help="candidate stops per cell")
+    parser.add_argument("--pad-miles", type=float, default=2.0, help="margin around the stops' bounding box")
+    args = parser.parse_args()
+
+    index = StationIndex(os.getenv("MBTA_API_KEY"))
+    index.load()
+    started = time.perf_counter()
+    header = build_raster(index, args.output, args.cell_miles, args.k, args.pad_miles)
+    print(f"Wrote {args.output}: {header['rows']}x{header['cols']} cells, {len(header['stop_ids'])} stops, "
+          f"{os.path.getsize(args.output) / 1024:.0f} KiB in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
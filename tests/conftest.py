@@ -0,0 +1,63 @@
+"""
+Shared fixtures: every test talks to the offline Mapbox/MBTA stub
+
+The modules read their upstream URLs from the environment at import time,
+so the stub is started and the environment set before any test module
+imports them.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from stub_server import StubServer  # noqa: E402
+
+STUB = StubServer().start()
+
+os.environ.update({
+    "MBTA_API_URL": STUB.url,
+    "MAPBOX_API_URL": STUB.url,
+    "MAPBOX_ACCESS_TOKEN": "stub",
+    "MAPBOX_TOKEN": "stub",
+    "MBTA_API_KEY": "stub",
+    "MBTA_STREAM_PREDICTIONS": "0",
+    "SESSION_DB_PATH": os.path.join(tempfile.mkdtemp(prefix="mbta-tests-"), "sessions.db"),
+})
+for name in ("GTFS_STORE_PATH", "GEOCODE_CACHE_PATH", "SHARED_CACHE_PATH", "STATION_RASTER_PATH",
+             "SESSION_STORE", "WEB_CONCURRENCY"):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture
+def stub():
+    """The shared stub, with latency and error injection reset after the test."""
+    yield STUB
+    STUB.latency_ms = STUB.jitter_ms = 0
+    STUB.error_rate = 0.0
+
+
+@pytest.fixture(scope="session")
+def loaded_index():
+    """A StationIndex loaded from the stub's fixture stops (light rail and subway)."""
+    from station_index import StationIndex
+
+    index = StationIndex("stub")
+    index.load()
+    return index
+
+
+@pytest.fixture(scope="session")
+def gtfs_store(tmp_path_factory):
+    """A GTFSStore built from the stub's fixture timetable."""
+    from gtfs_store import GTFSStore, build_store
+    from stub_server import Fixtures
+
+    tmp = tmp_path_factory.mktemp("gtfs")
+    Fixtures().write_gtfs(str(tmp / "gtfs.zip"))
+    build_store(str(tmp / "gtfs.zip"), str(tmp / "gtfs.bin"))
+    return GTFSStore(str(tmp / "gtfs.bin"))
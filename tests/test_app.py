@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_import_starts_no_threads():
+    # A fresh interpreter, so threads started by other tests do not count
+    code = ("import threading, app; "
+            "print(sorted(t.name for t in threading.enumerate() if t is not threading.main_thread()))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_start_background_tasks_loads_the_index():
+    code = ("import time, app; app.start_background_tasks(); app.start_background_tasks(); "
+            "deadline = time.monotonic() + 15\n"
+            "while not app.station_index.loaded and time.monotonic() < deadline: time.sleep(0.05)\n"
+            "print(app.station_index.loaded)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ),
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "True"
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+import pytest
+
+from arrival_stream import ArrivalBroadcaster
+
+
+class FakeArrivals:
+    """Arrivals per station that a test can change, counting fetches."""
+
+    def __init__(self):
+        self.arrivals = {}
+        self.fetches = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, station_id):
+        with self._lock:
+            self.fetches[station_id] = self.fetches.get(station_id, 0) + 1
+            return [dict(a) for a in self.arrivals.get(station_id, [])]
+
+
+def arrival(prediction_id, minute):
+    return {"id": prediction_id, "arrival_time": f"2026-10-14T08:{minute:02d}:00-04:00"}
+
+
+def pollers(station_id):
+    return [t for t in threading.enumerate() if t.name == f"arrivals-{station_id}" and t.is_alive()]
+
+
+def parse(message):
+    event, data = message.strip().split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+
+@pytest.fixture
+def fetch():
+    return FakeArrivals()
+
+
+def test_one_poller_per_station_serves_every_subscriber(fetch):
+    fetch.arrivals["place-a"] = [arrival("p1", 30)]
+    broadcaster = ArrivalBroadcaster(fetch, interval=0.05)
+    subscriptions = [broadcaster.subscribe("place-a") for _ in range(3)]
+    for subscription in subscriptions:
+        assert parse(subscription.get(timeout=2)) == ("snapshot", {"arrivals": [arrival("p1", 30)]})
+    assert len(pollers("place-a")) == 1
+    assert broadcaster.stats() == {"subscribers": 3, "stations": 1}
+    time.sleep(0.3)
+    # Roughly one fetch per interval, however many clients are watching
+    assert fetch.fetches["place-a"] <= 0.3 / 0.05 + 2
+    for subscription in subscriptions:
+        broadcaster.unsubscribe(subscription)
+
+
+def test_snapshot_then_deltas(fetch):
+    fetch.arrivals["place-a"] = [arrival("p1", 30), arrival("p2", 35)]
+    broadcaster = ArrivalBroadcaster(fetch, interval=0.05)
+    subscription = broadcaster.subscribe("place-a")
+    event, data = parse(subscription.get(timeout=2))
+    assert event == "snapshot" and [a["id"] for a in data["arrivals"]] == ["p1", "p2"]
+
+    fetch.arrivals["place-a"] = [arrival("p1", 31), arrival("p3", 40)]
+    event, data = parse(subscription.get(timeout=2))
+    assert event == "delta"
+    assert data == {"upserted": [arrival("p1", 31), arrival("p3", 40)], "removed": ["p2"]}
+
+    # A late subscriber starts from the current state
+    late = broadcaster.subscribe("place-a")
+    assert parse(late.get(timeout=2)) == ("snapshot", {"arrivals": [arrival("p1", 31), arrival("p3", 40)]})
+    broadcaster.unsubscribe(subscription)
+    broadcaster.unsubscribe(late)
+
+
+def test_subscriber_cap(fetch, monkeypatch):
+    import app
+
+    broadcaster = ArrivalBroadcaster(fetch, interval=0.05, max_subscribers=1)
+    first = broadcaster.subscribe("place-a")
+    assert first is not None
+    assert broadcaster.subscribe("place-b") is None
+    monkeypatch.setattr(app, "arrival_broadcaster", broadcaster)
+    response = app.app.test_client().get("/api/arrivals/place-b/stream")
+    assert response.status_code == 503
+    broadcaster.unsubscribe(first)
+    second = broadcaster.subscribe("place-b")
+    assert second is not None
+    broadcaster.unsubscribe(second)
+
+
+def test_poller_stops_after_the_last_unsubscribe(fetch):
+    broadcaster = ArrivalBroadcaster(fetch, interval=0.05)
+    subscriptions = [broadcaster.subscribe("place-c") for _ in range(2)]
+    broadcaster.unsubscribe(subscriptions[0])
+    assert len(pollers("place-c")) == 1
+    broadcaster.unsubscribe(subscriptions[1])
+    give_up_at = time.monotonic() + 2
+    while pollers("place-c"):
+        assert time.monotonic() < give_up_at, "poller still running"
+        time.sleep(0.01)
+    assert broadcaster.stats() == {"subscribers": 0, "stations": 0}
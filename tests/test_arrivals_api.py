@@ -0,0 +1,43 @@
+import pytest
+
+STATION = "place-downtown"
+
+
+@pytest.fixture
+def client():
+    import app
+
+    app.arrivals_cache.delete(STATION)
+    yield app.app.test_client()
+    app.arrivals_cache.delete(STATION)
+
+
+def test_unchanged_arrivals_are_answered_with_304(client):
+    first = client.get(f"/api/arrivals/{STATION}")
+    assert first.status_code == 200
+    assert first.get_json()["arrivals"]
+    etag = first.headers["ETag"]
+
+    again = client.get(f"/api/arrivals/{STATION}", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+
+def test_etag_changes_with_the_arrivals(client, monkeypatch):
+    import app
+
+    first = client.get(f"/api/arrivals/{STATION}")
+    etag = first.headers["ETag"]
+    real = app.get_station_arrivals
+
+    def one_train_fewer(station_id):
+        result = real(station_id)
+        return dict(result, arrivals=result["arrivals"][1:])
+
+    monkeypatch.setattr(app, "get_station_arrivals", one_train_fewer)
+    app.arrivals_cache.delete(STATION)  # As if its TTL had run out
+    changed = client.get(f"/api/arrivals/{STATION}", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.get_json()["arrivals"]) == len(first.get_json()["arrivals"]) - 1
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from arrival_stream import ArrivalBroadcaster
+from cache import SharedCache, TieredCache
+
+
+@pytest.fixture(scope="module")
+def asgi():
+    import asgi
+
+    return asgi
+
+
+class Client:
+    """Drives an ASGI app in-process, as a server would, without sockets."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def scope(self, method, path, query=b"", headers=()):
+        return {"type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+                "path": path, "root_path": "", "query_string": query,
+                "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+                "server": ("testserver", 80), "client": ("127.0.0.1", 50000)}
+
+    async def request(self, method, path, body=b"", headers=()):
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(self.scope(method, path, headers=headers), receive, send)
+        return sent[0]["status"], b"".join(m.get("body", b"") for m in sent[1:])
+
+    async def stream(self, path, on_message):
+        """Open an SSE stream, calling on_message(text) until it returns True, then disconnect."""
+        disconnect = asyncio.Event()
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        start = {}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message.get("body") and on_message(message["body"].decode("utf-8")):
+                disconnect.set()
+
+        await self.app(self.scope("GET", path), receive, send)
+        return start["status"]
+
+
+def events(messages):
+    return [m.split("\n", 1)[0][len("event: "):] for m in messages if m.startswith("event: ")]
+
+
+def test_search_and_arrivals_are_served(asgi):
+    client = Client(asgi.app)
+    status, body = asyncio.run(client.request(
+        "POST", "/find_station", b"location=Fenway+Park",
+        headers=[("content-type", "application/x-www-form-urlencoded")]))
+    assert status == 200 and b"Kenmore" in body
+
+    status, body = asyncio.run(client.request("GET", "/api/arrivals/place-parkstre"))
+    assert status == 200
+    assert json.loads(body)["arrivals"]
+
+
+def test_stream_messages_are_pushed_to_the_event_loop(asgi, monkeypatch):
+    arrivals = [{"id": "prediction-1", "arrival_time": "2026-10-14T08:30:00-04:00"}]
+    broadcaster = ArrivalBroadcaster(lambda station_id: [dict(a) for a in arrivals], interval=0.05)
+    monkeypatch.setattr(asgi, "arrival_broadcaster", broadcaster)
+    # Long enough that a poll of the queue would show up, were the stream polling it
+    monkeypatch.setattr(asgi, "STREAM_HEARTBEAT", 60)
+    received = []
+
+    def on_message(text):
+        received.append(text)
+        if events(received) == ["snapshot"]:
+            arrivals.append({"id": "prediction-2", "arrival_time": "2026-10-14T08:40:00-04:00"})
+        return "delta" in events(received)
+
+    client = Client(asgi.app)
+    assert asyncio.run(asyncio.wait_for(client.stream("/api/arrivals/place-test/stream", on_message), 5)) == 200
+    assert received[0].startswith("retry: ")
+    assert events(received) == ["snapshot", "delta"]
+    assert broadcaster.stats() == {"subscribers": 0, "stations": 0}
+
+
+def test_idle_streams_hold_no_threads(asgi, monkeypatch):
+    broadcaster = ArrivalBroadcaster(lambda station_id: [], interval=0.05)
+    monkeypatch.setattr(asgi, "arrival_broadcaster", broadcaster)
+    client = Client(asgi.app)
+
+    async def main():
+        opened = []
+
+        def on_message(text):
+            opened.append(text)
+            return False
+
+        streams = [asyncio.ensure_future(client.stream("/api/arrivals/place-idle/stream", on_message))
+                   for _ in range(50)]
+        while len(opened) < 100:  # retry and snapshot messages for every stream
+            await asyncio.sleep(0.01)
+        assert broadcaster.stats() == {"subscribers": 50, "stations": 1}
+        count = threading.active_count()
+        for stream in streams:
+            stream.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+        return count
+
+    before = threading.active_count()
+    during = asyncio.run(asyncio.wait_for(main(), 5))
+    assert during <= before + 1  # The station's poller, however many clients are watching
+    assert broadcaster.stats()["subscribers"] == 0
+
+
+def test_stream_is_refused_at_capacity(asgi, monkeypatch):
+    monkeypatch.setattr(asgi, "arrival_broadcaster", ArrivalBroadcaster(lambda station_id: [], max_subscribers=0))
+    status, body = asyncio.run(Client(asgi.app).request("GET", "/api/arrivals/place-parkstre/stream"))
+    assert status == 503 and b"Too many open streams" in body
+
+
+def test_shared_cache_reads_run_off_the_event_loop(asgi, tmp_path, monkeypatch):
+    import app
+    from async_finder import AsyncStationFinder
+
+    shared = SharedCache(str(tmp_path / "geocode.db"), name="geocode")
+    shared.set("somerville city hall", {"latitude": 42.387, "longitude": -71.099,
+                                        "address": "Somerville City Hall, Somerville, MA"})
+    get_entry = shared.get_entry
+
+    def slow_get_entry(key):
+        time.sleep(0.3)
+        return get_entry(key)
+
+    monkeypatch.setattr(shared, "get_entry", slow_get_entry)
+    finder = app.MBTAStationFinder("stub", "stub", geocode_cache=TieredCache(shared, ttl=60))
+    async_finder = AsyncStationFinder(finder, asgi.async_finder.client)
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        location = await async_finder.geocode_location("Somerville City Hall")
+        task.cancel()
+        return location, ticks
+
+    location, ticks = asyncio.run(main())
+    assert location["address"] == "Somerville City Hall, Somerville, MA"
+    assert ticks >= 10  # The loop kept running while SQLite was read
+    # Now held in this process: answered inline
+    assert asyncio.run(async_finder.geocode_location("Somerville City Hall")) == location
+    assert finder.geocode_cache.stats()["shared_hits"] == 1
@@ -0,0 +1,69 @@
+from autocomplete import AutocompleteIndex
+
+
+def place(name, rank, aliases=(), kind="landmark"):
+    return {"name": name, "aliases": list(aliases), "latitude": 42.35, "longitude": -71.06,
+            "address": f"{name}, Boston, MA", "kind": kind, "rank": rank}
+
+
+def stop(stop_id, name, routes=("Red",)):
+    return {"id": stop_id, "name": name, "latitude": 42.35, "longitude": -71.06, "routes": list(routes)}
+
+
+PLACES = [
+    place("Park Plaza", 5),
+    place("Fenway Park", 10, aliases=["fenway"]),
+    place("Boston Common", 10, aliases=["the common"]),
+    place("Parker House", 7),
+    place("Copley Square", 8),
+]
+
+
+def names(suggestions):
+    return [s["name"] for s in suggestions]
+
+
+def test_name_starts_rank_above_later_words_then_by_rank_and_length():
+    index = AutocompleteIndex(PLACES)
+    index.update_stations([stop("place-parkstre", "Park Street")])
+    # Matches at the start of a name first (station rank 8 beats Parker House 7 and Park Plaza 5),
+    # then Fenway Park, whose second word matches
+    assert names(index.suggest("par")) == ["Park Street", "Parker House", "Park Plaza", "Fenway Park"]
+    assert names(index.suggest("park s")) == ["Park Street"]
+    assert index.suggest("park st")[0]["id"] == "place-parkstre"
+    assert names(index.suggest("common")) == ["Boston Common"]
+
+
+def test_limit():
+    index = AutocompleteIndex(PLACES)
+    assert len(index.suggest("p", limit=2)) == 2
+    assert index.suggest("p", limit=0) == []
+    assert index.suggest("   ") == []
+
+
+def test_case_and_punctuation_are_ignored():
+    index = AutocompleteIndex(PLACES)
+    assert names(index.suggest("FENWAY")) == ["Fenway Park"]
+    assert names(index.suggest("Copley Sq.")) == ["Copley Square"]
+    assert names(index.suggest("boston-common")) == names(index.suggest("boston common"))
+    assert names(index.suggest("Parker's")) == []
+    assert names(index.suggest("parke")) == ["Parker House"]
+
+
+def test_update_stations_replaces_only_station_entries():
+    index = AutocompleteIndex(PLACES)
+    place_entries = {e: entry for e, entry in index._state[1].items() if e.startswith("place:")}
+    assert index.update_stations([stop("place-a", "Alewife"), stop("place-b", "Braintree")]) == (2, 0)
+    assert names(index.suggest("alew")) == ["Alewife"]
+
+    # Braintree is renamed, Alewife unchanged, Davis added
+    assert index.update_stations([stop("place-a", "Alewife"), stop("place-b", "Braintree Station"),
+                                  stop("place-c", "Davis")]) == (2, 1)
+    assert names(index.suggest("brain")) == ["Braintree Station"]
+    assert index.update_stations([stop("place-c", "Davis")]) == (0, 2)
+    assert index.suggest("alew") == [] and index.suggest("brain") == []
+    assert len(index) == len(PLACES) + 1
+
+    entries = index._state[1]
+    assert all(entries[e] is entry for e, entry in place_entries.items())
+    assert names(index.suggest("fenway")) == ["Fenway Park"]
@@ -0,0 +1,53 @@
+import json
+import threading
+import time
+
+from batch_search import BatchSearcher, iter_ndjson_queries
+
+
+class Finder:
+    """Geocodes every query to Park Street without going upstream."""
+
+    def geocode_location(self, query):
+        return {"latitude": 42.3564, "longitude": -71.0624, "address": f"{query}, Boston"}
+
+
+def test_iter_ndjson_queries_coerces_scalars_and_flags_the_rest():
+    lines = [b'"Fenway Park"', b"", b'{"query": 2115}', b'{"query": null}',
+             b'{"query": ["a"]}', b"[1, 2]", b"Boston Common", b'{"other": 1}', b"true"]
+    assert list(iter_ndjson_queries(lines)) == [
+        (0, "Fenway Park"), (1, "2115"), (2, None), (3, None),
+        (4, None), (5, "Boston Common"), (6, None), (7, None)]
+
+
+def test_results_stream_while_the_input_stalls(loaded_index):
+    more_input = threading.Event()
+
+    def queries():
+        yield 0, "Park Street"
+        more_input.wait(5)
+        yield 1, "Boston Common"
+
+    results = BatchSearcher(Finder(), loaded_index, chunk_size=64, flush_interval=0.05).run(queries())
+    started = time.monotonic()
+    first = next(results)
+    assert time.monotonic() - started < 1
+    assert first["index"] == 0 and first["status"] == "ok"
+    assert first["station"]["id"] == "place-parkstre"
+    more_input.set()
+    assert [r["index"] for r in results] == [1]
+
+
+def test_invalid_items_do_not_cut_the_response_short():
+    import app
+
+    client = app.app.test_client()
+    body = "\n".join(['{"query": null}', '{"query": {"nested": true}}', '""'])
+    response = client.post("/api/batch_search", data=body, content_type="application/x-ndjson")
+    rows = sorted((json.loads(line) for line in response.data.decode().splitlines()), key=lambda r: r["index"])
+    assert [(r["index"], r["status"]) for r in rows] == [(0, "invalid"), (1, "invalid"), (2, "not_found")]
+
+    response = client.post("/api/batch_search", json={"queries": [None, 123, ""]})
+    rows = sorted((json.loads(line) for line in response.data.decode().splitlines()), key=lambda r: r["index"])
+    assert [(r["index"], r["status"]) for r in rows][::2] == [(0, "invalid"), (2, "not_found")]
+    assert rows[1]["query"] == "123"
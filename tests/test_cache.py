@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from cache import SharedCache, TieredCache, TTLCache, normalize_query
+
+
+def test_get_or_load_is_single_flight():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+    started = threading.Barrier(8)
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+
+    results = []
+
+    def worker():
+        started.wait()
+        results.append(cache.get_or_load("key", loader))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 8
+
+
+def test_get_or_load_shares_errors_and_does_not_cache_them():
+    cache = TTLCache(maxsize=10, ttl=60)
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("key", lambda: (_ for _ in ()).throw(RuntimeError("upstream down")))
+    assert cache.get_or_load("key", lambda: "loaded") == "loaded"
+
+
+def test_none_is_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+    assert cache.get_or_load("key", lambda: None) is None
+    assert cache.get("key") is None
+    assert cache.get_or_load("key", lambda: 1) == 1
+
+
+def test_entries_expire_and_evict():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("short", 1, ttl=0.05)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_tiered_cache_shares_entries(tmp_path):
+    path = str(tmp_path / "shared.db")
+    first = TieredCache(maxsize=8, ttl=60, name="t", shared=SharedCache(path, name="t"))
+    second = TieredCache(maxsize=8, ttl=60, name="t", shared=SharedCache(path, name="t"))
+    first.set("key", {"stations": ["place-kenmore"]})
+    assert second.get("key") == {"stations": ["place-kenmore"]}
+    assert second.shared_hits == 1
+
+
+def test_slow_shared_reads_do_not_block_local_hits(tmp_path, monkeypatch):
+    shared = SharedCache(str(tmp_path / "shared.db"), name="t")
+    cache = TieredCache(shared, maxsize=8, ttl=60)
+    cache.set("warm", 1)
+    shared.set("cold", 2)
+    reading, release = threading.Event(), threading.Event()
+    get_entry = shared.get_entry
+
+    def slow_get_entry(key):
+        reading.set()
+        release.wait(5)
+        return get_entry(key)
+
+    monkeypatch.setattr(shared, "get_entry", slow_get_entry)
+    results = {}
+    cold = threading.Thread(target=lambda: results.setdefault("cold", cache.get("cold")))
+    cold.start()
+    assert reading.wait(5)
+    started = time.monotonic()
+    assert cache.get("warm") == 1  # Served from L1 while the L2 read is still in progress
+    assert time.monotonic() - started < 0.5
+    release.set()
+    cold.join(5)
+    assert results["cold"] == 2
+    assert cache.shared_hits == 1 and cache.get("cold") == 2
+
+
+def test_normalize_query():
+    assert normalize_query("  Fenway   PARK ") == normalize_query("fenway park")
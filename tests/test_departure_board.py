@@ -0,0 +1,29 @@
+import app
+from stub_server import Fixtures
+
+STATIONS = ["place-downtown", "place-parkstre", "place-alewife", "place-state", "place-haymarke"]
+
+
+def test_platform_predictions_are_attributed_to_their_station(stub):
+    fixtures = Fixtures()
+    finder = app.MBTAStationFinder("stub", "stub")
+    before = stub.requests
+    board = finder.get_arrival_predictions_bulk(STATIONS, limit=3, chunk_size=2)
+    assert stub.requests - before == 3  # 5 stations, 2 per request
+    assert list(board) == STATIONS
+    for station_id, arrivals in board.items():
+        assert len(arrivals) == 3
+        lines = {fixtures.routes[r]["long_name"] for r in fixtures.routes_at[station_id]}
+        assert {a["route_name"] for a in arrivals} <= lines
+        assert not any(a["arrival_time"].endswith("(scheduled)") for a in arrivals)
+
+
+def test_stations_are_chunked_per_request(stub):
+    stations = list(Fixtures().stations)
+    assert len(stations) > app.BOARD_STOPS_PER_REQUEST
+    finder = app.MBTAStationFinder("stub", "stub")
+    before = stub.requests
+    board = finder.get_arrival_predictions_bulk(stations)
+    chunks = -(-len(stations) // app.BOARD_STOPS_PER_REQUEST)
+    assert stub.requests - before == chunks
+    assert all(board[s] for s in stations)
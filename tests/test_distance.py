@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from distance import distances_from, haversine_miles, nearest_k, within
+
+
+@pytest.fixture
+def points():
+    rng = random.Random(11)
+    return [rng.uniform(42.2, 42.45) for _ in range(200)], [rng.uniform(-71.25, -70.95) for _ in range(200)]
+
+
+def test_haversine_miles():
+    # Park Street to Kenmore is about 1.8 miles
+    assert haversine_miles(42.3564, -71.0624, 42.3489, -71.0952) == pytest.approx(1.77, abs=0.02)
+    assert haversine_miles(42.35, -71.06, 42.35, -71.06) == 0
+
+
+def test_distances_from_matches_scalar(points):
+    lats, lons = points
+    expected = [haversine_miles(42.35, -71.06, lat, lon) for lat, lon in zip(lats, lons)]
+    assert [float(d) for d in distances_from(42.35, -71.06, lats, lons)] == pytest.approx(expected)
+
+
+def test_nearest_k_ranks_the_closest_points(points):
+    lats, lons = points
+    distances = [haversine_miles(42.35, -71.06, lat, lon) for lat, lon in zip(lats, lons)]
+    expected = sorted(range(len(distances)), key=distances.__getitem__)[:5]
+    ranked = nearest_k(42.35, -71.06, lats, lons, 5)
+    assert [i for i, _ in ranked] == expected
+    assert [d for _, d in ranked] == pytest.approx([distances[i] for i in expected])
+    assert nearest_k(42.35, -71.06, lats, lons, 0) == []
+    assert len(nearest_k(42.35, -71.06, lats[:3], lons[:3], 5)) == 3
+
+
+def test_within_keeps_points_inside_the_radius(points):
+    lats, lons = points
+    distances = [haversine_miles(42.35, -71.06, lat, lon) for lat, lon in zip(lats, lons)]
+    hits = within(42.35, -71.06, lats, lons, 2.0)
+    assert sorted(i for i, _ in hits) == [i for i, d in enumerate(distances) if d <= 2.0]
+    assert [d for _, d in hits] == sorted(d for _, d in hits)
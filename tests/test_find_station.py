@@ -0,0 +1,67 @@
+import json
+import time
+
+import pytest
+
+
+@pytest.fixture
+def client():
+    import app
+
+    return app.app.test_client()
+
+
+def test_search_renders_the_nearest_station(client):
+    response = client.post("/find_station", data={"location": "Fenway Park"})
+    assert response.status_code == 200
+    assert b"Kenmore" in response.data
+
+
+def test_geocoding_stays_within_the_search_deadline(client, stub, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, "SEARCH_DEADLINE", 0.5)
+    stub.latency_ms = 1500
+    started = time.monotonic()
+    response = client.post("/find_station", data={"location": f"{time.time_ns()} Unheard Of Lane"})
+    elapsed = time.monotonic() - started
+    assert response.status_code == 200
+    assert b"Could not find that location" in response.data
+    assert elapsed < 1.2
+
+
+def test_station_fallback_stays_within_the_search_deadline(stub, monkeypatch):
+    import app
+
+    finder = app.MBTAStationFinder("stub", "stub")  # No station index: ranks stops on the MBTA side
+    stub.latency_ms = 1500
+    started = time.monotonic()
+    assert finder.find_nearest_station(42.35, -71.06, include_routes=False,
+                                       deadline=time.monotonic() + 0.5) is None
+    assert time.monotonic() - started < 1.2
+
+
+def test_sessions_start_on_the_first_search(client):
+    import app
+
+    before = app.history_manager.store.stats()["sessions"]
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "Set-Cookie" not in response.headers
+    assert app.history_manager.store.stats()["sessions"] == before
+
+    client.post("/find_station", data={"location": "Fenway Park"})
+    assert app.history_manager.store.stats()["sessions"] == before + 1
+
+
+def test_addresses_are_quoted_safely_in_page_scripts(client, monkeypatch):
+    import app
+
+    address = 'Ryan\'s "Corner" & Co </script>, Boston, MA'
+    monkeypatch.setattr(app.station_finder, "geocode_location",
+                        lambda query, deadline=None: {"address": address, "latitude": 42.3467, "longitude": -71.0972})
+    page = client.post("/find_station", data={"location": "Ryan's Corner"}).get_data(as_text=True)
+    line = next(line for line in page.splitlines() if "new URLSearchParams({ from:" in line)
+    literal = line.split("from: ", 1)[1].rsplit(", to:", 1)[0]
+    assert json.loads(literal) == address
+    assert "</script>" not in line
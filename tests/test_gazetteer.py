@@ -0,0 +1,62 @@
+import pytest
+
+from gazetteer import DEFAULT_PATH, Gazetteer
+
+STATIONS = [
+    {"id": "place-north", "name": "North Station", "latitude": 42.3656, "longitude": -71.0613},
+    {"id": "place-sstat", "name": "South Station", "latitude": 42.3523, "longitude": -71.0552},
+    {"id": "place-armnl", "name": "Arlington", "latitude": 42.3519, "longitude": -71.0705},
+    {"id": "place-pktrm", "name": "Park Street", "latitude": 42.3564, "longitude": -71.0624},
+    {"id": "place-cntsq", "name": "Central", "latitude": 42.3655, "longitude": -71.1036},
+]
+
+
+@pytest.fixture
+def gazetteer():
+    gazetteer = Gazetteer.from_csv(DEFAULT_PATH)
+    gazetteer.set_stations(STATIONS)
+    return gazetteer
+
+
+@pytest.mark.parametrize("query", ["north", "south", "nort", "harv", "Arlington Street Church"])
+def test_generic_single_words_go_to_mapbox(gazetteer, query):
+    assert gazetteer.lookup(query) is None
+
+
+def test_single_word_station_names_need_the_word_station(gazetteer):
+    # The town, from the bundled places, rather than the Back Bay stop
+    assert gazetteer.lookup("Arlington")["address"] == "Arlington, MA"
+    assert gazetteer.lookup("arlington station")["latitude"] == 42.3519
+
+
+@pytest.mark.parametrize("query, address", [
+    ("North Station", "North Station, Massachusetts"),
+    ("north station, boston, ma", "North Station, Massachusetts"),
+    ("South Station", "South Station, Massachusetts"),
+    ("park street", "Park Street Station, Massachusetts"),
+    ("park st station", "Park Street Station, Massachusetts"),
+])
+def test_stations_match_by_full_name(gazetteer, query, address):
+    assert gazetteer.lookup(query)["address"] == address
+
+
+def test_bundled_places_and_multi_word_prefixes(gazetteer):
+    assert gazetteer.lookup("Fenway Park")["address"].startswith("Fenway Park")
+    assert gazetteer.lookup("Boston Common, Boston, MA")["address"].startswith("Boston Common")
+    assert gazetteer.lookup("harvard sq")["address"].startswith("Harvard Square")
+    assert gazetteer.lookup("harvard squ")["address"].startswith("Harvard Square")
+    assert gazetteer.lookup("mit")["address"] == gazetteer.lookup("MIT")["address"]
+
+
+@pytest.mark.parametrize("query", ["Park Street, Cambridge, MA", "Fenway Park, Cambridge", "north station, somerville"])
+def test_places_outside_the_named_city_go_to_mapbox(gazetteer, query):
+    assert gazetteer.lookup(query) is None
+
+
+@pytest.mark.parametrize("query, address", [
+    ("Park Street, Boston, MA", "Park Street Station, Massachusetts"),
+    ("Harvard Square, Cambridge, MA", "Harvard Square, Cambridge, MA 02138"),
+    ("central station, cambridge, ma", "Central Station, Massachusetts"),
+])
+def test_places_in_the_named_city_resolve_locally(gazetteer, query, address):
+    assert gazetteer.lookup(query)["address"] == address
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import gtfs_store
+from gtfs_store import AGENCY_TZ
+
+
+def brute_force(store, stop_id, after, limit, window=timedelta(hours=2)):
+    stop = store.stop_position(stop_id)
+    stops = set(store._child_stops(stop))
+    today = after.replace(hour=0, minute=0, second=0, microsecond=0)
+    found = []
+    for service_day in (today - timedelta(days=1), today):
+        services = store.active_services(service_day)
+        start = int((after - service_day).total_seconds())
+        end = start + int(window.total_seconds())
+        for i in range(len(store.st_departure)):
+            departure = store.st_departure[i]
+            if store.st_stop[i] in stops and start <= departure <= end \
+                    and store.trip_service[store.st_trip[i]] in services:
+                found.append((service_day + timedelta(seconds=departure), store.string(store.trip_id[store.st_trip[i]])))
+    return sorted(found)[:limit]
+
+
+@pytest.mark.parametrize("stop_id", ["place-parkstre", "place-alewife", "place-downtown-Orange"])
+@pytest.mark.parametrize("hour, minute", [(8, 30), (0, 45), (4, 50), (23, 59)])
+def test_scheduled_departures_match_a_full_scan(gtfs_store, stop_id, hour, minute):
+    after = datetime(2026, 10, 14, hour, minute, tzinfo=AGENCY_TZ)
+    for limit in (1, 5, 12):
+        found = gtfs_store.scheduled_departures(stop_id, after=after, limit=limit)
+        assert [(d["departure_time"], d["trip_id"]) for d in found] == brute_force(gtfs_store, stop_id, after, limit)
+
+
+def test_unknown_stop_has_no_departures(gtfs_store):
+    assert gtfs_store.scheduled_departures("place-nowhere") == []
+
+
+def test_a_bad_store_path_is_only_tried_once(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "not_a_store.bin"
+    path.write_bytes(b"x" * 64)
+    monkeypatch.setenv("GTFS_STORE_PATH", str(path))
+    monkeypatch.setattr(gtfs_store, "_store", None)
+    monkeypatch.setattr(gtfs_store, "_store_failed", None)
+    assert gtfs_store.get_gtfs_store() is None
+    assert gtfs_store.get_gtfs_store() is None
+    assert capsys.readouterr().out.count("Error opening GTFS store") == 1
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+import pytest
+
+from gtfs_store import AGENCY_TZ
+from journey_planner import JourneyPlanner
+from stub_server import Fixtures
+
+# A weekday morning inside the fixture calendar
+DEPART = datetime(2026, 10, 14, 8, 30, tzinfo=AGENCY_TZ)
+
+
+@pytest.fixture(scope="module")
+def fixtures():
+    return Fixtures()
+
+
+@pytest.fixture(scope="module")
+def planner(gtfs_store):
+    planner = JourneyPlanner(gtfs_store)
+    planner.build()
+    return planner
+
+
+def station(fixtures, station_id):
+    s = fixtures.stations[station_id]
+    return s["latitude"], s["longitude"]
+
+
+def transit_legs(journey):
+    return [leg for leg in journey["legs"] if leg["mode"] == "transit"]
+
+
+def test_one_seat_ride(fixtures, planner):
+    journeys = planner.plan(station(fixtures, "place-alewife"), station(fixtures, "place-jfkumass"), DEPART)
+    assert journeys
+    fastest = journeys[0]
+    assert fastest["transfers"] == 0
+    (ride,) = transit_legs(fastest)
+    assert ride["route"]["id"] == "Red"
+    assert ride["from"]["id"] == "place-alewife" and ride["to"]["id"] == "place-jfkumass"
+    assert ride["depart"] >= DEPART.isoformat(timespec="minutes")
+
+
+def test_rounds_trade_transfers_for_time(fixtures, planner):
+    # No single line joins Alewife and Wonderland: every journey needs transfers
+    journeys = planner.plan(station(fixtures, "place-alewife"), station(fixtures, "place-wonderla"), DEPART)
+    assert journeys
+    for journey in journeys:
+        legs = transit_legs(journey)
+        assert journey["transfers"] == len(legs) - 1 >= 1
+        assert legs[0]["route"]["id"] == "Red" and legs[-1]["route"]["id"] == "Blue"
+        for a, b in zip(legs, legs[1:]):
+            assert a["arrive"] <= b["depart"]
+    # Each later round only counts if it arrives earlier with more transfers
+    for faster, slower in zip(journeys, journeys[1:]):
+        assert faster["arrival"] <= slower["arrival"]
+        assert faster["transfers"] > slower["transfers"]
+
+
+def test_short_trips_walk(fixtures, planner):
+    journeys = planner.plan(station(fixtures, "place-parkstre"), station(fixtures, "place-boylston"), DEPART)
+    assert journeys[0]["legs"][0]["mode"] == "walk"
+
+
+def test_not_ready_until_built(planner):
+    assert JourneyPlanner(planner.store).plan((42.35, -71.06), (42.36, -71.05), DEPART) == []
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from prediction_stream import PredictionStore, PredictionStreamIngester, iter_events
+
+
+class Timetable:
+    """Stands in for a GTFSStore with one scheduled departure at every stop."""
+
+    def scheduled_departures(self, stop_id, limit=5):
+        return [{"route": {"id": "Red", "long_name": "Red Line", "color": "DA291C"},
+                 "departure_time": datetime(2026, 10, 14, 12, 50, tzinfo=timezone.utc)}]
+
+
+@pytest.fixture
+def replayed(stub):
+    store = PredictionStore()
+    PredictionStreamIngester(store, "stub", base_url=stub.url).consume()
+    return store
+
+
+def test_iter_events_skips_comments_and_joins_data_lines():
+    lines = [": keep-alive", "", "event: add", "data: {\"a\":", "data: 1}", "", "data: tail"]
+    assert list(iter_events(lines)) == [("add", "{\"a\":\n1}"), ("message", "tail")]
+
+
+def test_ingester_applies_the_replayed_feed(replayed):
+    store = replayed
+
+    # Reset, then an update to prediction-R1 and the removal of prediction-O1
+    downtown = store.arrivals("place-downtown")
+    assert [a["id"] for a in downtown] == ["prediction-R1", "prediction-R2"]
+    assert downtown[0]["arrival_time"] == "2026-10-14T08:35:30-04:00"
+    assert downtown[0]["status"] == "Delayed"
+    assert downtown[0]["headsign"] == "Ashmont"
+    assert downtown[0]["route"]["long_name"] == "Red Line"
+    assert store.arrivals("place-downtown-Orange") == []
+
+    # Added before its platform stop, then re-indexed under the parent station
+    state = store.arrivals("place-state")
+    assert [(a["id"], a["headsign"]) for a in state] == [("prediction-B1", "Wonderland")]
+    assert store.arrivals("place-state-Blue") == state
+
+    stats = store.stats()
+    assert stats["ready"] and stats["predictions"] == 3
+    assert stats["stops"] == 4  # Two platforms and their two parent stations
+
+
+def test_resources_no_prediction_refers_to_are_dropped(replayed):
+    # prediction-O1 was the only Orange Line prediction
+    assert ("route", "Orange") not in replayed._included
+    assert ("stop", "place-downtown-Orange") not in replayed._included
+    assert ("trip", "R1") in replayed._included and ("route", "Blue") in replayed._included
+    replayed.remove({"type": "prediction", "id": "prediction-B1"})
+    assert ("route", "Blue") not in replayed._included
+    assert ("stop", "place-state-Blue") not in replayed._included
+
+
+def test_finder_shows_the_timetable_for_stations_the_stream_has_not_reported(replayed):
+    import app
+
+    finder = app.MBTAStationFinder("stub", "stub", prediction_store=replayed, gtfs_store=Timetable())
+    assert [p["route_name"] for p in finder.get_arrival_predictions("place-downtown")] == ["Red Line"] * 2
+    assert not finder.get_arrival_predictions("place-downtown")[0]["arrival_time"].endswith("(scheduled)")
+    fallback = finder.get_arrival_predictions("place-alewife")
+    assert len(fallback) == 1 and fallback[0]["arrival_time"].endswith("(scheduled)")
+    board = finder.get_arrival_predictions_bulk(["place-state", "place-alewife"])
+    assert not board["place-state"][0]["arrival_time"].endswith("(scheduled)")
+    assert board["place-alewife"][0]["arrival_time"].endswith("(scheduled)")
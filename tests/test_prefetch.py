@@ -0,0 +1,103 @@
+import random
+
+import rate_limit
+from prefetch import FAVORITE_WEIGHT, SEARCH_WEIGHT, ArrivalPrefetcher
+
+
+class Loader:
+    """Records the refresh calls, standing in for the bulk predictions fetch."""
+
+    def __init__(self):
+        self.calls = []
+        self.priorities = []
+
+    def __call__(self, station_ids):
+        self.calls.append(list(station_ids))
+        self.priorities.append(rate_limit.current_priority())
+
+
+class Clock:
+    """Simulated time: each prefetch cycle advances it by the prefetcher's interval."""
+
+    def __init__(self, prefetcher):
+        self.prefetcher = prefetcher
+        self.seconds = 0.0
+
+    def tick(self):
+        self.seconds += self.prefetcher.interval
+        return self.prefetcher.run_once()
+
+    @property
+    def minutes(self):
+        return self.seconds / 60.0
+
+
+def test_least_frequently_used_station_is_evicted_at_capacity():
+    prefetcher = ArrivalPrefetcher(Loader(), max_stations=3)
+    prefetcher.track("place-a", FAVORITE_WEIGHT)
+    prefetcher.track("place-b", SEARCH_WEIGHT)
+    prefetcher.track("place-c", SEARCH_WEIGHT)
+    prefetcher.track("place-c", SEARCH_WEIGHT)
+    prefetcher.track("place-a")  # Already tracked: nothing is evicted
+    assert prefetcher.evictions == 0
+
+    prefetcher.track("place-d")
+    assert len(prefetcher) == 3 and prefetcher.evictions == 1
+    assert prefetcher.working_set() == ["place-a", "place-c", "place-d"]
+    prefetcher.track("")  # Ignored
+    assert len(prefetcher) == 3
+
+
+def test_counts_decay_every_cycle():
+    prefetcher = ArrivalPrefetcher(Loader(), max_stations=2, budget_per_minute=0, decay=0.5)
+    prefetcher.track("place-old", 4.0)
+    for _ in range(3):
+        prefetcher.run_once()
+    assert prefetcher.counts["place-old"] == 0.5
+    assert prefetcher.cycles == 3
+
+    # Recent interest now outweighs the faded count, and the faded station is evicted first
+    prefetcher.track("place-new", 1.0)
+    assert prefetcher.working_set() == ["place-new", "place-old"]
+    prefetcher.track("place-newer", 0.75)
+    assert prefetcher.working_set() == ["place-new", "place-newer"]
+
+
+def test_refreshes_most_popular_stations_in_chunks_at_background_priority():
+    loader = Loader()
+    prefetcher = ArrivalPrefetcher(loader, budget_per_minute=12, interval=10, chunk_size=2)
+    for i in range(10):
+        prefetcher.track(f"place-{i}", float(i))
+    assert prefetcher.run_once() == 4  # Two requests of credit, two stations each
+    assert loader.calls == [["place-9", "place-8", "place-7", "place-6"]]
+    assert loader.priorities == [rate_limit.BACKGROUND]
+    assert prefetcher.stats()["requests"] == 2 and prefetcher.stats()["refreshed"] == 4
+
+
+def test_requests_stay_within_the_budget():
+    rng = random.Random(7)
+    loader = Loader()
+    prefetcher = ArrivalPrefetcher(loader, budget_per_minute=3, interval=10, chunk_size=5)
+    clock = Clock(prefetcher)
+    for _ in range(360):
+        # The working set grows and shrinks, so some cycles cannot spend all their credit
+        for _ in range(rng.randrange(4)):
+            prefetcher.track(f"place-{rng.randrange(40)}")
+        if rng.random() < 0.05:
+            prefetcher.counts.clear()
+        clock.tick()
+        # Credit banked in quiet cycles is capped at one minute's budget
+        assert prefetcher.requests <= prefetcher.budget_per_minute * (clock.minutes + 1)
+    assert prefetcher.requests == sum(-(-len(call) // prefetcher.chunk_size) for call in loader.calls)
+    assert all(len(call) <= prefetcher.budget_per_minute * prefetcher.chunk_size for call in loader.calls)
+    assert prefetcher.requests > prefetcher.budget_per_minute * clock.minutes * 0.8
+
+
+def test_slow_budgets_accumulate_credit_across_cycles():
+    loader = Loader()
+    prefetcher = ArrivalPrefetcher(loader, budget_per_minute=2, interval=10, chunk_size=1)
+    prefetcher.track("place-a")
+    clock = Clock(prefetcher)
+    refreshed = [clock.tick() for _ in range(6)]
+    assert refreshed == [0, 0, 1, 0, 0, 1]  # One request every third 10-second cycle
+    assert prefetcher.requests == 2 == prefetcher.budget_per_minute * clock.minutes
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import rate_limit
+from rate_limit import BACKGROUND, BATCH, INTERACTIVE, TokenBucket
+
+
+def drain(bucket, level):
+    taken = 0
+    while bucket.acquire(level, 0.0):
+        taken += 1
+    return taken
+
+
+def test_lower_priorities_leave_their_reserve():
+    bucket = TokenBucket(10, reserves=(0.0, 0.2, 0.4))
+    bucket.rate = 1e-9  # No refill during the test
+    assert drain(bucket, BATCH) == 6
+    assert drain(bucket, BACKGROUND) == 2
+    assert drain(bucket, INTERACTIVE) == 2
+    assert bucket.stats()["deferred"] == {"interactive": 1, "background": 1, "batch": 1}
+
+
+def test_waiting_interactive_call_goes_first():
+    bucket = TokenBucket(10, reserves=(0.0, 0.0, 0.0))
+    bucket.rate = 1e-9
+    drain(bucket, INTERACTIVE)
+    results = {}
+
+    def wait(level):
+        results[level] = bucket.acquire(level, 2.0)
+
+    interactive = threading.Thread(target=wait, args=(INTERACTIVE,))
+    interactive.start()
+    time.sleep(0.1)
+    background = threading.Thread(target=wait, args=(BACKGROUND,))
+    background.start()
+    time.sleep(0.1)
+    bucket.refund()
+    interactive.join()
+    assert results[INTERACTIVE] is True
+    background.join()
+    assert results[BACKGROUND] is False
+
+
+def test_429_blocks_until_retry_after():
+    bucket = TokenBucket(100)
+    bucket.update({"retry-after": "0.3"}, 429)
+    assert not bucket.acquire(INTERACTIVE, 0.0)
+    started = time.monotonic()
+    assert bucket.acquire(INTERACTIVE, 2.0)
+    assert time.monotonic() - started >= 0.2
+    assert bucket.stats()["throttled"] == 1
+
+
+def test_remaining_header_lowers_tokens():
+    bucket = TokenBucket(100)
+    bucket.update({"x-ratelimit-limit": "100", "x-ratelimit-remaining": "3"})
+    assert bucket.stats()["tokens"] <= 3.1
+
+
+def test_priority_context_is_per_thread():
+    seen = {}
+    with rate_limit.priority(BATCH):
+        thread = threading.Thread(target=lambda: seen.update(other=rate_limit.current_priority()))
+        thread.start()
+        thread.join()
+        seen["inside"] = rate_limit.current_priority()
+    assert seen == {"inside": BATCH, "other": INTERACTIVE}
+    assert rate_limit.current_priority() == INTERACTIVE
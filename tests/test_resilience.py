@@ -0,0 +1,87 @@
+import time
+
+import pytest
+import requests
+
+from cache import TTLCache
+from http_client import CircuitBreaker, CircuitOpenError, HTTPClient
+from stub_server import StubServer
+
+
+@pytest.fixture
+def upstream():
+    """A stub of its own, so injected failures do not leak into other tests."""
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+def wait_for(condition, timeout=2.0):
+    give_up_at = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < give_up_at, "condition not reached in time"
+        time.sleep(0.01)
+
+
+def test_breaker_opens_after_consecutive_failures(upstream):
+    upstream.error_rate = 1.0
+    client = HTTPClient(retries=0, failure_threshold=3, reset_timeout=60)
+    url = f"{upstream.url}/routes"
+    for _ in range(3):
+        assert client.get(url).status_code == 503
+    assert client.breaker(url).state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get(url)
+    assert upstream.requests == 3
+    assert client.breaker(url).stats()["rejected"] == 1
+
+
+def test_breaker_half_opens_and_closes_after_a_good_probe(upstream):
+    upstream.error_rate = 1.0
+    client = HTTPClient(retries=0, failure_threshold=2, reset_timeout=0.2)
+    url = f"{upstream.url}/routes"
+    for _ in range(2):
+        client.get(url)
+    time.sleep(0.25)
+    # A failed probe opens the circuit again straight away
+    assert client.get(url).status_code == 503
+    assert client.breaker(url).state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get(url)
+
+    upstream.error_rate = 0.0
+    time.sleep(0.25)
+    assert client.get(url).status_code == 200
+    assert client.breaker(url).stats() == {"state": CircuitBreaker.CLOSED, "failures": 0, "rejected": 1}
+
+
+def test_retries_stop_at_the_deadline(upstream):
+    upstream.latency_ms = 1000
+    client = HTTPClient(retries=2, backoff=0.01)
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        client.get(f"{upstream.url}/routes", deadline=0.3)
+    assert time.monotonic() - started < 0.8
+
+
+def test_stale_value_is_served_while_upstream_fails(upstream):
+    client = HTTPClient(retries=0, failure_threshold=100)
+    cache = TTLCache(maxsize=8, ttl=60, name="resilience")
+    url = f"{upstream.url}/routes"
+
+    def loader():
+        return client.get_json(url)["data"]
+
+    routes, stale = cache.get_or_revalidate("routes", loader, ttl=0.05, max_stale=60)
+    assert routes and not stale
+
+    upstream.error_rate = 1.0
+    time.sleep(0.1)
+    assert cache.get_or_revalidate("routes", loader, ttl=0.05, max_stale=60) == (routes, True)
+    wait_for(lambda: upstream.requests >= 2 and "routes" not in cache._inflight)
+    # The refresh failed, so the old value is still served
+    assert cache.get_revalidated("routes") == (routes, True)
+
+    upstream.error_rate = 0.0
+    assert cache.get_or_revalidate("routes", loader, ttl=60, max_stale=60) == (routes, True)
+    wait_for(lambda: cache.get_revalidated("routes")[1] is False)
@@ -0,0 +1,94 @@
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore
+
+
+def entry(address, **extra):
+    return dict({"address": address, "query": address.lower()}, **extra)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+
+def test_recent_searches_dedupe_by_address_and_keep_the_newest(store):
+    store.add_recent_search("s1", entry("Fenway Park"), limit=3)
+    store.add_recent_search("s1", entry("Boston Common"), limit=3)
+    store.add_recent_search("s1", entry("Fenway Park", distance=0.2), limit=3)
+    assert [e["address"] for e in store.recent_searches("s1")] == ["Fenway Park", "Boston Common"]
+    assert store.recent_searches("s1")[0]["distance"] == 0.2
+    for address in ("A", "B", "C"):
+        store.add_recent_search("s1", entry(address), limit=3)
+    assert [e["address"] for e in store.recent_searches("s1")] == ["C", "B", "A"]
+    store.clear_recent_searches("s1")
+    assert store.recent_searches("s1") == []
+
+
+def test_favorites(store):
+    assert store.add_favorite("s1", entry("Fenway Park"))
+    assert not store.add_favorite("s1", entry("Fenway Park"))
+    assert store.add_favorite("s1", entry("TD Garden"))
+    assert [f["address"] for f in store.favorites("s1")] == ["Fenway Park", "TD Garden"]
+    assert store.remove_favorite("s1", "Fenway Park")
+    assert not store.remove_favorite("s1", "Fenway Park")
+    assert store.favorites("s2") == []
+
+
+def test_sqlite_store_survives_reopening(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).add_favorite("s1", entry("Fenway Park"))
+    reopened = SQLiteSessionStore(path)
+    assert [f["address"] for f in reopened.favorites("s1")] == ["Fenway Park"]
+    assert reopened.stats() == {"backend": "sqlite", "sessions": 1}
+
+
+def test_sqlite_store_expires_idle_sessions(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SQLiteSessionStore(path).add_favorite("s1", entry("Fenway Park"))
+    assert SQLiteSessionStore(path, ttl=-1).favorites("s1") == []
+
+
+def test_reads_do_not_create_sessions(store):
+    assert store.recent_searches("s1") == []
+    assert store.favorites("s1") == []
+    assert not store.remove_favorite("s1", "Fenway Park")
+    store.clear_recent_searches("s1")
+    assert store.stats()["sessions"] == 0
+    store.add_favorite("s1", entry("Fenway Park"))
+    assert store.stats()["sessions"] == 1
+
+
+def test_sqlite_is_the_default_store(tmp_path, monkeypatch):
+    import session_store
+
+    monkeypatch.setattr(session_store, "_session_store", None)
+    monkeypatch.setenv("SESSION_DB_PATH", str(tmp_path / "sessions.db"))
+    assert session_store.get_session_store().stats()["backend"] == "sqlite"
+
+
+def test_memory_store_warns_with_several_workers(monkeypatch, capsys):
+    import session_store
+
+    monkeypatch.setattr(session_store, "_session_store", None)
+    monkeypatch.setenv("SESSION_STORE", "memory")
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert session_store.get_session_store().stats()["backend"] == "memory"
+    assert "not shared between worker processes" in capsys.readouterr().out
+
+
+def test_sqlite_store_expires_idle_sessions_while_open(tmp_path):
+    import time
+
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=0.2, expire_every=2)
+    store.add_favorite("idle", entry("Fenway Park"))
+    store.add_recent_search("idle", entry("TD Garden"), limit=3)
+    time.sleep(0.3)
+    store.add_favorite("active", entry("Boston Common"))
+    assert store.stats()["sessions"] == 2  # Not swept yet
+    store.add_favorite("active", entry("Fenway Park"))
+    assert store.stats()["sessions"] == 1
+    assert store.favorites("idle") == [] and store.recent_searches("idle") == []
+    assert [f["address"] for f in store.favorites("active")] == ["Boston Common", "Fenway Park"]
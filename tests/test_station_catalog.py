@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+import app
+from station_catalog import StationCatalog
+
+
+def wait_until_loaded(catalog, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not catalog.loaded and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert catalog.loaded
+
+
+@pytest.fixture(scope="module")
+def catalog(loaded_index):
+    catalog = StationCatalog("stub")
+    catalog.on_station_index_load(loaded_index)
+    wait_until_loaded(catalog)
+    return catalog
+
+
+@pytest.fixture
+def client(monkeypatch, catalog):
+    monkeypatch.setattr(app, "station_catalog", catalog)
+    return app.app.test_client()
+
+
+def test_rebuild_runs_off_the_listener_thread(loaded_index, monkeypatch):
+    catalog = StationCatalog("stub")
+    started, release = threading.Event(), threading.Event()
+    builds = []
+
+    def slow_build(stops, routes):
+        started.set()
+        release.wait(5)
+        builds.append(threading.current_thread().name)
+
+    monkeypatch.setattr(catalog, "build", slow_build)
+    catalog.on_station_index_load(loaded_index)
+    assert started.wait(5)
+    catalog.on_station_index_load(loaded_index)  # Both coalesced into one more build
+    catalog.on_station_index_load(loaded_index)
+    assert builds == []
+    release.set()
+    deadline = time.monotonic() + 5
+    while catalog._builder is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert builds == ["station-catalog-build"] * 2
+
+
+def test_lookup_by_id_name_alias_and_close_spelling(client):
+    by_id = client.get("/api/station_info/place-parkstre")
+    assert by_id.status_code == 200
+    body = by_id.get_json()
+    assert body["name"] == "Park Street"
+    assert body["lines"] and body["platforms"]
+    assert client.get("/api/station_info/park street").get_json()["id"] == "place-parkstre"
+    assert client.get("/api/station_info/Mass Ave").get_json()["id"] == "place-massachu"
+    assert client.get("/api/station_info/West End").get_json()["id"] == "place-sciencep"
+    assert client.get("/api/station_info/Park Stret").get_json()["id"] == "place-parkstre"
+
+
+def test_revalidation_with_etag(client):
+    first = client.get("/api/station_info/place-parkstre")
+    again = client.get("/api/station_info/place-parkstre", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_unknown_station_is_404(client):
+    response = client.get("/api/station_info/Atlantis")
+    assert response.status_code == 404
+    assert "Atlantis" in response.get_json()["error"]
+
+
+def test_503_while_loading(monkeypatch):
+    monkeypatch.setattr(app, "station_catalog", StationCatalog("stub"))
+    response = app.app.test_client().get("/api/station_info/place-parkstre")
+    assert response.status_code == 503
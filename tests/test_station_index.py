@@ -0,0 +1,55 @@
+import random
+
+from distance import haversine_miles
+
+
+def brute_force(index, latitude, longitude, route_types=None):
+    wanted = None if route_types is None else set(route_types)
+    stops = [s for s in index.stops()
+             if wanted is None or wanted & {index.routes()[r]["type"] for r in s["routes"]}]
+    return sorted(stops, key=lambda s: haversine_miles(latitude, longitude, s["latitude"], s["longitude"]))
+
+
+def test_nearest_matches_brute_force(loaded_index):
+    rng = random.Random(7)
+    for _ in range(300):
+        latitude, longitude = rng.uniform(42.2, 42.45), rng.uniform(-71.25, -70.95)
+        found = loaded_index.nearest(latitude, longitude, k=3)
+        expected = brute_force(loaded_index, latitude, longitude)[:3]
+        assert [s["distance"] for s in found] == [
+            round(haversine_miles(latitude, longitude, s["latitude"], s["longitude"]), 2) for s in expected]
+        assert found[0]["id"] == expected[0]["id"]
+
+
+def test_nearest_filters_route_types(loaded_index):
+    # Alewife is subway only; the nearest light rail stop is further away
+    alewife = next(s for s in loaded_index.stops() if s["id"] == "place-alewife")
+    subway = loaded_index.nearest(alewife["latitude"], alewife["longitude"], k=1, route_types=(1,))
+    light_rail = loaded_index.nearest(alewife["latitude"], alewife["longitude"], k=1, route_types=(0,))
+    assert subway[0]["id"] == "place-alewife"
+    assert any(r["type"] == 0 for r in light_rail[0]["routes"])
+    assert light_rail[0]["distance"] > subway[0]["distance"]
+
+
+def test_within_returns_every_stop_in_radius(loaded_index):
+    latitude, longitude = 42.3564, -71.0624  # Park Street
+    found = loaded_index.within(latitude, longitude, 0.5)
+    expected = [s["id"] for s in brute_force(loaded_index, latitude, longitude)
+                if haversine_miles(latitude, longitude, s["latitude"], s["longitude"]) <= 0.5]
+    assert [s["id"] for s in found] == expected
+    assert all(s["distance"] <= 0.5 for s in found)
+
+
+def test_nearest_many_matches_nearest(loaded_index):
+    points = [(42.35, -71.06), (42.39, -71.12), (42.30, -71.11)]
+    many = loaded_index.nearest_many(points)
+    assert [s["id"] for s in many] == [loaded_index.nearest(*p, k=1)[0]["id"] for p in points]
+
+
+def test_unloaded_index_returns_nothing():
+    from station_index import StationIndex
+
+    index = StationIndex()
+    assert not index.loaded
+    assert index.nearest(42.35, -71.06) == []
+    assert index.nearest_many([(42.35, -71.06)]) == [None]
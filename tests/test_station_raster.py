@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from distance import haversine_miles
+from station_raster import StationRaster, build_raster
+
+
+@pytest.fixture(scope="module")
+def raster(loaded_index, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("raster") / "raster.bin")
+    build_raster(loaded_index, path, cell_miles=0.2, k=3)
+    return StationRaster(path)
+
+
+def test_slack_bounds_every_stop_outside_the_cell_list(loaded_index, raster):
+    stops = {s["id"]: s for s in loaded_index.stops()}
+    rng = random.Random(3)
+    for _ in range(500):
+        latitude, longitude = rng.uniform(42.25, 42.42), rng.uniform(-71.2, -71.0)
+        hit = raster.lookup(latitude, longitude)
+        if hit is None:
+            continue
+        candidates, slack = hit
+        listed = {raster.stop_ids[p] for p in candidates}
+        for stop_id, stop in stops.items():
+            if stop_id not in listed:
+                assert haversine_miles(latitude, longitude, stop["latitude"], stop["longitude"]) >= slack
+
+
+def test_raster_answers_agree_with_the_index(loaded_index, raster):
+    rng = random.Random(5)
+    points = [(rng.uniform(42.25, 42.42), rng.uniform(-71.2, -71.0)) for _ in range(500)]
+    try:
+        loaded_index.attach_raster(None)
+        expected = [loaded_index.nearest(*p, k=1)[0]["id"] for p in points]
+        loaded_index.attach_raster(raster)
+        found = [loaded_index.nearest(*p, k=1)[0]["id"] for p in points]
+    finally:
+        loaded_index.attach_raster(None)
+    assert found == expected
+    assert raster.hits > raster.fallbacks
+
+
+def test_points_outside_the_raster_fall_back(raster):
+    assert raster.lookup(40.0, -75.0) is None
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_a_raster.bin"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        StationRaster(str(path))